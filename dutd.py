@@ -90,6 +90,7 @@ class ControllerClient(threading.Thread):
         self._run_reports_event = threading.Event()
 
         self._cmd_queue = deque()
+        self._git_trees = dict()
         super().__init__(target=self.serve_forever)
 
     def log(self, criticality, message):
@@ -425,10 +426,31 @@ class ControllerClient(threading.Thread):
         except Exception as e:
             self.log(Criticality.EE, traceback.format_exc())
 
+    # Returns a signature of the files of a directory that changes when any of
+    # them gets modified, or None if the directory contains sub-directories
+    def __directory_signature(self, dirname):
+        signature = []
+        for entry in os.scandir(dirname):
+            if entry.name.startswith("."):
+                continue
+            if entry.is_dir():
+                return None
+            st = entry.stat()
+            signature.append((entry.name, st.st_size, st.st_mtime_ns))
+        return tuple(sorted(signature))
+
     # Create git objects for all files and directories in the given directory.
     # Returns None if the directory is empty (as git cannot represent empty directories),
     # the oid of the created tree otherwise
     def __directory_to_git_tree(self, repo, dirname):
+        # The folders of the per-commit layout rarely change once the commit
+        # got tested, re-use their tree when none of their files changed
+        signature = self.__directory_signature(dirname)
+        if signature is not None:
+            cached = self._git_trees.get(dirname, None)
+            if cached is not None and cached[0] == signature and cached[1] in repo:
+                return cached[1]
+
         tb = repo.TreeBuilder()
         ret = False
 
@@ -437,8 +459,7 @@ class ControllerClient(threading.Thread):
                 if os.path.isdir(fpath):
                     subtree = self.__directory_to_git_tree(repo, fpath)
                     if subtree is not None:
-                        tb.insert(os.path.basename(fpath),
-                                  self.__directory_to_git_tree(repo, fpath),
+                        tb.insert(os.path.basename(fpath), subtree,
                                   pygit2.GIT_FILEMODE_TREE)
                         ret = True
                 else:
@@ -451,7 +472,10 @@ class ControllerClient(threading.Thread):
                 print("Warning: Cannot open the file '{}'".format(fpath))
                 continue
         if ret:
-            return tb.write()
+            oid = tb.write()
+            if signature is not None:
+                self._git_trees[dirname] = (signature, oid)
+            return oid
         else:
             return None
 
@@ -806,7 +830,9 @@ class ControllerClient(threading.Thread):
                     p.start()
                     p.join()
                 else:
-                    self.sbench_run(self._current_sbench.report_name)
+                    # Reports do not share any state, re-use the one parsed
+                    # by the previous enhancement to only read the new runs
+                    self._current_sbench.schedule_enhancements()
 
                 self.__commit_report__(self._current_sbench, "Scheduled enchancements")
 
@@ -854,7 +880,7 @@ class ControllerClient(threading.Thread):
 
 class Configuration:
     controllerd_reconnection_period = 5
-    report_parsing_in_separate_process = True
+    report_parsing_in_separate_process = False
 
     @classmethod
     def parse_error(cls, msg):
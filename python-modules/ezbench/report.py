@@ -26,25 +26,31 @@ OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 """
 
 from email.utils import parsedate_tz, mktime_tz
-from collections import namedtuple, OrderedDict
+from collections import namedtuple, OrderedDict, deque
 from datetime import datetime, timedelta
 from dateutil import relativedelta
 from array import array
-from scipy import stats
+from scipy import stats, special
 from enum import Enum
 import numpy as np
 import statistics
 import subprocess
+import functools
+import hashlib
 import threading
+import multiprocessing
 import traceback
+import warnings
 import atexit
 import pprint
+import pickle
+import shutil
 import fcntl
-import mmap
 import time
 import json
 import glob
 import copy
+import io
 import math
 import ast
 import csv
@@ -63,8 +69,10 @@ from timing import *
 from ezbench import imgcmp
 
 class Test:
+    __slots__ = ['full_name', 'unit']
+
     def __init__(self, full_name, unit="undefined"):
-        self.full_name = full_name
+        self.full_name = sys.intern(full_name)
         self.unit = unit
 
     def __eq__(x, y):
@@ -133,31 +141,69 @@ class ListStats:
         self._cache_mean_simple = None
 
     def __samples_needed__(self, sigma, margin, confidence=0.95):
-        # TODO: Find the function in scipy to get these values
-        if confidence <= 0.9:
-            z = 1.645
-        elif confidence <= 0.95:
-            z = 1.960
-        else:
-            z = 2.576
-        return ((z * sigma) / margin)**2
+        return samples_needed(sigma, margin, confidence)
 
     def __compute_stats__(self):
         if self._cache_mean is None or self._cache_std is None:
-            if len(self.data) > 1:
-                self._cache_mean, var, self._cache_std = stats.bayes_mvs(self.data,
-                                                                         alpha=0.95)
-                if np.math.isnan(self._cache_mean[0]):
-                    self._cache_mean = (self.data[0], (self.data[0], self.data[0]))
+            n = len(self.data)
+            if n > 1:
+                xbar = self.data.mean()
+                C = self.data.var()
+                if C > 0 and 2 < n <= 1000:
+                    t, poch, g_low, g_high = mvs_quantiles(n, 0.95)
+                    h = t * math.sqrt(C / (n - 1))
+                    self._cache_mean = (xbar, (xbar - h, xbar + h))
+                    scale = math.sqrt(n * C / 2)
+                    self._cache_std = (scale * poch, (scale / math.sqrt(g_low),
+                                                      scale / math.sqrt(g_high)))
+                elif C > 0 and n > 1000:
+                    z = normal_quantile(0.95)
+                    h = z * math.sqrt(C / n)
+                    self._cache_mean = (xbar, (xbar - h, xbar + h))
+                    std = math.sqrt(C)
+                    h = z * math.sqrt(C / (2 * n))
+                    self._cache_std = (std, (std - h, std + h))
+                else:
+                    # Constant samples have no interval, and there is no
+                    # interval on the mean of 2 samples either
+                    self._cache_mean = (xbar, (xbar, xbar))
                     self._cache_std = (0, (0, 0))
             else:
-                if len(self.data) == 0:
+                if n == 0:
                     value = 0
                 else:
                     value = self.data[0]
                 self._cache_mean = (value, (value, value))
                 self._cache_std = (float("inf"), (float("inf"), float("inf")))
 
+    @classmethod
+    def compute_stats_batch(cls, liststats, alpha=0.95):
+        """
+        Compute the statistics of many sample sets at once, instead of calling
+        bayes_mvs() on every one of them, and store them in their cache.
+
+        Args:
+            liststats: A list of ListStats
+            alpha: The probability that the confidence intervals contain the
+                   actual mean and standard deviation
+        """
+        todo = [l for l in liststats if l._cache_mean is None or l._cache_std is None]
+        if len(todo) == 0:
+            return
+
+        lengths = np.array([len(l.data) for l in todo], dtype=np.int64)
+        offsets = np.zeros(len(todo) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        if offsets[-1] > 0:
+            data = np.concatenate([np.asarray(l.data, dtype=np.float64) for l in todo])
+        else:
+            data = np.zeros(0)
+
+        batch = bayes_mvs_batch(data, offsets, alpha)
+        for i, (mean, mean_low, mean_high, std, std_low, std_high) in enumerate(zip(*batch)):
+            todo[i]._cache_mean = (mean, (mean_low, mean_high))
+            todo[i]._cache_std = (std, (std_low, std_high))
+
     def margin(self):
         """ Computes the margin of error for the sample set """
 
@@ -175,7 +221,7 @@ class ListStats:
 
         Args:
             wanted_margin: A float that represents how much variance you accept. For example, 0.025 would mean the accepted variance is 2.5%
-            confidence: The wanted confidence level
+            confidence: The wanted confidence level, between 0 and 1
 
         Returns:
             the current margin of error
@@ -185,17 +231,24 @@ class ListStats:
         if len(self.data) < 2 or self.data.var() == 0:
             return 0, 2
 
-        self.__compute_stats__()
-        margin = self.margin()
+        n = len(self.data)
+        mean = self.mean()
+        sigma = self.data.std(ddof=1)
+        if n > 1000:
+            h = normal_quantile(confidence) * sigma / math.sqrt(n)
+        else:
+            h = student_t_quantile(confidence, n) * sigma / math.sqrt(n)
+        # The margin is relative to the mean, which a mean of 0 never reaches
+        if mean != 0:
+            margin = h / abs(mean)
+        else:
+            margin = math.inf
         wanted_samples = 2
 
-        if wanted_margin is not None:
+        if wanted_margin is not None and mean != 0:
             # TODO: Get sigma from the test instead!
-            sigma = (self._cache_std[1][1] - self._cache_std[1][0]) / 2
-            target_margin = self._cache_mean[0] * wanted_margin
-            wanted_samples = np.math.ceil(self.__samples_needed__(sigma,
-                                                               target_margin,
-                                                               confidence))
+            target_margin = abs(mean) * wanted_margin
+            wanted_samples = self.__samples_needed__(sigma, target_margin, confidence)
 
         return margin, wanted_samples
 
@@ -245,6 +298,387 @@ class ListStats:
     def __len__(self):
         return len(self.data)
 
+@functools.lru_cache(maxsize=None)
+def normal_quantile(confidence):
+    """
+    Returns the z value of the two-sided confidence interval of a gaussian
+    distribution, e.g. 1.96 for 0.95.
+    """
+    return float(stats.norm.ppf((1 + confidence) / 2))
+
+@functools.lru_cache(maxsize=None)
+def student_t_quantile(confidence, n):
+    """
+    Returns the t value of the two-sided confidence interval on the mean of n
+    samples, using Student's t distribution with n - 1 degrees of freedom.
+    """
+    return float(stats.t.ppf((1 + confidence) / 2, n - 1))
+
+def samples_needed(sigma, margin, confidence=0.95):
+    """
+    Returns the smallest number of samples for which the confidence interval
+    of the mean is narrower than the margin.
+
+    Args:
+        sigma: The standard deviation of the samples
+        margin: The wanted half-width of the confidence interval, in the same
+                unit as sigma
+        confidence: The wanted confidence level, between 0 and 1
+    """
+    # Start from the gaussian estimate, which is a lower bound since Student's
+    # t quantile is always larger, and add samples until the interval of the
+    # mean gets narrow enough. The width decreases with n, so the first n
+    # found is the smallest one
+    n = max(2, math.ceil((normal_quantile(confidence) * sigma / margin)**2))
+    while student_t_quantile(confidence, n) * sigma / math.sqrt(n) > margin:
+        n += 1
+    return n
+
+def warmup_run_count(values):
+    """
+    Returns how many of the first runs of a test are outliers because the
+    test did not reach its steady state yet (cold caches, shader compilation,
+    ...). The warm-up ends at the first run that is not a warm-up outlier of
+    the runs following it, as decided by is_warmup_outlier(), and never
+    covers more than the first half of the runs.
+
+    Args:
+        values: The values of the runs, in their execution order
+    """
+    if len(values) < 4:
+        return 0
+
+    count = 0
+    while (count < len(values) // 2 and
+           is_warmup_outlier(values[count], values[count + 1:])):
+        count += 1
+    return count
+
+def is_warmup_outlier(value, others, rel_tol=0.02):
+    """
+    Returns True if the value of a run made with cold caches is more than 3
+    standard deviations away from the mean of the other runs, and more than
+    $rel_tol away from it relatively, for runs of very stable tests not to be
+    discarded for tiny differences. At least 3 other runs are needed to take
+    a decision.
+
+    Args:
+        value: The value of the run
+        others: The values of the other runs of the same result
+        rel_tol: The minimum relative difference with the mean of the others
+    """
+    if len(others) < 3:
+        return False
+
+    others = np.asarray(others, dtype=np.float64)
+    mean = others.mean()
+    return abs(value - mean) > max(3 * others.std(ddof=1), rel_tol * abs(mean))
+
+def find_changepoints(sample_sets, min_confidence=0.99, min_change=0.005):
+    """
+    Find the changes of the mean along a series of sample sets by binary
+    segmentation. The series is split at the boundary minimizing the sum of
+    the squared errors of both sides, which are then split again as long as
+    the difference between their means is significant. The errors of all the
+    boundaries of a segment are computed at once from cumulative sums, and
+    the significance is corrected for the number of boundaries tried.
+
+    Args:
+        sample_sets: The non-empty sample sets, in the order of the series
+        min_confidence: The confidence Welch's t-test needs to reach for the
+                        means of both sides of a change to be different
+        min_change: The smallest relative change of the mean to report
+
+    Returns:
+        The sorted list of the changes, as tuples (i, confidence) where i is
+        the index of the first sample set after the change
+    """
+    if len(sample_sets) < 2:
+        return []
+
+    # Center the data to limit the cancellation when computing the errors
+    data = [np.asarray(s, dtype=np.float64) for s in sample_sets]
+    counts = np.array([len(s) for s in data], dtype=np.float64)
+    samples = np.concatenate(data)
+    offset = samples.mean()
+    samples -= offset
+
+    N = np.concatenate(([0], np.cumsum(counts)))
+    starts = N[:-1].astype(np.int64)
+    S = np.concatenate(([0], np.cumsum(np.add.reduceat(samples, starts))))
+    Q = np.concatenate(([0], np.cumsum(np.add.reduceat(samples**2, starts))))
+
+    changes = []
+    segments = [(0, len(data))]
+    while len(segments) > 0:
+        a, b = segments.pop()
+        if b - a < 2:
+            continue
+
+        k = np.arange(a + 1, b)
+        n_l, s_l, q_l = N[k] - N[a], S[k] - S[a], Q[k] - Q[a]
+        n_r, s_r, q_r = N[b] - N[k], S[b] - S[k], Q[b] - Q[k]
+        sse_l = np.maximum(q_l - s_l**2 / n_l, 0)
+        sse_r = np.maximum(q_r - s_r**2 / n_r, 0)
+        best = int(np.argmin(sse_l + sse_r))
+        if n_l[best] + n_r[best] <= 2:
+            continue
+
+        mean_l, mean_r = s_l[best] / n_l[best], s_r[best] / n_r[best]
+        if sse_l[best] == 0 and sse_r[best] == 0:
+            confidence = 1.0 if mean_l != mean_r else 0.0
+        else:
+            std_l = math.sqrt(sse_l[best] / max(n_l[best] - 1, 1))
+            std_r = math.sqrt(sse_r[best] / max(n_r[best] - 1, 1))
+            equal_var = n_l[best] < 2 or n_r[best] < 2
+            t, p = stats.ttest_ind_from_stats(mean_l, std_l, n_l[best],
+                                              mean_r, std_r, n_r[best],
+                                              equal_var=equal_var)
+            # The boundary got selected among all the ones of the segment,
+            # correct the p-value for these multiple comparisons
+            confidence = 1 - min(1, p * (b - a - 1)) if np.isfinite(p) else 0.0
+
+        if mean_l + offset != 0:
+            change = abs(mean_r - mean_l) / abs(mean_l + offset)
+        else:
+            change = float("inf") if mean_l != mean_r else 0
+
+        if confidence >= min_confidence and change >= min_change:
+            i = a + 1 + best
+            changes.append((i, confidence))
+            segments.append((a, i))
+            segments.append((i, b))
+
+    return sorted(changes)
+
+def benjamini_hochberg(p_values, fdr):
+    """
+    Selects the significant tests among many using the Benjamini-Hochberg
+    procedure, which keeps the expected proportion of false discoveries among
+    the selected tests under the wanted rate.
+
+    Args:
+        p_values: The p-values of all the tests
+        fdr: The wanted false discovery rate, between 0 and 1
+
+    Returns:
+        A numpy array of booleans telling which tests are significant
+    """
+    p = np.asarray(p_values, dtype=np.float64)
+    significant = np.zeros(len(p), dtype=bool)
+    if len(p) == 0:
+        return significant
+
+    # Find the largest rank k for which p(k) <= k / m * fdr, all the tests up
+    # to this rank are significant
+    order = np.argsort(p, kind="mergesort")
+    ranks = np.arange(1, len(p) + 1)
+    below = np.nonzero(p[order] <= ranks * (fdr / len(p)))[0]
+    if len(below) > 0:
+        significant[order[:below[-1] + 1]] = True
+    return significant
+
+@functools.lru_cache(maxsize=None)
+def mvs_quantiles(n, alpha):
+    """
+    Returns the quantiles bayes_mvs() needs for sets of n samples: Student's t
+    for the interval on the mean, the Pochhammer symbol for the estimate of
+    the standard deviation and the inverse of the regularized gamma function
+    for the bounds of its interval.
+    """
+    a = (n - 1) / 2
+    return (student_t_quantile(alpha, n), float(special.poch(a, -0.5)),
+            float(special.gammainccinv(a, (1 - alpha) / 2)),
+            float(special.gammainccinv(a, (1 + alpha) / 2)))
+
+def bayes_mvs_batch(data, offsets, alpha=0.95):
+    """
+    Vectorized version of scipy.stats.bayes_mvs() for many sample sets, with
+    the same special cases as ListStats: sets with less than 2 samples have an
+    infinite standard deviation, and the sets for which bayes_mvs() cannot
+    compute the mean (constant sets or sets of 2 samples) get a null standard
+    deviation and an empty confidence interval.
+
+    Args:
+        data: A flat array containing the samples of all the sets
+        offsets: An array of n + 1 offsets, the samples of the set i being
+                 data[offsets[i]:offsets[i + 1]]
+        alpha: The probability that the confidence intervals contain the
+               actual mean and standard deviation
+
+    Returns:
+        A tuple of 6 lists of n floats: the mean, the lower and higher bounds
+        of its confidence interval, the standard deviation, the lower and
+        higher bounds of its confidence interval
+    """
+    offsets = np.asarray(offsets, dtype=np.int64)
+    n = np.diff(offsets)
+    data = np.asarray(data, dtype=np.float64)[offsets[0]:offsets[-1]]
+    filled = n > 0
+
+    # Mean and population variance of every set
+    sums = np.zeros(len(n))
+    sq_sums = np.zeros(len(n))
+    if len(data) > 0:
+        starts = offsets[:-1][filled] - offsets[0]
+        sums[filled] = np.add.reduceat(data, starts)
+        xbar = sums[filled] / n[filled]
+        sq_sums[filled] = np.add.reduceat((data - np.repeat(xbar, n[filled]))**2, starts)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        xbar = sums / n
+        C = sq_sums / n
+
+        mean = np.where(filled, xbar, 0.0)
+        mean_low, mean_high = mean.copy(), mean.copy()
+        std = np.full(len(n), float("inf"))
+        std_low, std_high = std.copy(), std.copy()
+
+        # Student's t and generalized gamma distributions for small sets,
+        # gaussian approximations for large ones
+        small = (n > 2) & (n <= 1000) & (C > 0)
+        large = (n > 1000) & (C > 0)
+
+        # The quantiles only depend on the number of samples, only look
+        # them up once for every size
+        sizes, size_idx = np.unique(n[small], return_inverse=True)
+        table = np.array([mvs_quantiles(int(size), alpha) for size in sizes]).reshape(-1, 4)
+        t, poch, g_low, g_high = (table[:, i][size_idx] for i in range(4))
+
+        h = t * np.sqrt(C[small] / (n[small] - 1))
+        mean[small] = xbar[small]
+        mean_low[small] = xbar[small] - h
+        mean_high[small] = xbar[small] + h
+
+        scale = np.sqrt(n[small] * C[small] / 2)
+        std[small] = scale * poch
+        std_low[small] = scale / np.sqrt(g_low)
+        std_high[small] = scale / np.sqrt(g_high)
+
+        z = normal_quantile(alpha)
+        h = z * np.sqrt(C[large] / n[large])
+        mean[large] = xbar[large]
+        mean_low[large] = xbar[large] - h
+        mean_high[large] = xbar[large] + h
+        h = z * np.sqrt(C[large] / (2 * n[large]))
+        std[large] = np.sqrt(C[large])
+        std_low[large] = std[large] - h
+        std_high[large] = std[large] + h
+
+        # bayes_mvs() cannot compute the mean of the other sets
+        undefined = (n > 1) & ~small & ~large
+        std[undefined] = 0
+        std_low[undefined] = 0
+        std_high[undefined] = 0
+
+    return (mean.tolist(), mean_low.tolist(), mean_high.tolist(),
+            std.tolist(), std_low.tolist(), std_high.tolist())
+
+_unified_line_re = re.compile(r'^(.*): (.*)\((.*)\)( .*)?$')
+
+def tokenize_unified_line(line):
+    """
+    Split a line of a unified run file, formated as 'key: type(value) unit'.
+
+    Args:
+        line: The line to split
+
+    Returns:
+        A tuple (key, type, value, unit), with unit set to None when absent,
+        or None if the line is invalid
+    """
+    if line.endswith('\n'):
+        line = line[:-1]
+
+    # Fast path, for the lines where the separators cannot be ambiguous
+    if line.count(': ') == 1 and line.count('(') == 1 and '\n' not in line:
+        key, sep, rest = line.partition(': ')
+        paren = rest.find('(')
+        close = rest.rfind(')')
+        if paren >= 0 and close > paren:
+            unit = rest[close + 1:]
+            if unit == '':
+                return key, rest[:paren], rest[paren + 1:close], None
+            elif unit[0] == ' ':
+                return key, rest[:paren], rest[paren + 1:close], unit.strip()
+
+    m = _unified_line_re.match(line)
+    if m is None:
+        return None
+    key, key_type, value, unit = m.groups()
+    if unit is not None:
+        unit = unit.strip()
+    return key, key_type, value, unit
+
+def decode_unified_floats(value):
+    """
+    Decode the value of a float subtest of a unified run file: either a float
+    or a list of floats.
+
+    Args:
+        value: The value, as found in the run file
+
+    Returns:
+        An array of floats, suitable for SampleStore.add()
+    """
+    try:
+        if value.startswith('[') and value.endswith(']'):
+            inner = value[1:-1]
+            if inner.strip() == '':
+                return array('d')
+            return array('d', [float(v) for v in inner.split(',')])
+        return array('d', [float(value)])
+    except ValueError:
+        # Any other python literal
+        value = ast.literal_eval(value)
+        if type(value) is float:
+            value = [value]
+        return value
+
+class SampleStore:
+    __slots__ = ['_data']
+
+    def __init__(self):
+        """
+        Report-wide storage for the float samples of the subtests. All the
+        samples are stored in one flat array, subtests only keep the offset
+        and the length of their samples instead of owning a numpy array.
+        """
+        self._data = array('d')
+
+    def add(self, samples):
+        """
+        Add samples to the store.
+
+        Args:
+            samples: A float or an iterable of floats
+
+        Returns:
+            The offset and the number of samples added, to be used with get()
+        """
+        offset = len(self._data)
+        if isinstance(samples, (int, float)):
+            self._data.append(samples)
+        elif isinstance(samples, np.ndarray):
+            self._data.frombytes(np.ascontiguousarray(samples, dtype=np.float64).tobytes())
+        else:
+            self._data.extend(samples)
+        return offset, len(self._data) - offset
+
+    def get(self, offset, count):
+        """ Returns a copy of the $count samples found at $offset """
+        return np.frombuffer(self._data[offset:offset + count], dtype=np.float64)
+
+    def value(self, index):
+        return self._data[index]
+
+    def mean(self, offset, count):
+        if count == 0:
+            return 0
+        return math.fsum(self._data[offset:offset + count]) / count
+
+    def __len__(self):
+        return len(self._data)
+
 class BenchSubTestType(Enum):
     SUBTEST_COMMIT_RESULT = 0
     SUBTEST_FLOAT = 1
@@ -266,6 +700,8 @@ class SubTestBase:
         self.data_raw_file = data_raw_file
 
 class SubTestCommitResult(SubTestBase):
+    __slots__ = []
+
     def __init__(self, commit):
         super().__init__("build_result", commit.compil_exit_code, None)
 
@@ -276,6 +712,8 @@ class SubTestCommitResult(SubTestBase):
         return None
 
 class SubTestString(SubTestBase):
+    __slots__ = []
+
     def __init__(self, name, value, data_raw_file = None):
         super().__init__(name, sys.intern(value), data_raw_file)
 
@@ -286,13 +724,32 @@ class SubTestString(SubTestBase):
         return None
 
 class SubTestFloat(SubTestBase):
-    __slots__ = ['_unit', 'samples']
-
-    def __init__(self, name, unit, samples, data_raw_file = None):
-        self.samples = ListStats(samples)
-        super().__init__(name, self.samples.mean(), data_raw_file)
+    __slots__ = ['_unit', '_store', '_offset', '_count']
+
+    def __init__(self, name, unit, samples, data_raw_file = None, store = None):
+        if store is None:
+            store = SampleStore()
+        self._store = store
+        self._offset, self._count = store.add(samples)
+        super().__init__(name, store.mean(self._offset, self._count), data_raw_file)
         self._unit = unit
 
+    @classmethod
+    def from_store(cls, name, unit, store, offset, count, data_raw_file = None):
+        """ Create a subtest from samples already found in $store """
+        subtest = cls.__new__(cls)
+        subtest._store = store
+        subtest._offset = offset
+        subtest._count = count
+        subtest._unit = unit
+        SubTestBase.__init__(subtest, name, store.mean(offset, count), data_raw_file)
+        return subtest
+
+    @property
+    def samples(self):
+        """ Returns the samples as a ListStats, generated from the store """
+        return ListStats(self._store.get(self._offset, self._count))
+
     def subtest_type(self):
         return BenchSubTestType.SUBTEST_FLOAT
 
@@ -307,14 +764,55 @@ class SubTestFloat(SubTestBase):
             return "{:.2f} {}".format(mean, unit)
 
     def __str__(self):
-        return self.to_string(self.samples.mean(), self.unit(), self.samples.margin(), len(self.samples))
+        samples = self.samples
+        return self.to_string(samples.mean(), self.unit(), samples.margin(), len(samples))
 
 class Metric(SubTestFloat):
-    __slots__ = ['timestamps']
+    __slots__ = ['_ts_offset', '_ts_count', '_levels']
 
-    def __init__(self, name, unit, samples, timestamps = None, data_raw_file = None):
-        super().__init__(name, unit, samples, data_raw_file)
-        self.timestamps = timestamps
+    # Longer traces get downsampled to buckets of 16^n samples, until there
+    # are less than this amount of buckets
+    trace_max_points = 128
+
+    def __init__(self, name, unit, samples, timestamps = None, data_raw_file = None,
+                 store = None):
+        super().__init__(name, unit, samples, data_raw_file, store)
+        if timestamps is not None:
+            self._ts_offset, self._ts_count = self._store.add(timestamps)
+        else:
+            self._ts_offset, self._ts_count = 0, -1
+        self._levels = self.__downsample__()
+
+    def __downsample__(self):
+        n = self._count
+        if self._ts_count != n or n <= self.trace_max_points:
+            return None
+
+        values = self._store.get(self._offset, n)
+        timestamps = self.timestamps
+
+        levels = []
+        bucket_size = 16
+        while True:
+            idx = np.arange(0, n, bucket_size)
+            sizes = np.diff(np.append(idx, n))
+            level = np.concatenate([timestamps[idx],
+                                    np.minimum.reduceat(values, idx),
+                                    np.maximum.reduceat(values, idx),
+                                    np.add.reduceat(values, idx) / sizes])
+            offset, count = self._store.add(level)
+            levels.append((bucket_size, offset, len(idx)))
+            if len(idx) <= self.trace_max_points:
+                break
+            bucket_size *= 16
+
+        return tuple(levels)
+
+    @property
+    def timestamps(self):
+        if self._ts_count < 0:
+            return None
+        return self._store.get(self._ts_offset, self._ts_count)
 
     def subtest_type(self):
         return BenchSubTestType.METRIC
@@ -324,11 +822,41 @@ class Metric(SubTestFloat):
         Returns the difference between the last and the first timestamp or 0 if
         there are no timestamps.
         """
-        if self.timestamps is not None and len(self.timestamps) > 0:
-            return self.timestamps[-1]
+        if self._ts_count > 0:
+            return self._store.value(self._ts_offset + self._ts_count - 1)
         else:
             return 0
 
+    def trace(self, max_points = None):
+        """
+        Returns the trace of the metric, using the most precise resolution
+        that fits in $max_points points. The downsampled resolutions are
+        computed when parsing the metric.
+
+        Args:
+            max_points: The maximum amount of points wanted. Defaults to
+                        Metric.trace_max_points. The coarsest resolution is
+                        returned if none fit.
+
+        Returns:
+            A tuple of numpy arrays (timestamps, min, max, mean) or None if the
+            metric has no timestamps
+        """
+        if max_points is None:
+            max_points = self.trace_max_points
+        if self._ts_count < 0:
+            return None
+
+        if self._levels is None or self._count <= max_points:
+            values = self._store.get(self._offset, self._count)
+            return self.timestamps, values, values, values
+
+        for bucket_size, offset, count in self._levels:
+            if count <= max_points:
+                break
+        level = self._store.get(offset, 4 * count).reshape(4, count)
+        return level[0], level[1], level[2], level[3]
+
 class SubTestImage(SubTestBase):
     __slots__ = ['img_file_name']
 
@@ -352,12 +880,11 @@ class SubTestImage(SubTestBase):
         return imgcmp.compare(self.img_file_name, imgFile, ['RMSE'], 'null:')
 
 class TestRun:
-    __slots__ = ['test_result', 'run_file', 'main_value_type', 'main_value', 'env_file', '_results']
+    __slots__ = ['test_result', 'run_file', 'main_value_type', 'main_value', 'env_file', '_results',
+                 '_float_keys', '_float_units', '_float_offsets', '_str_keys', '_str_values',
+                 '_lazy']
 
-    # Holds the different subresults for all the tests to allow detecting the
-    # missing results
-    subresults = dict()
-    subresults_type = dict()
+    unified_sidecar_version = 1
 
     def __init__(self, testResult, testType, runFile, metricsFiles, mainValueType = None, mainValue = None):
         self.test_result = testResult
@@ -373,78 +900,298 @@ class TestRun:
 
         self._results = dict()
 
+        # Float and string subtests are stored as columns, see __add_columns__
+        self._float_keys = None
+        self._float_units = None
+        self._float_offsets = None
+        self._str_keys = None
+        self._str_values = None
+
         # Add the environment file
         self.env_file = runFile + ".env_dump"
-        if not os.path.isfile(self.env_file):
+        if not os.path.isfile(os.path.join(testResult.commit.report.log_folder_path,
+                                           self.env_file)):
             self.env_file = None
 
+        self._lazy = None
+        if testType == "commit_result":
+            self.__add_result__(SubTestCommitResult(testResult.commit))
+            return
+
+        # In lazy mode, only read the files when the results get accessed
+        if testResult.commit.report.lazy:
+            self._lazy = (testType, metricsFiles)
+            return
+
+        self.__load_files__(testType, metricsFiles)
+
+    def __load_files__(self, testType, metricsFiles):
+        # Re-use the records from the report's cache when none of the files
+        # changed since they got parsed
+        report = self.test_result.commit.report
+        cache = report.cache
+        files = [self.run_file] + metricsFiles
+        records = None
+        if cache is not None:
+            records = cache.get(self.run_file, files)
+        if records is None:
+            records = TestRun.parse_run_files(testType, self.run_file, metricsFiles,
+                                              report.log_folder_path, report.sidecars)
+            if cache is not None:
+                cache.set(self.run_file, files, records)
+
+        self.__import_records__(records)
+
+    def __load__(self):
+        """
+        Read the files of a lazily-created run. The missing results are tagged
+        based on the subtests known at the time of loading.
+        """
+        testType, metricsFiles = self._lazy
+        self._lazy = None
+
+        try:
+            self.__load_files__(testType, metricsFiles)
+        except Exception as e:
+            # Errors would have discarded the run when parsing eagerly, just
+            # leave it empty
+            print(e, file=sys.stderr)
+        self.tag_missing_results()
+
+    @classmethod
+    def parse_run_files(cls, testType, runFile, metricsFiles, log_folder,
+                        sidecar = False):
+        """
+        Parse a run file and its metrics files, without creating any object.
+
+        Args:
+            testType: The type of the test (bench, unit, imgval or unified)
+            runFile: The path to the run file, relative to $log_folder
+            metricsFiles: The list of metrics files associated to the run
+            log_folder: The report's folder, used to resolve the paths
+            sidecar: Store the parsed unified runs in a binary file next to
+                     the run file, see TestRun.parse_unified_run
+
+        Returns:
+            A list of records (tuples) which can be imported back using
+            TestRun.__import_records__ and are cheap to serialize
+        """
+        records = []
         if testType == "bench":
             # There are no subtests here
-            data, unit, more_is_better = readCsv(runFile)
+            data, unit, more_is_better = readCsv(os.path.join(log_folder, runFile))
             if len(data) > 0:
-                result = SubTestFloat("", testResult.unit, data, runFile)
-                self.__add_result__(result)
+                records.append(("bench", data, runFile))
         elif testType == "unit":
-            unit_tests = readUnitRun(runFile)
+            unit_tests = readUnitRun(os.path.join(log_folder, runFile))
             for subtest in unit_tests:
-                result = SubTestString(subtest, unit_tests[subtest], runFile)
-                self.__add_result__(result)
+                records.append(("str", subtest, unit_tests[subtest], runFile))
         elif testType == "imgval":
-            self.importImgTestRun(runFile)
+            records.extend(cls.parse_img_run(runFile, log_folder))
         elif testType == "unified":
-            self.importUnifiedTestRun(runFile)
-        elif testType == "commit_result":
-            self.__add_result__(SubTestCommitResult(testResult.commit))
+            records.extend(cls.parse_unified_run(runFile, log_folder, sidecar))
         else:
             raise ValueError("Ignoring results because the type '{}' is unknown".format(testType))
 
         for f in metricsFiles:
-            self.__add_metrics__(f)
+            records.extend(cls.parse_metrics_file(f, log_folder))
+
+        return records
+
+    def __store__(self):
+        return self.test_result.commit.report.samples
+
+    def __import_records__(self, records):
+        floats = []
+        strings = []
+        for record in records:
+            kind = record[0]
+            if kind == "bench" and record[2] == self.run_file:
+                floats.append(("", self.test_result.unit, record[1]))
+            elif kind == "bench":
+                self.__add_result__(SubTestFloat("", self.test_result.unit, record[1],
+                                                 record[2], self.__store__()))
+            elif kind == "float" and record[4] == self.run_file:
+                floats.append(record[1:4])
+            elif kind == "float":
+                self.__add_result__(SubTestFloat(record[1], record[2], record[3], record[4],
+                                                 self.__store__()))
+            elif kind == "str" and record[3] == self.run_file:
+                strings.append(record[1:3])
+            elif kind == "str":
+                self.__add_result__(SubTestString(record[1], record[2], record[3]))
+            elif kind == "img":
+                self.__add_result__(SubTestImage(record[1], record[2], record[3]))
+            elif kind == "metric":
+                self.__add_metric__(*record[1:])
+
+        self.__add_columns__(floats, strings)
+
+    def __add_columns__(self, floats, strings):
+        """
+        Store the float and string subtests coming from the run file without
+        creating one object per subtest: the keys and units are tuples shared
+        by all the runs having the same subtests, the float samples are stored
+        in the report's SampleStore and only the offsets are kept here.
+        SubTest objects are then generated on demand by result().
+
+        Args:
+            floats: A list of (key, unit, samples)
+            strings: A list of (key, value)
+        """
+        if len(floats) == 0 and len(strings) == 0:
+            return
+
+        # Add the keys to the subresults and check for duplicates
+        subresults, subresults_type = self.__subresults__()
+        keys = set(self._results.keys())
+        for entries, type_name in [(floats, "SubTestFloat"), (strings, "SubTestString")]:
+            for entry in entries:
+                key = entry[0]
+                if key in keys:
+                    msg = "Raw data file '{}' tries to add an already-existing column '{}'"
+                    raise ValueError(msg.format(self.run_file, key))
+                keys.add(key)
+                subresults.add(key)
+                subresults_type[key] = type_name
+
+        report = self.test_result.commit.report
+        if len(floats) > 0:
+            store = report.samples
+            start = len(store)
+            offsets = array('Q', [start])
+            for key, unit, samples in floats:
+                offset, count = store.add(samples)
+                offsets.append(offset + count)
+
+            self._float_keys = report.intern_columns(tuple([f[0] for f in floats]))
+            self._float_units = report.intern_columns(tuple([f[1] for f in floats]))[0]
+            if offsets[-1] - start == len(floats):
+                # Only one sample per subtest, just keep the starting offset
+                self._float_offsets = start
+            else:
+                self._float_offsets = offsets
 
-    def importImgTestRun(self, runFile):
-        with open(runFile, 'rt') as f:
+        if len(strings) > 0:
+            self._str_keys = report.intern_columns(tuple([s[0] for s in strings]))
+            self._str_values = tuple([sys.intern(s[1]) for s in strings])
+
+    def __column_float__(self, idx):
+        if type(self._float_offsets) is int:
+            offset, count = self._float_offsets + idx, 1
+        else:
+            offset = self._float_offsets[idx]
+            count = self._float_offsets[idx + 1] - offset
+        return SubTestFloat.from_store(self._float_keys[0][idx], self._float_units[idx],
+                                       self.__store__(), offset, count, self.run_file)
+
+    @classmethod
+    def parse_img_run(cls, runFile, log_folder):
+        records = []
+        with open(os.path.join(log_folder, runFile), 'rt') as f:
             line_cnt = 0
             for line in f:
                 split = line.split(',')
                 if len(split) == 2:
                     frameid = split[0].strip()
                     frame_file = split[1].strip()
-                    fullpath = os.path.join(self.test_result.commit.report.log_folder, frame_file)
-                    self.__add_result__(SubTestImage(frameid, fullpath, runFile))
+                    fullpath = os.path.join(log_folder, os.path.dirname(runFile), frame_file)
+                    records.append(("img", frameid, fullpath, runFile))
                 else:
                     raise ValueError("WARNING: Run file '{}' has an invalid format at line {}".format(runFile, line_cnt))
                 line_cnt += 1
-            self.__add_result__(SubTestString("", "complete", runFile))
+            records.append(("str", "", "complete", runFile))
+        return records
 
-    def importUnifiedTestRun(self, runFile):
-        l_re = re.compile(r'^(.*): (.*)\((.*)\)( .*)?$')
-        with open(runFile, 'rt') as f:
+    @classmethod
+    def __unified_sidecar_path__(cls, path):
+        # Hidden, for the sidecar not to be sent along with the run files
+        folder, name = os.path.split(path)
+        return os.path.join(folder, "." + name + ".records")
+
+    @classmethod
+    def __read_unified_sidecar__(cls, sidecar_path, signature):
+        try:
+            with open(sidecar_path, 'rb') as f:
+                data = pickle.load(f)
+            if (data.get("version", 0) == cls.unified_sidecar_version and
+                data["signature"] == signature):
+                return data["records"]
+        except Exception:
+            pass
+        return None
+
+    @classmethod
+    def __write_unified_sidecar__(cls, sidecar_path, signature, records):
+        try:
+            sidecar_tmp = sidecar_path + ".tmp"
+            with open(sidecar_tmp, 'wb') as f:
+                pickle.dump({"version": cls.unified_sidecar_version,
+                             "signature": signature, "records": records},
+                            f, pickle.HIGHEST_PROTOCOL)
+            os.rename(sidecar_tmp, sidecar_path)
+        except IOError:
+            pass
+
+    @classmethod
+    def parse_unified_run(cls, runFile, log_folder = "", sidecar = False):
+        """
+        Parse a run file of the unified format, made of lines formated as
+        'key: type(value) unit'.
+
+        Args:
+            runFile: The path to the run file, relative to $log_folder
+            log_folder: The report's folder, used to resolve the paths
+            sidecar: Store the parsed run in a hidden binary file next to
+                     the run file (.$runFile.records), which is read instead
+                     of the run file as long as the latter does not change
+
+        Returns:
+            A list of records, see TestRun.parse_run_files
+        """
+        path = os.path.join(log_folder, runFile)
+        if sidecar:
+            sidecar_path = cls.__unified_sidecar_path__(path)
+            st = os.stat(path)
+            signature = (st.st_size, st.st_mtime_ns)
+            entries = cls.__read_unified_sidecar__(sidecar_path, signature)
+            if entries is not None:
+                return [entry + (runFile,) for entry in entries]
+
+        entries = []
+        with open(path, 'rt') as f:
             for i, line in enumerate(f):
-                m = l_re.match(line)
-                if m is None:
+                tokens = tokenize_unified_line(line)
+                if tokens is None:
                     print("{}: invalid format at line {}: '{}'".format(runFile, i, line))
                     continue
 
-                key, key_type, value, unit = m.groups()
-
-                if unit is not None:
-                    unit = unit.strip()
-
+                key, key_type, value, unit = tokens
                 if key_type == "float":
                     if unit is None:
                         print("{}: Float type requires a unit at line {}".format(runFile, i))
                         continue
-
-                    # handle lists of floats, if necessary
-                    value = ast.literal_eval(value)
-                    if type(value) is float:
-                        value = [value]
-
-                    self.__add_result__(SubTestFloat(key, unit, value, runFile))
+                    entries.append(("float", key, unit, decode_unified_floats(value)))
                 elif key_type == "str":
-                    self.__add_result__(SubTestString(key, value, runFile))
+                    entries.append(("str", key, value))
                 elif key_type == "img":
-                    self.__add_result__(SubTestImage(key, value, runFile))
+                    entries.append(("img", key, value))
+
+        # The records do not contain the path of the run file, for the sidecar
+        # to remain valid when the run file gets moved
+        if sidecar:
+            cls.__write_unified_sidecar__(sidecar_path, signature, entries)
+        return [entry + (runFile,) for entry in entries]
+
+    def __subresults__(self):
+        # The subresults found in all the runs of the test, in the report
+        report = self.test_result.commit.report
+        test_name = self.test_result.test.full_name
+        subresults = report.subresults.get(test_name, None)
+        if subresults is None:
+            subresults = (set(), dict())
+            report.subresults[test_name] = subresults
+        return subresults
 
     def __add_result__(self, subtest):
         if subtest.subtest_type() == BenchSubTestType.METRIC:
@@ -453,17 +1200,15 @@ class TestRun:
             key = subtest.name
 
         # Add the key to the subresults
-        test_name = self.test_result.test.full_name
-        if test_name not in TestRun.subresults:
-            TestRun.subresults[test_name] = set()
-            TestRun.subresults_type[test_name] = dict()
-        TestRun.subresults[test_name].add(key)
-        TestRun.subresults_type[test_name][key] = subtest.__class__.__name__
+        subresults, subresults_type = self.__subresults__()
+        subresults.add(key)
+        subresults_type[key] = subtest.__class__.__name__
 
         # Verify that the subtest does not already exist
-        if key in self._results:
+        existing = self.result(key)
+        if existing is not None:
             msg = "Raw data file '{}' tries to add an already-existing result '{}' (found in '{}')"
-            msg = msg.format(subtest.data_raw_file, key, self._results[key].data_raw_file)
+            msg = msg.format(subtest.data_raw_file, key, existing.data_raw_file)
             raise ValueError(msg)
 
         self._results[key] = subtest
@@ -474,49 +1219,65 @@ class TestRun:
             return
 
         # Find the keys that are not present
-        test_name = self.test_result.test.full_name
-        for key in TestRun.subresults[test_name] - self.results():
-            t = TestRun.subresults_type[test_name][key]
+        subresults, subresults_type = self.__subresults__()
+        for key in subresults - self.results():
+            t = subresults_type[key]
             if t == "SubTestFloat":
-                self.__add_result__(SubTestFloat(key, self.test_result.unit, -1, self.run_file))
+                self.__add_result__(SubTestFloat(key, self.test_result.unit, -1,
+                                                 self.run_file, self.__store__()))
             elif t == "SubTestString":
                 self.__add_result__(SubTestString(key, "missing", self.run_file))
             elif t == "SubTestImage":
                 self.__add_result__(SubTestImage(key, None, self.run_file))
 
-    def __add_metrics__(self, metric_file):
-        values = dict()
-        with open(metric_file, 'rt') as f:
-            # Do not try to open files bigger than 1MB
-            if os.fstat(f.fileno()).st_size > 1e6:
-                print('The metric file \'{}\' is too big (> 1MB)'.format(metric_file), file=sys.stderr)
-                return
-
-            field_names = None
-            fields_values = list()
-            mmaped_file = mmap.mmap(f.fileno(), 0, prot=mmap.PROT_READ)
-            for line in iter(mmaped_file.readline, ""):
-                fields = line.decode().split(',')
-                if field_names is None:
-                    field_names = fields
-                    for i in range(0, len(fields)):
-                        fields_values.append(list())
-                elif len(fields) == len(field_names):
-                    for i in range(0, len(fields)):
-                        fields_values[i].append(float(fields[i]))
-                else:
-                    break
+    @classmethod
+    def __parse_metrics_lines__(cls, lines, field_count):
+        # Slow path, used when the file contains invalid lines: read the
+        # values until the first invalid line
+        rows = []
+        for line in lines:
+            fields = line.split(b',')
+            if len(fields) != field_count:
+                break
+            try:
+                rows.append([float(f) for f in fields])
+            except ValueError:
+                break
+        return np.array(rows, dtype=np.float64).reshape(-1, field_count)
 
-            for i in range(0, len(field_names)):
-                values[field_names[i]] = fields_values[i]
-            mmaped_file.close()
+    @classmethod
+    def parse_metrics_file(cls, metric_file, log_folder = ""):
+        with open(os.path.join(log_folder, metric_file), 'rb') as f:
+            data = f.read()
+
+        # Read the header, then parse all the values in one go. Ignore the last
+        # line if it is incomplete, the file may still be being written
+        header, sep, body = data.partition(b'\n')
+        field_names = [n.strip() for n in header.decode().split(',')]
+        field_count = len(field_names)
+        body = body[:body.rfind(b'\n') + 1]
+        lines_count = body.count(b'\n')
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            values = np.fromstring(body.replace(b'\n', b',').decode(), dtype=np.float64, sep=',')
+
+        # A short line followed by a long one has the right number of values,
+        # so also check the number of fields of every line
+        raw = np.frombuffer(body, dtype=np.uint8)
+        commas = np.cumsum(raw == ord(','))[raw == ord('\n')]
+        fields_ok = np.all(np.diff(commas, prepend=0) == field_count - 1)
+
+        if values.size == lines_count * field_count and fields_ok:
+            values = values.reshape(-1, field_count)
+        else:
+            values = cls.__parse_metrics_lines__(body.splitlines(), field_count)
 
-        # Find the time values and store them aside after converting them to seconds
+        # Find the time values and convert them to seconds
         time_unit_re = re.compile(r'^time \((.+)\)$')
-        time = list()
-        for field in values:
+        time = None
+        for i, field in enumerate(field_names):
             m = time_unit_re.match(field)
-            if m is not None:
+            if m is not None and time is None:
                 unit = m.groups()[0]
                 factor = 1
                 if unit == "s":
@@ -529,12 +1290,16 @@ class TestRun:
                     factor = 1e-9
                 else:
                     print("unknown time unit '{}'".format(unit))
-                for v in values[field]:
-                    time.append(v * factor)
+                time = values[:, i] * factor
+
+        timestamps = None
+        if time is not None and len(time) > 0:
+            timestamps = time - time[0]
 
         # Create the metrics
+        records = []
         metric_name_re = re.compile(r'^(.+) \((.+)\)$')
-        for field in values:
+        for i, field in enumerate(field_names):
             unit = None
             m = metric_name_re.match(field)
             if m is not None:
@@ -545,40 +1310,45 @@ class TestRun:
             if metric_name.lower() == "time":
                 continue
 
-            if unit.lower() == "rpm" or unit.lower() == "°c":
+            if unit is not None and (unit.lower() == "rpm" or unit.lower() == "°c"):
                 continue
 
-            vals = list()
-            timestamps = list()
-            for v in range(0, len(values[field])):
-                vals.append(values[field][v])
-                timestamps.append(time[v] - time[0])
-            metric = Metric(metric_name, unit, vals, timestamps, metric_file)
-            self.__add_result__(metric)
-
-            # Try to add more metrics by combining them
-            if unit == "W" or unit == "J":
-                power_value = None
-                if unit == "W":
-                    if metric.exec_time() > 0:
-                        energy_name = metric_name + ":energy"
-                        power_value =  metric.samples.mean()
-                        value = power_value * metric.exec_time()
-                        energy_metric = Metric(energy_name, "J", [value], [metric.exec_time()], metric_file)
-                        self.__add_result__(energy_metric)
-                elif unit == "J":
-                    if metric.exec_time() > 0:
-                        energy_name = metric_name + ":power"
-                        power_value = metric.samples.mean() / metric.exec_time()
-                        power_metric = Metric(energy_name, "W", [power_value], [metric.exec_time()], metric_file)
-                        self.__add_result__(power_metric)
-
-                if power_value is not None and self.main_value_type == "FPS":
-                    efficiency_name = metric_name + ":efficiency"
-                    value = self.main_value / power_value
-                    unit = "{}/W".format(self.main_value_type)
-                    efficiency_metric = Metric(efficiency_name, unit, [value], [metric.exec_time()], metric_file)
-                    self.__add_result__(efficiency_metric)
+            records.append(("metric", metric_name, unit, values[:, i].copy(),
+                            timestamps, metric_file))
+
+        return records
+
+    def __add_metric__(self, metric_name, unit, vals, timestamps, metric_file):
+        store = self.__store__()
+        metric = Metric(metric_name, unit, vals, timestamps, metric_file, store)
+        self.__add_result__(metric)
+
+        # Try to add more metrics by combining them
+        if unit == "W" or unit == "J":
+            power_value = None
+            if unit == "W":
+                if metric.exec_time() > 0:
+                    energy_name = metric_name + ":energy"
+                    power_value =  metric.value
+                    value = power_value * metric.exec_time()
+                    energy_metric = Metric(energy_name, "J", [value], [metric.exec_time()],
+                                           metric_file, store)
+                    self.__add_result__(energy_metric)
+            elif unit == "J":
+                if metric.exec_time() > 0:
+                    energy_name = metric_name + ":power"
+                    power_value = metric.value / metric.exec_time()
+                    power_metric = Metric(energy_name, "W", [power_value], [metric.exec_time()],
+                                          metric_file, store)
+                    self.__add_result__(power_metric)
+
+            if power_value is not None and self.main_value_type == "FPS":
+                efficiency_name = metric_name + ":efficiency"
+                value = self.main_value / power_value
+                unit = "{}/W".format(self.main_value_type)
+                efficiency_metric = Metric(efficiency_name, unit, [value], [metric.exec_time()],
+                                           metric_file, store)
+                self.__add_result__(efficiency_metric)
 
     def result(self, key = None):
         """ Returns the result associated to the key or None if it does not exist """
@@ -587,10 +1357,19 @@ class TestRun:
                 return SubTestFloat(None, self.main_value_type, [self.main_value], self.test_result.test_file)
             else:
                 return None
+        if self._lazy is not None:
+            self.__load__()
         if key in self._results:
             return self._results[key]
-        else:
-            return None
+        if self._float_keys is not None:
+            idx = self._float_keys[1].get(key, None)
+            if idx is not None:
+                return self.__column_float__(idx)
+        if self._str_keys is not None:
+            idx = self._str_keys[1].get(key, None)
+            if idx is not None:
+                return SubTestString(key, self._str_values[idx], self.run_file)
+        return None
 
     def results(self, restrict_to_type = None):
         """
@@ -602,15 +1381,27 @@ class TestRun:
             restrict_to_type: A BenchSubTestType to only list the results of a certain type
 
         """
+        if self._lazy is not None:
+            self.__load__()
+
         if restrict_to_type is None:
-            return set(self._results.keys())
+            keys = set(self._results.keys())
         else:
-            return set([x for x in self._results if self._results[x].subtest_type() == restrict_to_type])
+            keys = set([x for x in self._results if self._results[x].subtest_type() == restrict_to_type])
+
+        if (self._float_keys is not None and
+            (restrict_to_type is None or restrict_to_type == BenchSubTestType.SUBTEST_FLOAT)):
+            keys.update(self._float_keys[0])
+        if (self._str_keys is not None and
+            (restrict_to_type is None or restrict_to_type == BenchSubTestType.SUBTEST_STRING)):
+            keys.update(self._str_keys[0])
+        return keys
 
 
 class SubTestResult:
     __slots__ = ['test_result', 'commit', 'test', 'key', 'runs', 'value_type',
-                 'unit', 'results', 'average_image_file', '_cache_list', '_cache_list_stats']
+                 'unit', 'results', 'warmup_results', 'average_image_file', '_cache_list',
+                 '_cache_list_stats']
 
     def __init__(self, testResult, test, key, runs):
         self.test_result = testResult
@@ -654,6 +1445,12 @@ class SubTestResult:
                 continue
             self.results.append((run, run_result.value))
 
+        # Do not let the runs made with cold caches inflate the variance
+        self.warmup_results = []
+        if (self.value_type == BenchSubTestType.SUBTEST_FLOAT or
+                self.value_type == BenchSubTestType.METRIC):
+            self.__discard_warmup_runs__()
+
         if self.value_type == BenchSubTestType.SUBTEST_IMAGE:
             log_folder = self.commit.report.log_folder
 
@@ -678,6 +1475,31 @@ class SubTestResult:
         self._cache_list = None
         self._cache_list_stats = None
 
+    def __discard_warmup_runs__(self):
+        # The first run of a test after the deployment of a version is run
+        # with cold caches. Reports without deployment markers in their
+        # journal fall back to the first run of the result.
+        if len(self.results) < 4:
+            return
+
+        journal = self.commit.report.journal
+        if journal.has_deploy_markers():
+            cold = journal.cold_runs()
+            is_cold = lambda run_file: os.path.basename(run_file) in cold
+        else:
+            is_cold = lambda run_file: run_file.endswith("#0")
+
+        for run, value in self.results:
+            if not is_cold(run.run_file):
+                continue
+
+            others = [v for r, v in self.results if r is not run]
+            if is_warmup_outlier(value, others):
+                self.warmup_results.append((run, value))
+
+        if len(self.warmup_results) > 0:
+            self.results = [x for x in self.results if x not in self.warmup_results]
+
     def __len__(self):
         return len(self.to_list())
 
@@ -707,6 +1529,22 @@ class SubTestResult:
 
         return set(self.to_list())
 
+    def fingerprint(self):
+        """
+        Returns a digest of the type, the unit and the values of the result,
+        which changes whenever a run gets added, removed or discarded
+        """
+        h = hashlib.blake2b(digest_size=16)
+        h.update("{}|{}|".format(self.value_type, self.unit).encode())
+        if (self.value_type == BenchSubTestType.SUBTEST_FLOAT or
+                self.value_type == BenchSubTestType.METRIC):
+            h.update(self.to_liststat().data.tobytes())
+        elif self.value_type == BenchSubTestType.SUBTEST_COMMIT_RESULT:
+            h.update(str(self.commit.compil_exit_code).encode())
+        else:
+            h.update(repr(self.to_list()).encode())
+        return h.digest()
+
     def to_liststat(self):
         """ Convenience method that returns a ListStats(self.to_list()) object """
 
@@ -807,6 +1645,9 @@ class SubTestResult:
             return Test.metric_fullname(self.test.full_name, self.key)
 
 class TestResult:
+    __slots__ = ['commit', 'test', 'test_file', 'runs', 'test_type', 'more_is_better', 'unit',
+                 '_results_cache']
+
     def __init__(self, commit, test, testType, testFile, runFiles, metricsFiles):
         self.commit = commit
         self.test = test
@@ -826,7 +1667,7 @@ class TestResult:
             self.runs.append(TestRun(self, testType, "", []))
         elif testType != "unified":
             # Read the data and abort if there is no data
-            data, unit, self.more_is_better = readCsv(testFile)
+            data, unit, self.more_is_better = self.__read_test_file__()
             if len(data) == 0:
                 raise ValueError("The TestResult {} does not contain any runs".format(testFile))
 
@@ -865,6 +1706,56 @@ class TestResult:
         if len(self.runs) == 0:
             raise ValueError("WARNING: Invalid test result: No runs found for the test {} on commit {}".format(self.test.full_name, self.commit.full_sha1))
 
+    def __read_test_file__(self):
+        cache = self.commit.report.cache
+        csv_data = None
+        if cache is not None:
+            csv_data = cache.get(self.test_file, [self.test_file])
+        if csv_data is None:
+            csv_data = readCsv(os.path.join(self.commit.report.log_folder_path, self.test_file))
+            if cache is not None:
+                cache.set(self.test_file, [self.test_file], csv_data)
+        return csv_data
+
+    def add_run(self, runFile, metricsFiles):
+        """
+        Add a run that completed after the result got created.
+
+        Args:
+            runFile: The path to the run file
+            metricsFiles: The list of metrics files associated to the run
+
+        Returns:
+            The new TestRun
+        """
+        if self.test_type == "unified":
+            run = TestRun(self, self.test_type, runFile, metricsFiles, None, None)
+        else:
+            data, unit, self.more_is_better = self.__read_test_file__()
+
+            # The main value of the run is the n-th value of the test file
+            value = -1
+            if len(data) == len(self.runs) + 1:
+                value = data[-1]
+            else:
+                print("The test result {} does not contain all the runs ({} vs {}). Ignore data...".format(self.test_file, len(data), len(self.runs) + 1), file=sys.stderr)
+
+            run = TestRun(self, self.test_type, runFile, metricsFiles, self.unit, value)
+
+        self.runs.append(run)
+        self._results_cache = dict()
+
+        return run
+
+
+    def run_count(self, key = ""):
+        """
+        Returns the number of runs containing the result $key. For the main
+        value of benchmarks, the runs are not loaded when the report is lazy.
+        """
+        if self.test_type == "bench" and key == "":
+            return len(self.runs)
+        return len(self.result(key))
 
     def result(self, key = None):
         """ Returns the result associated to the key or None if it does not exist """
@@ -896,7 +1787,152 @@ class TestResult:
         return res
 
 
+def commit_metadata(full_sha1, author, author_date, commiter, commit_date,
+                    message_lines):
+    """
+    Gather the metadata of a commit in a dictionary that can be stored in the
+    commits' metadata index of a report.
+
+    Args:
+        full_sha1: The full sha1 of the commit
+        author: The author of the commit
+        author_date: The authoring date, as a timestamp, or None
+        commiter: The commiter of the commit
+        commit_date: The commit date, as a timestamp, or None
+        message_lines: The stripped lines of the commit message
+
+    Returns:
+        The metadata of the commit
+    """
+    metadata = {"full_sha1": full_sha1, "author": author,
+                "author_date": author_date, "commiter": commiter,
+                "commit_date": commit_date, "title": '', "commit_log": '',
+                "signed_of_by": [], "reviewed_by": [], "tested_by": [],
+                "bugs": []}
+
+    fdo_bug_re = re.compile(r'fdo#(\d+)')
+    basefdourl = "https://bugs.freedesktop.org/show_bug.cgi?id="
+    commit_log = []
+    for line in message_lines:
+        if metadata["title"] == '':
+            metadata["title"] = line
+            continue
+
+        commit_log.append(line + '\n')
+        if line.startswith('Reviewed-by: '):
+            metadata["reviewed_by"].append(line[13:])
+        elif line.startswith('Signed-off-by: '):
+            metadata["signed_of_by"].append(line[15:])
+        elif line.startswith('Tested-by: '):
+            metadata["tested_by"].append(line[11:])
+        elif line.startswith('Bugzilla: '):
+            metadata["bugs"].append(line[10:])
+        elif line.startswith('Fixes: '):
+            metadata["bugs"].append(line[7:])
+        else:
+            fdo_bug_m = fdo_bug_re.search(line)
+            if fdo_bug_m is not None:
+                metadata["bugs"].append(basefdourl + fdo_bug_m.groups()[0])
+    metadata["commit_log"] = "".join(commit_log)
+
+    return metadata
+
+def parse_commit_patch(patch_path):
+    """
+    Parse the header and the commit message of a patch generated with
+    `git show --format=fuller`.
+
+    Args:
+        patch_path: The path to the patch
+
+    Returns:
+        A tuple (metadata, complete). Metadata is None if the patch cannot be
+        read, complete is False if the header of the patch is truncated
+    """
+    header = {"full_sha1": os.path.basename(patch_path)[:-len(".patch")],
+              "author": "UNKNOWN AUTHOR", "author_date": None,
+              "commiter": "UNKNOWN COMMITER", "commit_date": None}
+    message_lines = []
+    log_started = False
+    try:
+        with open(patch_path, 'r') as f:
+            for line in f:
+                if line.startswith("diff --git "): # The diff follows the message
+                    break
+                line = line.strip()
+                if not log_started:
+                    if line == "---": # Detect the end of the header
+                        break
+                    elif line.startswith('commit'):
+                        header["full_sha1"] = line.split(' ')[1]
+                    elif line.startswith('Author:'):
+                        header["author"] = line[12:]
+                    elif line.startswith('AuthorDate: '):
+                        header["author_date"] = mktime_tz(parsedate_tz(line[12:]))
+                    elif line.startswith('Commit:'):
+                        header["commiter"] = line[12:]
+                    elif line.startswith('CommitDate: '):
+                        header["commit_date"] = mktime_tz(parsedate_tz(line[12:]))
+                    elif line == '':
+                        # The commit log is about to start
+                        log_started = True
+                else:
+                    message_lines.append(line)
+    except Exception:
+        return None, False
+
+    while len(message_lines) > 0 and message_lines[-1] == '':
+        message_lines.pop()
+    return commit_metadata(message_lines=message_lines, **header), log_started
+
+def commit_metadata_from_scm(scm, version):
+    """
+    Get the metadata of a commit from the repository of the tested project.
+
+    Args:
+        scm: The repository (GitRepo or NoRepo)
+        version: The version of the commit
+
+    Returns:
+        The metadata of the commit, or None if the repository does not know
+        about the version
+    """
+    infos = scm.commit_infos(version)
+    if infos is None:
+        return None
+    message_lines = [l.strip() for l in infos.pop("message").splitlines()]
+    return commit_metadata(message_lines=message_lines, **infos)
+
+def read_last_line(path, block_size=256):
+    """
+    Read the last line of a file, without reading the whole file.
+
+    Args:
+        path: The path to the file
+        block_size: The number of bytes read at a time, from the end
+
+    Returns:
+        The last line of the file, without its end of line
+    """
+    with open(path, 'rb') as f:
+        pos = f.seek(0, os.SEEK_END)
+        data = b''
+        while pos > 0:
+            step = min(block_size, pos)
+            pos -= step
+            f.seek(pos)
+            data = f.read(step) + data
+            if b'\n' in data[:-1]:
+                break
+    if data.endswith(b'\n'):
+        data = data[:-1]
+    return data.split(b'\n')[-1].decode(errors='replace')
+
 class Commit:
+    __slots__ = ['report', 'sha1', 'full_name', 'label', 'results', 'geom_mean_cache',
+                 'oldness_factor', 'full_sha1', 'author', 'commiter', 'author_date',
+                 'commit_date', 'title', 'compil_exit_code', '_metadata']
+
     def __init__(self, report, sha1, full_name, label):
         self.report = report
         self.sha1 = sha1
@@ -917,69 +1953,84 @@ class Commit:
     def __hash__(self):
         return hash(self.sha1)
 
-    def __parse_commit_information__(self, report):
-        self.compile_log = self.sha1 + "_compile_log"
-        self.patch = self.sha1 + ".patch"
+    @property
+    def patch(self):
+        path = self.report.commit_file(self.sha1, self.sha1 + ".patch")
+        if os.path.exists(os.path.join(self.report.log_folder_path, path)):
+            return path
+        return None
+
+    @property
+    def compile_log(self):
+        return self.report.commit_file(self.sha1, self.sha1 + "_compile_log")
+
+    def __metadata_set__(self, field):
+        if self._metadata is None:
+            return set()
+        return set(self._metadata[field])
+
+    @property
+    def commit_log(self):
+        if self._metadata is None:
+            return ''
+        return self._metadata["commit_log"]
+
+    @property
+    def signed_of_by(self):
+        return self.__metadata_set__("signed_of_by")
+
+    @property
+    def reviewed_by(self):
+        return self.__metadata_set__("reviewed_by")
+
+    @property
+    def tested_by(self):
+        return self.__metadata_set__("tested_by")
 
-        # Set default values then parse the patch
+    @property
+    def bugs(self):
+        return self.__metadata_set__("bugs")
+
+    def __parse_commit_information__(self, report):
+        # Set default values then look for the metadata of the commit
         self.full_sha1 = self.sha1
         self.author = "UNKNOWN AUTHOR"
         self.commiter = "UNKNOWN COMMITER"
         self.author_date = datetime.min
         self.commit_date = datetime.min
         self.title = ''
-        self.commit_log = ''
-        self.signed_of_by = set()
-        self.reviewed_by = set()
-        self.tested_by = set()
-        self.bugs = set()
-        try:
-            with open(self.patch, 'r') as f:
-                log_started = False
-                fdo_bug_re = re.compile('fdo#(\d+)')
-                basefdourl = "https://bugs.freedesktop.org/show_bug.cgi?id="
-                for line in f:
-                    line = line.strip()
-                    if not log_started:
-                        if line == "---": # Detect the end of the header
-                            break
-                        elif line.startswith('commit'):
-                            self.full_sha1 = line.split(' ')[1]
-                        elif line.startswith('Author:'):
-                            self.author = line[12:]
-                        elif line.startswith('AuthorDate: '):
-                            self.author_date = datetime.fromtimestamp(mktime_tz(parsedate_tz(line[12:])))
-                        elif line.startswith('Commit:'):
-                            self.commiter = line[12:]
-                        elif line.startswith('CommitDate: '):
-                            self.commit_date = datetime.fromtimestamp(mktime_tz(parsedate_tz(line[12:])))
-                        elif line == '':
-                            # The commit log is about to start
-                            log_started = True
-                    else:
-                        if self.title == '':
-                            self.title = line
-                        else:
-                            self.commit_log += line + '\n'
-                            if line.startswith('Reviewed-by: '):
-                                self.reviewed_by |= {line[13:]}
-                            elif line.startswith('Signed-off-by: '):
-                                self.signed_of_by |= {line[15:]}
-                            elif line.startswith('Tested-by: '):
-                                self.tested_by |= {line[11:]}
-                            elif line.startswith('Bugzilla: '):
-                                self.bugs |= {line[10:]}
-                            elif line.startswith('Fixes: '):
-                                self.bugs |= {line[7:]}
-                            else:
-                                fdo_bug_m = fdo_bug_re.search(line)
-                                if fdo_bug_m is not None:
-                                    bugid = fdo_bug_m.groups()[0]
-                                    self.bugs |= {basefdourl + bugid}
-        except Exception:
-            self.patch = None
-            pass
 
+        # The metadata of a commit never changes, so only query the repository
+        # or parse the patch when the commit is not in the report's index yet
+        metadata = report.commits_metadata.get(self.sha1)
+        if metadata is None and report.scm is not None:
+            metadata = commit_metadata_from_scm(report.scm, self.sha1)
+            if metadata is not None:
+                report.commits_metadata.set(self.sha1, metadata)
+        if metadata is None:
+            patch = report.commit_file(self.sha1, self.sha1 + ".patch")
+            metadata, complete = parse_commit_patch(os.path.join(report.log_folder_path,
+                                                                 patch))
+            # Do not index the patches which are still being written
+            if complete:
+                report.commits_metadata.set(self.sha1, metadata)
+
+        # The commit log and the trailers are rarely needed, only keep a
+        # reference to the metadata, which is shared with the index
+        self._metadata = metadata
+        if metadata is not None:
+            self.full_sha1 = sys.intern(metadata["full_sha1"])
+            self.author = sys.intern(metadata["author"])
+            self.commiter = sys.intern(metadata["commiter"])
+            if metadata["author_date"] is not None:
+                self.author_date = datetime.fromtimestamp(metadata["author_date"])
+            if metadata["commit_date"] is not None:
+                self.commit_date = datetime.fromtimestamp(metadata["commit_date"])
+            self.title = metadata["title"]
+
+        self.update_compil_exit_code(report)
+
+    def update_compil_exit_code(self, report):
         # Look for the exit code
         self.compil_exit_code = RunnerErrorCode.UNKNOWN
         if report.journal.deployed_count(self.full_sha1) > 0:
@@ -987,17 +2038,14 @@ class Commit:
         elif report.journal.deploy_count(self.full_sha1) > 1:
             self.compil_exit_code = RunnerErrorCode.DEPLOYMENT_ERROR
         else:
-            # Last resort, try to inspect the compilation logs
+            # Last resort, inspect the last line of the compilation logs
             try:
-                with open(self.compile_log, 'r') as f:
-                    for line in f:
-                        pass
-                    # Line contains the last line of the report, parse it
-                    s = "Exiting with error code "
-                    if line.startswith(s):
-                        self.compil_exit_code = RunnerErrorCode(int(line[len(s):]))
+                line = read_last_line(os.path.join(report.log_folder_path,
+                                                   self.compile_log))
+                s = "Exiting with error code "
+                if line.startswith(s):
+                    self.compil_exit_code = RunnerErrorCode(int(line[len(s):]))
             except Exception:
-                self.compile_log = None
                 pass
 
     def build_broken(self):
@@ -1054,6 +2102,8 @@ class Commit:
             return None
 
 class EventCommitRange:
+    __slots__ = ['old', 'new', 'commit_graph']
+
     def __init__(self, old, new = None, commit_graph = None):
         """
         Create a commit range.
@@ -1185,6 +2235,9 @@ class EventCommitRange:
             return "commit before {}".format(self.new.full_name)
 
 class Event:
+    __slots__ = ['event_type', 'commit_range', 'test', 'subresult_key', 'significance',
+                 'short_desc', 'full_name']
+
     def __init__(self, event_type, commit_range, test, subresult_key, significance, short_desc):
         self.event_type = event_type
         self.commit_range = commit_range
@@ -1205,6 +2258,8 @@ class Event:
             return "{}: {}".format(self.commit_range, self.short_desc)
 
 class EventBuildStatusChanged(Event):
+    __slots__ = []
+
     def __init__(self, commit_range):
         desc = "status went from {} to {}"
         desc = desc.format(commit_range.old.compil_exit_code, commit_range.new.compil_exit_code)
@@ -1212,6 +2267,8 @@ class EventBuildStatusChanged(Event):
         super().__init__("build", commit_range, None, None, 1, desc)
 
 class EventPerfChange(Event):
+    __slots__ = ['new_result', 'old_result', 'confidence']
+
     def __init__(self, commit_range, old_result, new_result, confidence):
         self.new_result = new_result
         self.old_result = old_result
@@ -1246,6 +2303,8 @@ class EventPerfChange(Event):
         return msg.format(self.commit_range, self.old_result.test.full_name, self.short_desc)
 
 class EventResultNeedsMoreRuns(Event):
+    __slots__ = ['result', '_wanted_n']
+
     def __init__(self, result, wanted_n):
         self.result = result
         self._wanted_n = wanted_n
@@ -1263,6 +2322,8 @@ class EventResultNeedsMoreRuns(Event):
         return self._wanted_n
 
 class EventInsufficientSignificance(EventResultNeedsMoreRuns):
+    __slots__ = ['wanted_margin']
+
     def __init__(self, result, wanted_margin):
         super().__init__(result, result.confidence_margin(wanted_margin)[1])
         self.wanted_margin = wanted_margin
@@ -1279,6 +2340,8 @@ class EventInsufficientSignificance(EventResultNeedsMoreRuns):
         return self.result.confidence_margin(self.wanted_margin)[0]
 
 class EventUnitResultChange(Event):
+    __slots__ = ['old_result', 'new_result', 'old_status', 'new_status']
+
     def __init__(self, commit_range, old_result, new_result):
         self.old_result = old_result
         self.new_result = new_result
@@ -1297,6 +2360,8 @@ class EventUnitResultChange(Event):
         super().__init__("unit test",commit_range, old_result.test, old_result.key, 2, desc)
 
 class EventUnitResultUnstable(Event):
+    __slots__ = ['result']
+
     def __init__(self, result):
         self.result = result
 
@@ -1306,6 +2371,8 @@ class EventUnitResultUnstable(Event):
         super().__init__("variance", EventCommitRange(result.commit), result.test, result.key, 2, desc)
 
 class EventRenderingChange(Event):
+    __slots__ = ['result', 'difference', 'confidence']
+
     def __init__(self, commit_range, result, difference, confidence):
         self.result = result
         self.difference = difference
@@ -1320,6 +2387,8 @@ class EventRenderingChange(Event):
         return self.difference
 
 class EventDivergingBaseResult(Event):
+    __slots__ = ['result', 'merge_base']
+
     def __init__(self, result, merge_base):
         self.result = result
         self.merge_base = merge_base
@@ -1333,116 +2402,817 @@ class EventDivergingBaseResult(Event):
 
         super().__init__("divergence", EventCommitRange(result.commit), result.test, result.key, 1, desc)
 
+class JournalIndex:
+    def __init__(self):
+        """
+        Construct the index of the entries of a journal: the number of entries
+        for every operation and key, the runs that completed, the runs that
+        started but did not complete yet and the runs that were the first of
+        their test after a deployment.
+        """
+        self.counts = dict()
+        self.tested = dict()
+        self.open = OrderedDict()
+        self.cold = set()
+
+        # The tests that ran since the last deployment
+        self.warm = set()
+
+    def add(self, op, key, attrs):
+        op_counts = self.counts.setdefault(op, dict())
+        op_counts[key] = op_counts.get(key, 0) + 1
+
+        if op == "deployed":
+            self.warm = set()
+        elif op == "warmup":
+            self.warm.add(key)
+
+        result_file = attrs.get("result_file", None)
+        if result_file is None:
+            return
+        if op == "test":
+            if key not in self.warm:
+                self.cold.add(result_file)
+                self.warm.add(key)
+            if (key, result_file) not in self.tested:
+                self.open.setdefault((key, result_file), attrs)
+        elif op == "tested":
+            self.tested[(key, result_file)] = attrs["timestamp"]
+            self.open.pop((key, result_file), None)
+
+    def remove_open(self, key, result_file):
+        del self.open[(key, result_file)]
+        self.counts["test"][key] -= 1
+
+    def to_json(self, head):
+        return {"head": head,
+                "counts": self.counts,
+                "tested": [[k, r, t] for (k, r), t in self.tested.items()],
+                "open": [[k, r, a] for (k, r), a in self.open.items()],
+                "cold": list(self.cold),
+                "warm": list(self.warm)}
+
+    @classmethod
+    def from_json(cls, data):
+        index = cls()
+        index.counts = data["counts"]
+        index.tested = {(k, r): t for k, r, t in data["tested"]}
+        index.open = OrderedDict([((k, r), a) for k, r, a in data["open"]])
+        index.cold = set(data.get("cold", []))
+        index.warm = set(data.get("warm", []))
+        return index
+
 class Journal:
-    def __init__(self, filepath):
-        self._journal = dict()
+    index_version = 2
+    checkpoint_interval = 1000
 
-        try:
-            with open(filepath, 'r') as f:
-                for entry in f.readlines():
-                    entry = entry.strip()
-                    fields = entry.split(',')
-                    if not fields or len(fields) < 3:
-                        continue
+    def __init__(self, filepath):
+        """
+        Read the journal of a report.
 
-                    # Parse the time
-                    attrs = dict()
-                    try:
-                        attrs["timestamp"] = float(fields[0])
-                    except:
-                        continue
+        The index of the journal is checkpointed in a hidden file next to it,
+        so that only the entries appended since the checkpoint have to be read.
+        Old entries may also have been folded in $filepath.compacted by
+        compact().
 
-                    op = fields[1]
-                    if op == "test" or op == "tested":
-                        key=",".join(fields[2:4])
+        Args:
+            filepath: The path to the journal
+        """
+        self.filepath = filepath
+        self.compacted_path = filepath + ".compacted"
+        self.index_path = os.path.join(os.path.dirname(filepath),
+                                       "." + os.path.basename(filepath) + "_index")
 
-                        attrs["version"] = fields[2]
-                        attrs["test"] = fields[3]
+        # The first line of the journal, to detect when it gets replaced
+        self._head = None
+        self._offset = 0
+        self._index = JournalIndex()
+        self._unsaved_lines = 0
 
-                        if len(fields) > 4:
-                            attrs["result_file"] = fields[4]
-                    else:
-                        key=",".join(fields[2:])
+        self.__load_index__()
+        self.update()
 
-                    self.__add_value__(op, key, attrs)
+    def __load_index__(self):
+        try:
+            with open(self.index_path, 'rb') as f:
+                data = pickle.load(f)
+            if data.get("version", 0) == self.index_version:
+                self._head = data["head"]
+                self._offset = data["offset"]
+                self._index = data["index"]
         except Exception:
             pass
 
-    def __add_value__(self, op, key, attrs):
-        if op not in self._journal:
-            self._journal[op] = dict()
-        if key not in self._journal[op]:
-            self._journal[op][key] = [attrs]
-        else:
-            self._journal[op][key].append(attrs)
+    def __save_index__(self):
+        self._unsaved_lines = 0
+        try:
+            index_tmp = "{}.{}.tmp".format(self.index_path, os.getpid())
+            with open(index_tmp, 'wb') as f:
+                pickle.dump({"version": self.index_version, "head": self._head,
+                             "offset": self._offset, "index": self._index},
+                            f, pickle.HIGHEST_PROTOCOL)
+            os.rename(index_tmp, self.index_path)
+        except IOError:
+            pass
 
-    def __key_test__(self, version, test_name):
-        return "{},{}".format(version, test_name)
+    def __base_index__(self, head):
+        # The folded entries only apply to the journal written by compact()
+        try:
+            with open(self.compacted_path, 'r') as f:
+                data = json.load(f)
+            if head is not None and data["head"] == head.decode(errors='replace'):
+                return JournalIndex.from_json(data)
+        except Exception:
+            pass
+        return JournalIndex()
 
-    def count(self, operation, key):
-        return len(self._journal.get(operation, dict()).get(key, []))
+    @classmethod
+    def __parse_line__(cls, line):
+        fields = line.strip().split(',')
+        if not fields or len(fields) < 3:
+            return None
 
-    def deploy_count(self, version):
-        return self.count("deploy", version)
+        # Parse the time
+        attrs = dict()
+        try:
+            attrs["timestamp"] = float(fields[0])
+        except:
+            return None
 
-    def deployed_count(self, version):
-        return self.count("deployed", version)
+        op = fields[1]
+        if op == "test" or op == "tested":
+            key=",".join(fields[2:4])
 
-    def test_count(self, version, test_name):
-        return self.count("test", self.__key_test__(version, test_name))
+            attrs["version"] = fields[2]
+            attrs["test"] = fields[3]
 
-    def tested_count(self, version, test_name):
-        return self.count("tested", self.__key_test__(version, test_name))
+            if len(fields) > 4:
+                attrs["result_file"] = fields[4]
+        else:
+            key=",".join(fields[2:])
 
-    def incomplete_tests(self):
-        if "test" not in self._journal:
+        return op, key, attrs
+
+    def update(self):
+        """
+        Read the entries appended to the journal since it got last read.
+
+        Returns:
+            The list of new entries, as tuples (operation, key, attributes), or
+            None if the journal got truncated or compacted and has been read
+            again from the start
+        """
+        truncated = False
+        try:
+            with open(self.filepath, 'rb') as f:
+                size = os.fstat(f.fileno()).st_size
+                head = f.readline()
+                if not head.endswith(b'\n'):
+                    head = None
+
+                if self._offset > 0 and (head != self._head or size < self._offset):
+                    truncated = True
+                if truncated or (self._offset == 0 and head != self._head):
+                    self._index = self.__base_index__(head)
+                    self._head = head
+                    self._offset = 0
+
+                f.seek(self._offset)
+                data = f.read()
+        except Exception:
             return []
 
+        # Only consume complete lines, as the runner may be writing the last one
+        end = data.rfind(b'\n') + 1
+        self._offset += end
+
+        new_entries = []
+        lines = data[:end].decode(errors='replace').splitlines()
+        for line in lines:
+            entry = self.__parse_line__(line)
+            if entry is None or entry[0] == "compacted":
+                continue
+
+            self._index.add(*entry)
+            new_entries.append(entry)
+
+        self._unsaved_lines += len(lines)
+        if self._unsaved_lines >= self.checkpoint_interval:
+            self.__save_index__()
+
+        if truncated:
+            return None
+        return new_entries
+
+    def compact(self, keep_lines = 1000):
+        """
+        Fold the old entries of the journal in the .compacted file, leaving
+        the journal with its latest $keep_lines entries and the runs that did
+        not complete yet. Nothing is done if less than $keep_lines entries
+        would get folded, or if the report is locked by the runner.
+
+        Returns:
+            True if the journal got compacted, False otherwise
+        """
+        try:
+            lock = open(os.path.join(os.path.dirname(self.filepath), "lock"), "a")
+        except IOError:
+            return False
+
+        with lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                with open(self.filepath, 'rb') as f:
+                    data = f.read()
+            except (IOError, OSError):
+                return False
+
+            end = data.rfind(b'\n') + 1
+            lines = data[:end].splitlines(keepends=True)
+            if len(lines) == 0:
+                return False
+
+            # Start from the entries folded by the previous compaction
+            folded = self.__base_index__(lines[0])
+            first = 0
+            head_entry = self.__parse_line__(lines[0].decode(errors='replace'))
+            if head_entry is not None and head_entry[0] == "compacted":
+                first = 1
+
+            old = []
+            for line in lines[first:max(first, len(lines) - keep_lines)]:
+                entry = self.__parse_line__(line.decode(errors='replace'))
+                if entry is not None:
+                    old.append((line, entry))
+                    folded.add(*entry)
+            if len(old) < keep_lines:
+                return False
+
+            # Keep the runs that did not complete in the journal
+            kept = []
+            for line, (op, key, attrs) in old:
+                result_file = attrs.get("result_file", None)
+                if op == "test" and folded.open.get((key, result_file), None) is attrs:
+                    folded.remove_open(key, result_file)
+                    kept.append(line)
+
+            marker = "{:.6f},compacted,{}\n".format(time.time(), len(old) - len(kept))
+            compacted_tmp = "{}.{}.tmp".format(self.compacted_path, os.getpid())
+            with open(compacted_tmp, 'w') as f:
+                json.dump(folded.to_json(marker), f)
+            os.rename(compacted_tmp, self.compacted_path)
+
+            journal_tmp = "{}.{}.tmp".format(self.filepath, os.getpid())
+            with open(journal_tmp, 'wb') as f:
+                f.write(marker.encode())
+                f.write(b"".join(kept))
+                f.write(b"".join(lines[max(first, len(lines) - keep_lines):]))
+                f.write(data[end:])
+            os.rename(journal_tmp, self.filepath)
+
+        self._head = None
+        self._offset = 0
+        self._index = JournalIndex()
+        self.update()
+        self.__save_index__()
+
+        return True
+
+    def __key_test__(self, version, test_name):
+        return "{},{}".format(version, test_name)
+
+    def count(self, operation, key):
+        return self._index.counts.get(operation, dict()).get(key, 0)
+
+    def deploy_count(self, version):
+        return self.count("deploy", version)
+
+    def deployed_count(self, version):
+        return self.count("deployed", version)
+
+    def test_count(self, version, test_name):
+        return self.count("test", self.__key_test__(version, test_name))
+
+    def tested_count(self, version, test_name):
+        return self.count("tested", self.__key_test__(version, test_name))
+
+    def completed_runs(self):
+        """
+        Returns a dictionary associating the name of every run file that got
+        completely tested to the time at which it completed.
+        """
+        return {result_file: timestamp
+                for (key, result_file), timestamp in self._index.tested.items()}
+
+    def cold_runs(self):
+        """
+        Returns the set of the run files that were the first ones of their
+        test after a deployment, and thus likely ran with cold caches. Runs
+        made after an unmeasured warm-up round are not part of it.
+        """
+        return self._index.cold
+
+    def has_deploy_markers(self):
+        """ Returns True if the journal recorded the deployment of versions """
+        return len(self._index.counts.get("deployed", dict())) > 0
+
+    def incomplete_tests(self):
         incomplete_tests = []
         result_file_set = set()
-        for key in self._journal["test"]:
-            for test_attrs in self._journal["test"][key]:
-                if "result_file" not in test_attrs:
-                    continue
+        for (key, result_file), test_attrs in self._index.open.items():
+            if result_file not in result_file_set:
+                incomplete_tests.append(test_attrs)
+                result_file_set.add(result_file)
 
-                found = False
-                if "tested" in self._journal and key in self._journal["tested"]:
-                    for tested_attrs in self._journal["tested"][key]:
-                        if "result_file" not in tested_attrs:
-                            continue
+        return incomplete_tests
 
-                        if test_attrs["result_file"] == tested_attrs["result_file"]:
-                            found = True
-                            break
+class ReportCache:
+    version = 1
 
-                # We did not find the same result file in the "tested" set,
-                # this means the run did not complete!
-                if not found and test_attrs["result_file"] not in result_file_set:
-                    incomplete_tests.append(test_attrs)
-                    result_file_set.add(test_attrs["result_file"])
+    def __init__(self, cache_path, base_path = ""):
+        """
+        Construct a snapshot of the parsed files of a report, stored in
+        $cache_path. Entries are keyed by file name and are only valid as long
+        as the size and modification time of all the files used to generate
+        them did not change.
 
-        return incomplete_tests
+        Args:
+            cache_path: The path to the file holding the snapshot, or None to
+                        keep the snapshot in memory
+            base_path: The folder the file names are relative to
+        """
+        self.cache_path = cache_path
+        self.base_path = base_path
+        self.file_stats = dict()
+
+        self._entries = dict()
+        self._dirty = False
+
+        if cache_path is None:
+            return
+
+        try:
+            with open(cache_path, 'rb') as f:
+                data = pickle.load(f)
+            if data.get("version", 0) == self.version:
+                self._entries = data["entries"]
+        except Exception:
+            pass
+
+    def __signature__(self, files):
+        signature = []
+        for f in files:
+            stat = self.file_stats.get(f, None)
+            if stat is None:
+                try:
+                    st = os.stat(os.path.join(self.base_path, f))
+                    stat = (st.st_size, st.st_mtime_ns)
+                except OSError:
+                    stat = None
+            signature.append((f, stat))
+        return tuple(signature)
+
+    def get(self, key, files):
+        """
+        Returns the value associated to $key, or None if it does not exist or
+        any of the $files changed since it got stored.
+        """
+        entry = self._entries.get(key, None)
+        if entry is None or entry[0] != self.__signature__(files):
+            return None
+        return entry[1]
+
+    def set(self, key, files, value):
+        """ Associate $value to $key, which has been generated from $files """
+        self._entries[key] = (self.__signature__(files), value)
+        self._dirty = True
+
+    def keys(self, folders):
+        """
+        Returns the keys of the entries stored in one of the $folders.
+        """
+        return [k for k in self._entries if "/" in k and k.split("/")[0] in folders]
+
+    def save(self, existing_files = None):
+        """
+        Write the snapshot back to the disk, if it changed. Entries whose key
+        is not in $existing_files are dropped.
+        """
+        if existing_files is not None:
+            for key in list(self._entries.keys()):
+                if key not in existing_files:
+                    del self._entries[key]
+                    self._dirty = True
+
+        if not self._dirty or self.cache_path is None:
+            return True
+
+        try:
+            cache_tmp = self.cache_path + ".tmp"
+            with open(cache_tmp, 'wb') as f:
+                pickle.dump({"version": self.version, "entries": self._entries},
+                            f, pickle.HIGHEST_PROTOCOL)
+            os.rename(cache_tmp, self.cache_path)
+            self._dirty = False
+            return True
+        except IOError:
+            return False
+
+class CommitsMetadataIndex:
+    version = 1
+
+    def __init__(self, index_path):
+        """
+        Construct the index of the metadata of the commits of a report, stored
+        in $index_path as JSON. The metadata of a commit never changes, so the
+        entries never get invalidated.
+
+        Args:
+            index_path: The path to the file holding the index, or None to
+                        keep the index in memory
+        """
+        self.index_path = index_path
+
+        self._entries = dict()
+        self._dirty = False
+
+        if index_path is None:
+            return
+
+        try:
+            with open(index_path, 'r') as f:
+                data = json.load(f)
+            if data.get("version", 0) == self.version:
+                self._entries = data["commits"]
+        except Exception:
+            pass
+
+    def get(self, sha1):
+        """ Returns the metadata of the commit $sha1, or None if not indexed """
+        return self._entries.get(sha1, None)
+
+    def set(self, sha1, metadata):
+        """ Index the $metadata of the commit $sha1 """
+        self._entries[sha1] = metadata
+        self._dirty = True
+
+    def save(self):
+        """ Write the index back to the disk, if it changed """
+        if not self._dirty or self.index_path is None:
+            return True
+
+        try:
+            index_tmp = self.index_path + ".tmp"
+            with open(index_tmp, 'w') as f:
+                json.dump({"version": self.version, "commits": self._entries}, f)
+            os.rename(index_tmp, self.index_path)
+            self._dirty = False
+            return True
+        except IOError:
+            return False
+
+class ComparisonsCache:
+    version = 1
+
+    def __init__(self, cache_path):
+        """
+        Construct the cache of the comparisons enhance_report() made between
+        the results of the commits and the ones of their parents, stored in
+        $cache_path. Entries are keyed by (result, parent, child) and are only
+        valid as long as the fingerprints of both results did not change.
+
+        Args:
+            cache_path: The path to the file holding the cache, or None to
+                        keep the cache in memory
+        """
+        self.cache_path = cache_path
+
+        self._entries = dict()
+        self._dirty = False
+
+        if cache_path is None:
+            return
+
+        try:
+            with open(cache_path, 'rb') as f:
+                data = pickle.load(f)
+            if data.get("version", 0) == self.version:
+                self._entries = data["entries"]
+        except Exception:
+            pass
+
+    def get(self, key, fingerprints):
+        """
+        Returns the comparison associated to $key, or None if it does not
+        exist or the results' $fingerprints changed since it got stored.
+        """
+        entry = self._entries.get(key, None)
+        if entry is None or entry[0] != fingerprints:
+            return None
+        return entry[1]
+
+    def set(self, key, fingerprints, comparison):
+        """ Associate $comparison to $key, made on results with $fingerprints """
+        entry = (fingerprints, comparison)
+        if self._entries.get(key, None) != entry:
+            self._entries[key] = entry
+            self._dirty = True
+
+    def keys(self):
+        """ Returns the keys of all the entries of the cache """
+        return list(self._entries.keys())
+
+    def save(self, existing_keys = None):
+        """
+        Write the cache back to the disk, if it changed. Entries whose key is
+        not in $existing_keys are dropped.
+        """
+        if existing_keys is not None:
+            for key in list(self._entries.keys()):
+                if key not in existing_keys:
+                    del self._entries[key]
+                    self._dirty = True
+
+        if not self._dirty or self.cache_path is None:
+            return True
+
+        try:
+            cache_tmp = self.cache_path + ".tmp"
+            with open(cache_tmp, 'wb') as f:
+                pickle.dump({"version": self.version, "entries": self._entries},
+                            f, pickle.HIGHEST_PROTOCOL)
+            os.rename(cache_tmp, self.cache_path)
+            self._dirty = False
+            return True
+        except IOError:
+            return False
+
+def commit_file_version(filename, versions):
+    """
+    Find the version a file of a report belongs to. Versions may contain '_'
+    and '.', so the longest of $versions followed by one of them is used.
+    Hidden files, such as the sidecars of the runs, belong to the version of
+    the file they are derived from.
+
+    Args:
+        filename: The name of the file
+        versions: The set of the versions of the report
+
+    Returns:
+        The version, or None if the file does not belong to any
+    """
+    if filename.startswith("."):
+        filename = filename[1:]
+
+    for i in range(len(filename) - 1, 0, -1):
+        if filename[i] in "_." and filename[:i] in versions:
+            return filename[:i]
+    return None
+
+def migrate_to_per_commit_layout(log_folder):
+    """
+    Move the files of every commit of a report to a folder named after the
+    commit. The report's lock is held during the migration, to prevent the
+    runner from writing to the report at the same time. Reports being parsed
+    concurrently still find all their files, as both layouts are supported.
+
+    Args:
+        log_folder: The folder containing the report
+
+    Returns:
+        The number of files moved
+    """
+    with open(os.path.join(log_folder, "commit_list"), "r") as f:
+        commits = set([l.split()[0] for l in f.readlines() if len(l.split()) > 0])
+
+    img_run_re = re.compile(r'_imgval_[^\.]+#\d+$')
+
+    moved = 0
+    with open(os.path.join(log_folder, "lock"), "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+
+        commit_files = dict()
+        for entry in os.scandir(log_folder):
+            if entry.is_dir():
+                continue
+            sha1 = commit_file_version(entry.name, commits)
+            if sha1 is not None:
+                commit_files.setdefault(sha1, []).append(entry.name)
+
+        # The images of imgval runs are stored next to the run files and get
+        # shared between the runs. Put a copy of them in every commit's folder
+        images = set()
+        for sha1, files in commit_files.items():
+            os.makedirs(os.path.join(log_folder, sha1), exist_ok=True)
+            for f in files:
+                if img_run_re.search(f) is None:
+                    continue
+                try:
+                    records = TestRun.parse_img_run(os.path.join(log_folder, f), "")
+                except ValueError:
+                    continue
+                for frame_file in [r[2] for r in records if r[0] == "img"]:
+                    dst = os.path.join(log_folder, sha1, os.path.basename(frame_file))
+                    if not os.path.exists(frame_file) or os.path.exists(dst):
+                        continue
+                    try:
+                        os.link(frame_file, dst)
+                    except OSError:
+                        shutil.copy2(frame_file, dst)
+                    images.add(frame_file)
+
+        for sha1, files in commit_files.items():
+            for f in files:
+                os.rename(os.path.join(log_folder, f), os.path.join(log_folder, sha1, f))
+                moved += 1
+
+        for image in images:
+            os.unlink(image)
+
+        # Tell the runner to use the per-commit layout from now on
+        with open(os.path.join(log_folder, "layout"), "w") as f:
+            f.write("per_commit\n")
+
+    return moved
+
+def _parse_report_shard(shard):
+    """
+    Parse the files of one commit, in a worker process.
+
+    Args:
+        shard: A tuple (log_folder, sidecars, items), where log_folder is the
+               absolute path of the log folder, sidecars is the report's
+               setting and items is a list of ("csv", testFile) or
+               ("run", testType, runFile, metricsFiles)
+
+    Returns:
+        A list of (key, files, value) to be added to the report's cache
+    """
+    log_folder, sidecars, items = shard
+
+    parsed = []
+    for item in items:
+        try:
+            if item[0] == "csv":
+                parsed.append((item[1], [item[1]], readCsv(os.path.join(log_folder, item[1]))))
+            else:
+                testType, runFile, metricsFiles = item[1:]
+                records = TestRun.parse_run_files(testType, runFile, metricsFiles,
+                                                  log_folder, sidecars)
+                parsed.append((runFile, [runFile] + metricsFiles, records))
+        except Exception:
+            # Let the parent process report the error when parsing it again
+            pass
+    return parsed
+
+class _EventsPickler(pickle.Pickler):
+    # Reference the report's objects by their name rather than copying them,
+    # for the events to point to the parent process' objects once loaded
+    def __init__(self, file, report, scm):
+        super().__init__(file, pickle.HIGHEST_PROTOCOL)
+        self.report = report
+        self.scm = scm
+
+    def persistent_id(self, obj):
+        if isinstance(obj, Commit):
+            return ("commit", obj.sha1)
+        elif isinstance(obj, SubTestResult):
+            return ("result", obj.commit.sha1, obj.test.full_name, obj.key)
+        elif isinstance(obj, Test):
+            return ("test", obj.full_name)
+        elif obj is self.report:
+            return ("report",)
+        elif obj is self.scm:
+            return ("scm",)
+        return None
+
+class _EventsUnpickler(pickle.Unpickler):
+    def __init__(self, file, report, scm):
+        super().__init__(file)
+        self.report = report
+        self.scm = scm
+
+    def persistent_load(self, pid):
+        if pid[0] == "commit":
+            return self.report.find_commit_by_id(pid[1])
+        elif pid[0] == "result":
+            commit = self.report.find_commit_by_id(pid[1])
+            return commit.results[pid[2]].result(pid[3])
+        elif pid[0] == "test":
+            return self.report._tests_index[pid[1]]
+        elif pid[0] == "report":
+            return self.report
+        elif pid[0] == "scm":
+            return self.scm
+        raise pickle.UnpicklingError("Unknown persistent id {}".format(pid))
+
+# The (report, scm, overlay) being enhanced, inherited by the forked workers
+# The report analysed by a worker process of enhance_report(), set by the
+# initializer of its pool. The processes calling enhance_report() never set it
+_enhanced_report = None
+
+def _init_enhance_report_worker(report, scm, overlay):
+    global _enhanced_report
+    _enhanced_report = (report, scm, overlay)
+
+def _enhance_report_shard(shard):
+    """
+    Run one step of the analysis of enhance_report() on a shard of results, in
+    a worker process.
+
+    Args:
+        shard: A tuple (method, args), where method is the name of the
+               report's method to call with the scm, the overlay and args
+
+    Returns:
+        The value returned by the method, and the events it created, pickled
+        with _EventsPickler
+    """
+    report, scm, overlay = _enhanced_report
+    method, args = shard
+
+    report.events = list()
+    ret = getattr(report, method)(scm, overlay, *args)
+
+    f = io.BytesIO()
+    _EventsPickler(f, report, scm).dump(report.events)
+    return ret, f.getvalue()
 
 class Report:
-    def __init__(self, log_folder, silentMode = False, restrict_to_commits = []):
+    def __init__(self, log_folder, silentMode = False, restrict_to_commits = [],
+                 use_cache = True, jobs = 1, lazy = False, scm = None,
+                 sidecars = False):
+        """
+        Parse a report.
+
+        Args:
+            log_folder: The folder containing the report
+            silentMode: Do not print the progress of the parsing
+            restrict_to_commits: Only parse these commits (sha1s or labels)
+            use_cache: Store the parsed files and the comparisons made by
+                       enhance_report() in the log folder, to speed up the
+                       following parsings and analyses
+            jobs: The number of processes used to parse the files and to
+                  analyse the results in enhance_report(). None uses as many
+                  processes as there are CPUs
+            lazy: Only read the runs' files when their results get accessed
+            scm: The repository of the tested project, used to get the
+                 metadata of the commits which are not indexed yet
+            sidecars: Store the parsed unified runs next to their run file,
+                      for them to be re-used by all the following parsings
+        """
         self.log_folder = log_folder
+        self.log_folder_path = os.path.abspath(log_folder)
         self.silentMode = silentMode
-        self.name = os.path.basename(os.path.abspath(log_folder))
+        self.name = os.path.basename(self.log_folder_path)
+        self.jobs = jobs if jobs is not None else multiprocessing.cpu_count()
+        self.lazy = lazy
+        self.scm = scm
+        self.sidecars = sidecars
+
+        self.journal = Journal(self.__path__("journal"))
+
+        if use_cache:
+            self.cache = ReportCache(self.__path__(".report_cache"), self.log_folder_path)
+        elif self.jobs > 1:
+            # The workers' results are handed over through the cache
+            self.cache = ReportCache(None, self.log_folder_path)
+        else:
+            self.cache = None
 
-        self.journal = Journal(self.log_folder + "/journal")
+        if use_cache:
+            self.commits_metadata = CommitsMetadataIndex(self.__path__(".commits_metadata"))
+            self.comparisons_cache = ComparisonsCache(self.__path__(".comparisons_cache"))
+        else:
+            self.commits_metadata = CommitsMetadataIndex(None)
+            self.comparisons_cache = ComparisonsCache(None)
 
         self.tests = list()
+        self._tests_index = dict()
         self.commits = list()
+        self._commits_index = dict()
+        self._labels_index = dict()
+        self.samples = SampleStore()
+        # Holds the subresults (and their type) found in the runs of every
+        # test, to allow detecting the missing results
+        self.subresults = dict()
+        self._columns = dict()
         self.notes = list()
         self.events = list()
 
         self._cached_walk = dict()
 
+        self.restrict_to_commits = restrict_to_commits
         self.__parse_report__(restrict_to_commits)
 
+    def __path__(self, filename):
+        # Never change the working directory, for reports to be parsed
+        # concurrently by multiple threads
+        return os.path.join(self.log_folder_path, filename)
+
     def __readNotes__(self):
         try:
-            with open("notes", 'rt') as f:
+            with open(self.__path__("notes"), 'rt') as f:
                 return f.readlines()
         except:
             return []
@@ -1450,7 +3220,7 @@ class Report:
     def __readCommitLabels__(self):
         labels = dict()
         try:
-            f = open( "commit_labels", "r")
+            f = open(self.__path__("commit_labels"), "r")
             try:
                 labelLines = f.readlines()
             finally:
@@ -1476,13 +3246,9 @@ class Report:
         sys.stdout.flush()
 
     def __parse_report__(self, restrict_to_commits):
-        # Save the current working directory and switch to the log folder
-        cwd = os.getcwd()
-        os.chdir(self.log_folder)
-
         # Look for the commit_list file
         try:
-            f = open( "commit_list", "r")
+            f = open(self.__path__("commit_list"), "r")
             try:
                 commitsLines = f.readlines()
             finally:
@@ -1502,42 +3268,90 @@ class Report:
 
         self.log("Listing the results' files", temporary=True)
 
-        # Find all the result files and sort them by sha1
-        files_list = os.listdir()
-        testFiles = dict()
+        # Index all the result files in one pass: the results of every commit,
+        # the runs of every result and the metrics files of every run. The
+        # files of a commit are either at the root of the log folder or in a
+        # sub-folder named after the commit (per-commit layout)
+        files_list = set()
+        file_stats = dict()
         testResults = dict()
+        runsIndex = dict()
+        metricsIndex = dict()
         commit_test_file_re = re.compile(r'^(.+)_(bench|unit|imgval|unified)_[^\.]+(.metrics_[^\.]+)?$')
+        run_file_re = re.compile(r'#\d+$')
         results_count = 0
-        for f in files_list:
-            if os.path.isdir(f):
+
+        commit_folders = dict()
+        for commitLine in commitsLines:
+            sha1 = commitLine.split()[0]
+            label = labels.get(sha1, sha1)
+            commit_folders[sha1] = (len(restrict_to_commits) == 0 or sha1 in restrict_to_commits
+                                    or label in restrict_to_commits)
+        skipped_folders = set()
+
+        def index_file(entry, f):
+            nonlocal results_count
+
+            m = commit_test_file_re.match(entry.name)
+            if m is None:
+                return
+            sha1, result_type, metrics_suffix = m.groups()
+
+            # Keep the stats of the files that could be cached
+            if self.cache is not None:
+                st = entry.stat()
+                file_stats[f] = (st.st_size, st.st_mtime_ns)
+
+            # Metrics files are attached to their run file
+            if metrics_suffix is not None:
+                runFile = f[:-len(metrics_suffix)]
+                metricsIndex.setdefault(runFile, []).append(f)
+                return
+
+            # Run files finish by #XX. Unified-formated results only have runs
+            testFile = f.split("#")[0]
+            if run_file_re.search(f) is not None:
+                runsIndex.setdefault(sha1, dict()).setdefault(testFile, []).append(f)
+                if result_type != "unified":
+                    return
+
+            commitResults = testResults.setdefault(sha1, dict())
+            if testFile not in commitResults:
+                commitResults[testFile] = result_type
+                results_count += 1
+
+        for entry in os.scandir(self.log_folder_path):
+            if not entry.is_dir():
+                files_list.add(entry.name)
+                index_file(entry, entry.name)
                 continue
-            m = commit_test_file_re.match(f)
-            if m is not None:
-                sha1 = m.groups()[0]
-                if sha1 not in testFiles:
-                    testFiles[sha1] = []
-                result_type = m.groups()[1]
-                testFiles[sha1].append((f, result_type))
-
-                 # Skip on unrelated files
-                if "." in f:
-                    continue
 
-                # Skip when the file is a run file (finishes by #XX)
-                if result_type != "unified" and re.search(r'#\d+$', f) is not None:
+            # Only list the folders of the commits we are interested in
+            wanted = commit_folders.get(entry.name, None)
+            if wanted is None:
+                continue
+            elif not wanted:
+                skipped_folders.add(entry.name)
+                continue
+            for sub_entry in os.scandir(entry.path):
+                if sub_entry.is_dir():
                     continue
+                f = entry.name + "/" + sub_entry.name
+                files_list.add(f)
+                index_file(sub_entry, f)
 
-                if sha1 not in testResults:
-                    testResults[sha1] = []
-                testResults[sha1].append((f, result_type))
-                results_count += 1
-        files_list = None
+        if self.cache is not None:
+            self.cache.file_stats = file_stats
 
         self.log("Found {} results across {} commits".format(results_count, len(commitsLines)))
 
+        if self.jobs > 1 and not self.lazy:
+            self.__parse_files_in_parallel__(commitsLines, labels, testResults,
+                                             runsIndex, metricsIndex,
+                                             restrict_to_commits)
+
         # Verify the state of the commits
-        ezbench_runner = Test("ezbench_runner")
-        self.tests.append(ezbench_runner)
+        ezbench_runner = self.__find_or_create_test__("ezbench_runner")
 
         # Gather all the information from the commits
         commits_txt = ""
@@ -1555,40 +3369,17 @@ class Report:
 
             # If there are no results, just continue
             if sha1 in testResults:
-                handled_tests = set()
-                for testFile, testType in testResults[sha1]:
-                    # Unified-formated runs should not have the # in their name
-                    testFile = testFile.split("#")[0]
-                    if testFile not in handled_tests:
-                        handled_tests.add(testFile)
-                    else:
-                        continue
-
+                for testFile, testType in testResults[sha1].items():
                     result_cur += 1
                     self.log("Reading result {}/{}".format(result_cur, results_count), temporary=True)
 
                     # Get the test name
-                    test_name = testFile[len(commit.sha1) + len(testType) + 2:]
+                    test_name = os.path.basename(testFile)[len(commit.sha1) + len(testType) + 2:]
+                    test = self.__find_or_create_test__(test_name)
 
-                    # Find the right Test or create one if none are found
-                    try:
-                        test = next(b for b in self.tests if b.full_name == test_name)
-                    except StopIteration:
-                        test = Test(test_name)
-                        self.tests.append(test)
-
-                    # Look for the runs
-                    run_re = re.compile(r'^{testFile}#[0-9]+$'.format(testFile=testFile))
-                    runsFiles = [f for f,t in testFiles[sha1] if run_re.search(f)]
-                    runsFiles.sort(key=lambda x: '{0:0>100}'.format(x).lower()) # Sort the runs in natural order
-
-                    # Look for metrics!
-                    metricsFiles = dict()
-                    for runFile in runsFiles:
-                        metricsFiles[runFile] = list()
-                        metrics_re = re.compile(r'^{}.metrics_.+$'.format(runFile))
-                        for metric_file in [f for f,t in testFiles[sha1] if metrics_re.search(f)]:
-                            metricsFiles[runFile].append(metric_file)
+                    # Look for the runs and their metrics
+                    runsFiles, metricsFiles = self.__list_runs__(runsIndex, metricsIndex,
+                                                                 sha1, testFile)
 
                     # Create the result object
                     try:
@@ -1609,28 +3400,281 @@ class Report:
             if len(commit.results) > 0 or commit.compil_exit_code != RunnerErrorCode.UNKNOWN:
                 result = TestResult(commit, ezbench_runner, "commit_result", None, None, None)
                 commit.results[result.test.full_name] = result
-                self.commits.append(commit)
+                self.__add_commit__(commit)
 
-        # Go through all the runs and add the missing results
-        for commit in self.commits:
-            for result in commit.results.values():
-                for run in result.runs:
-                    run.tag_missing_results()
+        # Go through all the runs and add the missing results. Lazy runs do it
+        # when they get loaded
+        if not self.lazy:
+            for commit in self.commits:
+                for result in commit.results.values():
+                    for run in result.runs:
+                        run.tag_missing_results()
 
         # Sort the list of tests
         self.tests = sorted(self.tests, key=lambda test: test.full_name)
 
-        # Read the notes before going back to the original folder
         notes = self.__readNotes__()
 
-        # Go back to the original folder
-        os.chdir(cwd)
+        # Save the snapshot of the parsed files for the next parsing, without
+        # forgetting about the folders of the commits we did not list
+        if self.cache is not None:
+            files_list.update(self.cache.keys(skipped_folders))
+            self.cache.save(files_list)
+        self.commits_metadata.save()
+
+    def __find_or_create_test__(self, test_name):
+        test = self._tests_index.get(test_name, None)
+        if test is None:
+            test = Test(test_name)
+            self.tests.append(test)
+            self._tests_index[test_name] = test
+        return test
+
+    def __list_runs__(self, runsIndex, metricsIndex, sha1, testFile):
+        runsFiles = list(runsIndex.get(sha1, dict()).get(testFile, []))
+        runsFiles.sort(key=lambda x: '{0:0>100}'.format(x).lower()) # Sort the runs in natural order
+
+        metricsFiles = dict()
+        for runFile in runsFiles:
+            metricsFiles[runFile] = sorted(metricsIndex.get(runFile, []))
+
+        return runsFiles, metricsFiles
+
+    def __parse_files_in_parallel__(self, commitsLines, labels, testResults,
+                                    runsIndex, metricsIndex, restrict_to_commits):
+        # Make one shard per commit, containing the files not found in the cache
+        shards = []
+        files_count = 0
+        for commitLine in commitsLines:
+            sha1 = commitLine.split()[0]
+            label = labels.get(sha1, sha1)
+            if (len(restrict_to_commits) > 0 and sha1 not in restrict_to_commits
+                and label not in restrict_to_commits):
+                continue
+
+            items = []
+            for testFile, testType in testResults.get(sha1, dict()).items():
+                if testType != "unified" and self.cache.get(testFile, [testFile]) is None:
+                    items.append(("csv", testFile))
 
-    def find_commit_by_id(self, sha1):
-        for commit in self.commits:
-            if commit.sha1 == sha1 or commit.full_sha1 == sha1:
+                runsFiles, metricsFiles = self.__list_runs__(runsIndex, metricsIndex,
+                                                             sha1, testFile)
+                for runFile in runsFiles:
+                    files = [runFile] + metricsFiles[runFile]
+                    if self.cache.get(runFile, files) is None:
+                        items.append(("run", testType, runFile, metricsFiles[runFile]))
+
+            if len(items) > 0:
+                shards.append((self.log_folder_path, self.sidecars, items))
+                files_count += len(items)
+
+        if files_count == 0:
+            return
+
+        self.log("Parsing {} files using {} processes".format(files_count, self.jobs),
+                 temporary=True)
+        with multiprocessing.Pool(min(self.jobs, len(shards))) as pool:
+            for parsed in pool.imap_unordered(_parse_report_shard, shards):
+                for key, files, value in parsed:
+                    self.cache.set(key, files, value)
+
+    def refresh(self):
+        """
+        Update the report with the runs that completed since it got parsed,
+        using the journal to find them rather than listing the log folder.
+
+        Returns:
+            True if the report changed, False otherwise
+        """
+        entries = self.journal.update()
+        if entries is None:
+            # The journal got truncated, start from scratch
+            self.tests = list()
+            self._tests_index = dict()
+            self.commits = list()
+            self._commits_index = dict()
+            self._labels_index = dict()
+            self.samples = SampleStore()
+            self.subresults = dict()
+            self._columns = dict()
+            self.events = list()
+            self._cached_walk = dict()
+            self.__parse_report__(self.restrict_to_commits)
+            return True
+        elif len(entries) == 0:
+            return False
+
+        # The files' stats gathered when listing the log folder are stale
+        if self.cache is not None:
+            self.cache.file_stats = dict()
+
+        try:
+            with open(self.__path__("commit_list"), "r") as f:
+                commitsLines = f.readlines()
+        except IOError:
+            return False
+        commits_order = dict()
+        full_names = dict()
+        for i, commitLine in enumerate(commitsLines):
+            fields = commitLine.split()
+            if len(fields) > 0:
+                commits_order[fields[0]] = i
+                full_names[fields[0]] = commitLine.strip(' \t\n\r')
+        labels = self.__readCommitLabels__()
+
+        ezbench_runner = self.__find_or_create_test__("ezbench_runner")
+        new_commits = dict()
+        def find_commit(version):
+            commit = self.find_commit_by_id(version)
+            if commit is None:
+                commit = new_commits.get(version, None)
+            if commit is not None or version not in commits_order:
                 return commit
-        return None
+
+            label = labels.get(version, version)
+            if (len(self.restrict_to_commits) > 0 and
+                version not in self.restrict_to_commits and
+                label not in self.restrict_to_commits):
+                return None
+
+            commit = Commit(self, version, full_names[version], label)
+            new_commits[version] = commit
+            return commit
+
+        commit_test_file_re = re.compile(r'^(.+)_(bench|unit|imgval|unified)_[^\.]+#[0-9]+$')
+        changed_results = set()
+        changed_commits = set()
+        for op, key, attrs in entries:
+            if op == "deploy" or op == "deployed":
+                commit = find_commit(key)
+                if commit is not None:
+                    commit.update_compil_exit_code(self)
+                    changed_commits.add(commit)
+                continue
+            elif op != "tested" or "result_file" not in attrs:
+                continue
+
+            m = commit_test_file_re.match(attrs["result_file"])
+            commit = find_commit(attrs["version"])
+            if m is None or commit is None:
+                continue
+            runFile = self.commit_file(commit.sha1, attrs["result_file"])
+            if not os.path.isfile(self.__path__(runFile)):
+                continue
+            testType = m.groups()[1]
+            testFile = runFile.split("#")[0]
+            test_name = os.path.basename(testFile)[len(commit.sha1) + len(testType) + 2:]
+
+            test = self.__find_or_create_test__(test_name)
+
+            metricsFiles = sorted([os.path.relpath(f, self.log_folder_path) for f in
+                                   glob.glob(glob.escape(self.__path__(runFile)) + ".metrics_*")])
+
+            try:
+                result = commit.results.get(test.full_name, None)
+                if result is None:
+                    result = TestResult(commit, test, testType, testFile,
+                                        [runFile], {runFile: metricsFiles})
+                    commit.results[test.full_name] = result
+                elif runFile not in [r.run_file for r in result.runs]:
+                    result.add_run(runFile, metricsFiles)
+                else:
+                    continue
+            except ValueError as e:
+                print(e)
+                continue
+            except Exception as e:
+                traceback.print_exc(file=sys.stderr)
+                sys.stderr.write("\n")
+                continue
+
+            commit.compil_exit_code = RunnerErrorCode.NO_ERROR
+            changed_results.add(result)
+            changed_commits.add(commit)
+
+        # Add the commits that got meaningful results, in the commit_list order
+        for commit in new_commits.values():
+            if len(commit.results) > 0 or commit.compil_exit_code != RunnerErrorCode.UNKNOWN:
+                self.__add_commit__(commit)
+            else:
+                changed_commits.discard(commit)
+        self.commits.sort(key=lambda c: commits_order.get(c.sha1, -1))
+
+        for commit in changed_commits:
+            commit.geom_mean_cache = -1
+            result = TestResult(commit, ezbench_runner, "commit_result", None, None, None)
+            commit.results[result.test.full_name] = result
+
+        for result in changed_results:
+            if not self.lazy:
+                for run in result.runs:
+                    run.tag_missing_results()
+            result._results_cache = dict()
+
+        self.tests = sorted(self.tests, key=lambda test: test.full_name)
+
+        if self.cache is not None:
+            self.cache.save()
+        self.commits_metadata.save()
+
+        return len(changed_commits) > 0
+
+    def commit_file(self, sha1, filename):
+        """
+        Find where a file of a commit is stored, whatever the layout of the
+        report.
+
+        Args:
+            sha1: The sha1 of the commit, as found in the commit_list
+            filename: The name of the file (for instance $sha1.patch)
+
+        Returns:
+            The path of the file, relative to the log folder. Files that do
+            not exist yet are expected at the root of the log folder
+        """
+        path = sha1 + "/" + filename
+        if os.path.exists(os.path.join(self.log_folder_path, path)):
+            return path
+        return filename
+
+    def intern_columns(self, keys):
+        """
+        Share the tuples of keys between all the runs of the report.
+
+        Args:
+            keys: A tuple of keys
+
+        Returns:
+            A tuple (keys, index), with index being a dictionary associating
+            every key to its position in the tuple
+        """
+        column = self._columns.get(keys, None)
+        if column is None:
+            keys = tuple([sys.intern(k) if type(k) is str else k for k in keys])
+            column = (keys, {k: i for i, k in enumerate(keys)})
+            self._columns[keys] = column
+        return column
+
+    def __add_commit__(self, commit):
+        self.commits.append(commit)
+        self._commits_index[commit.sha1] = commit
+        self._commits_index[commit.full_sha1] = commit
+        self._labels_index[commit.label] = commit
+
+    def find_commit_by_id(self, sha1):
+        """
+        Find a commit of the report from its sha1, full sha1 or label.
+
+        Args:
+            sha1: The sha1, full sha1 or label of the commit
+
+        Returns:
+            The Commit, or None if the report does not contain it
+        """
+        commit = self._commits_index.get(sha1, None)
+        if commit is None:
+            commit = self._labels_index.get(sha1, None)
+        return commit
 
     def find_result(self, commit, test):
         return commit.results.get(test.full_name, None)
@@ -1653,6 +3697,7 @@ class Report:
             count += 1
 
             full_sha1 = scm.full_version_name(commit.sha1)
+            self._commits_index.setdefault(full_sha1, commit)
             overlay.set_results(full_sha1, commit.results_set())
             g.set_results(full_sha1, commit.results_set())
 
@@ -1700,40 +3745,228 @@ class Report:
 
         return cached
 
-    def enhance_report(self, scm, max_variance = 0.025,
-                       min_diff_confidence = 0.99, smallest_perf_change=0.005,
-                       variance_min_run_count = 2):
-        # Find the oldest commit we have
-        now = datetime.now()
-        oldest_commit = now
-        for c in self.commits:
-            if c.commit_date < oldest_commit:
-                oldest_commit = c.commit_date
+    def compute_stats(self, alpha=0.95):
+        """
+        Compute the statistics of all the float results and metrics of the
+        report in one batch. They are then cached by the results.
 
-        # Compute the oldness factor of all the commits
-        biggest_timedelta = (now - oldest_commit)
-        for c in self.commits:
-            commit_timedelta = now - c.commit_date
-            c.oldness_factor = max(0.1, min(1, commit_timedelta / biggest_timedelta))
+        Args:
+            alpha: The probability that the confidence intervals contain the
+                   actual mean and standard deviation
+        """
+        liststats = []
+        for commit in self.commits:
+            for result in commit.results.values():
+                # The main value of the runs is accessed with the None key
+                for key in [None] + list(result.results()):
+                    subresult = result.result(key)
+                    if (subresult.value_type == BenchSubTestType.SUBTEST_FLOAT or
+                        subresult.value_type == BenchSubTestType.METRIC):
+                        liststats.append(subresult.to_liststat())
+        ListStats.compute_stats_batch(liststats, alpha)
+
+    def __enhance_report_check_bottoms__(self, scm, result, bottom_leaves, min_diff_confidence):
+        # Compare all the bottom leaves to see if they match, if they don't,
+        # then we need to add the merge base for testing!
+        bottoms = set(bottom_leaves)
+        first_bottom = bottoms.pop()
+        first_bottom_result = self.find_commit_by_id(first_bottom).result_by_name(result)
+
+        # completely ignore metrics for now
+        if first_bottom_result is None or first_bottom_result.value_type == BenchSubTestType.METRIC:
+            return
 
-        # Generate the overlay graph containing every commit with results for
-        # all the results we have.
-        overlay = self.overlay_graphs(scm)
+        diverge = False
+        for bottom in bottoms:
+            bottom_result = self.find_commit_by_id(bottom).result_by_name(result)
+            if bottom_result is None:
+                continue
 
-        # Compute the list of commits and set of results found on all the commits
-        results = set()
-        commits_list = []
-        for commit in self.commits:
-            results |= commit.results_set()
-            commits_list.append(commit.full_sha1)
+            diff, confidence = first_bottom_result.compare(bottom_result)
+            if confidence >= min_diff_confidence:
+                diverge = True
+                break
+
+        # We found an actual change,
+        if diverge:
+            merge_base = scm.merge_base(bottom_leaves)
+            for bottom in bottom_leaves:
+                bottom_result = self.find_commit_by_id(bottom).result_by_name(result)
+                self.events.append(EventDivergingBaseResult(bottom_result, merge_base))
+
+    def __enhance_report_compare_edge__(self, key, before, after, cached):
+        # Only the statistical comparisons are worth caching, the others are
+        # cheaper than computing the fingerprints
+        if after.value_type not in [BenchSubTestType.SUBTEST_FLOAT,
+                                    BenchSubTestType.SUBTEST_IMAGE]:
+            return after.compare(before)
+
+        fingerprints = (before.fingerprint(), after.fingerprint())
+        comparison = self.comparisons_cache.get(key, fingerprints)
+        if comparison is None:
+            comparison = after.compare(before)
+        cached[key] = (fingerprints, comparison)
+        return comparison
+
+    def __enhance_report_compare_edges__(self, overlay, result, cached):
+        # Compare the result of every commit to the ones of its parents in the
+        # overlay graph, stopping at the first metric like enhance_report
+        value_type = None
+        edges = dict()
+        for child in overlay.nodes():
+            if result not in overlay.results(child):
+                continue
+
+            after = self.find_commit_by_id(child).result_by_name(result)
+            if after is None or after.value_type == BenchSubTestType.METRIC:
+                break
 
-        # For all results, find what are the changes
+            value_type = after.value_type
+            for parent in overlay.parents(child):
+                if result not in overlay.edge_results(parent, child):
+                    continue
+                before = self.find_commit_by_id(parent).result_by_name(result)
+                edges[(parent, child)] = self.__enhance_report_compare_edge__((result, parent, child),
+                                                                              before, after, cached)
+
+        return value_type, edges
+
+    def __enhance_report_significance__(self, comparisons, min_diff_confidence, fdr):
+        significant = dict()
+        tests = []
+        p_values = []
+        for result, (value_type, edges) in comparisons.items():
+            significant[result] = dict()
+            for (parent, child), (diff, confidence) in edges.items():
+                significant[result][(parent, child)] = confidence >= min_diff_confidence
+
+                # Only the float and image results come from statistical tests
+                if value_type in [BenchSubTestType.SUBTEST_FLOAT,
+                                  BenchSubTestType.SUBTEST_IMAGE]:
+                    tests.append((result, (parent, child)))
+                    p_values.append(1 - confidence)
+
+        # Correct all the statistical tests at once to keep the rate of false
+        # discoveries under control
+        if fdr > 0:
+            selected = benjamini_hochberg(p_values, fdr)
+            for (result, edge), keep in zip(tests, selected):
+                significant[result][edge] = significant[result][edge] and bool(keep)
+
+        return significant
+
+    def __enhance_report_changepoints__(self, scm, overlay, result, variance_cache,
+                                        max_variance, min_diff_confidence,
+                                        smallest_perf_change):
+        # Order the commits having the result along the overlay graph
+        nodes = [scm.full_version_name(c.sha1) for c in self.commits]
+        nodes = [node for node in nodes if result in overlay.results(node)]
+        if len(nodes) == 0:
+            return False
+        parents = dict()
+        children = dict()
+        for node in nodes:
+            parents[node] = [p for p in overlay.parents(node)
+                             if result in overlay.edge_results(p, node)]
+            for parent in parents[node]:
+                children.setdefault(parent, []).append(node)
+
+        series = []
+        pending = {node: len(parents[node]) for node in nodes}
+        ready = deque([node for node in nodes if pending[node] == 0])
+        while len(ready) > 0:
+            node = ready.popleft()
+            series.append(node)
+            for child in children.get(node, []):
+                pending[child] -= 1
+                if pending[child] == 0:
+                    ready.append(child)
+
+        # Only the float results are handled, the others are compared pairwise
+        results = []
+        for node in series:
+            r = self.find_commit_by_id(node).result_by_name(result)
+            if r is None or r.value_type != BenchSubTestType.SUBTEST_FLOAT:
+                return False
+            self.__enhance_report_check_variance__(variance_cache, r, max_variance)
+            results.append(r)
+
+        # Commits without any sample cannot be part of the series
+        kept = [i for i in range(len(series)) if len(results[i].to_liststat().data) > 0]
+        series = [series[i] for i in kept]
+        results = [results[i] for i in kept]
+        position = {node: i for i, node in enumerate(series)}
+
+        changes = find_changepoints([r.to_liststat().data for r in results],
+                                    min_diff_confidence, smallest_perf_change)
+        for i, confidence in changes:
+            # Report the change from the closest parent, which is not
+            # necessarily the previous commit of the series on merges
+            child = series[i]
+            candidates = [p for p in parents[child] if position.get(p, i) < i]
+            if len(candidates) > 0:
+                parent = max(candidates, key=lambda p: position[p])
+            else:
+                parent = series[i - 1]
+
+            commit_parent = self.find_commit_by_id(parent)
+            commit_child = self.find_commit_by_id(child)
+            commit_graph = self.__enhance_report_cached_walk__(scm, [child], [parent])
+            commit_range = EventCommitRange(commit_parent, commit_child, commit_graph)
+            self.events.append(EventPerfChange(commit_range, results[position[parent]],
+                                               results[i], confidence))
+
+        bottom_leaves = [node for node in series if len(parents[node]) == 0]
+        if len(bottom_leaves) > 0:
+            self.__enhance_report_check_bottoms__(scm, result, bottom_leaves,
+                                                  min_diff_confidence)
+
+        return True
+
+    def __enhance_report_map__(self, pool, scm, overlay, method, args):
+        # Call the method on every shard, in the worker processes if there is
+        # a pool, and add the events in the order of the shards
+        if pool is not None:
+            shards = pool.imap(_enhance_report_shard, [(method, a) for a in args])
+        else:
+            shards = (getattr(self, method)(scm, overlay, *a) for a in args)
+
+        rets = []
+        for i, shard in enumerate(shards):
+            self.log("Analyse results: shard {}/{}".format(i + 1, len(args)),
+                     temporary=True)
+            if pool is not None:
+                ret, events = shard
+                self.events.extend(_EventsUnpickler(io.BytesIO(events), self, scm).load())
+            else:
+                ret = shard
+            rets.append(ret)
+
+        return rets
+
+    def __enhance_report_compare__(self, scm, overlay, results, detector,
+                                   max_variance, min_diff_confidence,
+                                   smallest_perf_change):
         variance_cache = dict()
-        count = 1
+        comparisons = dict()
+        cached = dict()
         for result in results:
-            self.log("Analyse result {}/{}".format(count, len(results)), temporary=True)
-            count += 1
+            if (detector == "changepoints" and
+                self.__enhance_report_changepoints__(scm, overlay, result, variance_cache,
+                                                     max_variance, min_diff_confidence,
+                                                     smallest_perf_change)):
+                continue
 
+            comparisons[result] = self.__enhance_report_compare_edges__(overlay, result,
+                                                                        cached)
+
+        return comparisons, cached
+
+    def __enhance_report_changes__(self, scm, overlay, comparisons, significant,
+                                   commits_list, max_variance, min_diff_confidence,
+                                   smallest_perf_change, variance_min_run_count):
+        variance_cache = dict()
+        for result, (value_type, edges) in comparisons.items():
             bottom_leaves = set(commits_list)
             for child in overlay.nodes():
                  # Skip if the result is not present on the current node
@@ -1782,8 +4015,8 @@ class Report:
                     variance_too_high_after = self.__enhance_report_check_variance__(variance_cache, after, max_variance)
 
                     # Compare the two data sets
-                    diff, confidence = after.compare(before)
-                    if confidence >= min_diff_confidence:
+                    diff, confidence = edges[(parent, child)]
+                    if significant[result][(parent, child)]:
                         if before.value_type == BenchSubTestType.SUBTEST_FLOAT:
                             if diff >= smallest_perf_change:
                                 potential_changes.append((parent, before, after, diff, confidence))
@@ -1845,33 +4078,130 @@ class Report:
                         elif before.value_type == BenchSubTestType.SUBTEST_COMMIT_RESULT:
                             self.events.append(EventBuildStatusChanged(commit_range))
 
-            # Now compare all the bottom leaves to see if they match, if they
-            # don't, then we need to add the merge base for testing!
-            bottoms = set(bottom_leaves)
-            first_bottom = bottoms.pop()
-            first_bottom_result = self.find_commit_by_id(first_bottom).result_by_name(result)
+            # Now compare all the bottom leaves to see if they match
+            self.__enhance_report_check_bottoms__(scm, result, bottom_leaves,
+                                                  min_diff_confidence)
 
-            # completely ignore metrics for now
-            if first_bottom_result is None or first_bottom_result.value_type == BenchSubTestType.METRIC:
-                continue
+    def enhance_report(self, scm, max_variance = 0.025,
+                       min_diff_confidence = 0.99, smallest_perf_change=0.005,
+                       variance_min_run_count = 2, detector = "pairwise",
+                       fdr = 0):
+        """
+        Look for the changes between the results of the commits, and for the
+        results that need more runs, and store them as events. The results are
+        analysed by as many processes as the report's jobs.
 
-            diverge = False
-            for bottom in bottoms:
-                bottom_result = self.find_commit_by_id(bottom).result_by_name(result)
-                if bottom_result is None:
-                    continue
+        Args:
+            scm: The SCM object of the repository the commits come from
+            max_variance: The margin of error above which more runs are needed
+            min_diff_confidence: The confidence needed to report a change
+            smallest_perf_change: The smallest relative change of performance
+                                  to report
+            variance_min_run_count: The minimum amount of runs of unit tests
+            detector: "pairwise" compares every commit to its parents in the
+                      overlay graph. "changepoints" looks for all the changes
+                      of a float result at once, along its whole history,
+                      which also catches gradual drifts
+            fdr: When set, the false discovery rate the changes of the float
+                 and image results must stay under. The p-values of all their
+                 comparisons are then corrected at once with the
+                 Benjamini-Hochberg procedure, on top of min_diff_confidence
 
-                diff, confidence = first_bottom_result.compare(bottom_result)
-                if confidence >= min_diff_confidence:
-                    diverge = True
-                    break
+        Returns:
+            The overlay graph of the results
+        """
+        # Start from a clean slate, in case the report got refreshed
+        self.events = list()
+
+        # Find the oldest commit we have
+        now = datetime.now()
+        oldest_commit = now
+        for c in self.commits:
+            if c.commit_date < oldest_commit:
+                oldest_commit = c.commit_date
 
-            # We found an actual change,
-            if diverge:
-                merge_base = scm.merge_base(bottom_leaves)
-                for bottom in bottom_leaves:
-                    bottom_result = self.find_commit_by_id(bottom).result_by_name(result)
-                    self.events.append(EventDivergingBaseResult(bottom_result, merge_base))
+        # Compute the oldness factor of all the commits
+        biggest_timedelta = (now - oldest_commit)
+        for c in self.commits:
+            commit_timedelta = now - c.commit_date
+            c.oldness_factor = max(0.1, min(1, commit_timedelta / biggest_timedelta))
+
+        # Generate the overlay graph containing every commit with results for
+        # all the results we have.
+        overlay = self.overlay_graphs(scm)
+
+        # Compute the statistics of all the results at once
+        self.compute_stats()
+
+        # Compute the list of commits and set of results found on all the commits
+        results = set()
+        commits_list = []
+        for commit in self.commits:
+            results |= commit.results_set()
+            commits_list.append(commit.full_sha1)
+
+        # Sort the results for the events to be in the same order whether the
+        # analysis is sharded across processes or not
+        results = sorted(results)
+        jobs = min(self.jobs, len(results))
+        if "fork" not in multiprocessing.get_all_start_methods():
+            jobs = 1
+        if jobs > 1:
+            # Make a few shards per process to balance the load
+            size = max(1, math.ceil(len(results) / (jobs * 4)))
+            shards = [results[i:i + size] for i in range(0, len(results), size)]
+        else:
+            shards = [results]
+
+        pool = None
+        try:
+            if jobs > 1:
+                # The workers inherit the report, the overlay and the samples
+                # instead of getting a copy of them. They are given to every
+                # pool, for concurrent analyses not to share any state
+                self.log("Analyse {} results using {} processes".format(len(results), jobs),
+                         temporary=True)
+                pool = multiprocessing.get_context("fork").Pool(jobs,
+                                                                initializer=_init_enhance_report_worker,
+                                                                initargs=(self, scm, overlay))
+
+            # For all results, compare every commit to its parents, re-using
+            # the comparisons of the results which did not change
+            comparisons = dict()
+            cached = dict()
+            args = [(shard, detector, max_variance, min_diff_confidence,
+                     smallest_perf_change) for shard in shards]
+            for ret in self.__enhance_report_map__(pool, scm, overlay,
+                                                   "__enhance_report_compare__", args):
+                comparisons.update(ret[0])
+                cached.update(ret[1])
+
+            # Keep the comparisons of the results handled by the changepoint
+            # detector, only dropping the ones of the edges that disappeared
+            for key, (fingerprints, comparison) in cached.items():
+                self.comparisons_cache.set(key, fingerprints, comparison)
+            self.comparisons_cache.save([key for key in self.comparisons_cache.keys()
+                                         if key[0] in overlay.edge_results(key[1], key[2])])
+
+            # Decide which of the differences are significant
+            significant = self.__enhance_report_significance__(comparisons,
+                                                               min_diff_confidence,
+                                                               fdr)
+
+            # For all results, find what are the changes
+            args = []
+            for shard in shards:
+                shard = [result for result in shard if result in comparisons]
+                args.append(({r: comparisons[r] for r in shard},
+                             {r: significant[r] for r in shard},
+                             commits_list, max_variance, min_diff_confidence,
+                             smallest_perf_change, variance_min_run_count))
+            self.__enhance_report_map__(pool, scm, overlay,
+                                        "__enhance_report_changes__", args)
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
 
         return overlay
 
@@ -454,6 +454,31 @@ class GitRepo:
         except:
             return version
 
+    def commit_infos(self, version):
+        """
+        Return the information about a version, as found in its commit.
+
+        Args:
+            version: a valid version name
+
+        Returns:
+            A dictionary with the full_sha1, author, author_date, commiter,
+            commit_date and message of the commit, or None if the version
+            cannot be found. The dates are timestamps.
+        """
+
+        try:
+            commit = self.repo.revparse_single(version).peel(pygit2.Commit)
+        except:
+            return None
+
+        return {"full_sha1": str(commit.id),
+                "author": "{} <{}>".format(commit.author.name, commit.author.email),
+                "author_date": commit.author.time,
+                "commiter": "{} <{}>".format(commit.committer.name, commit.committer.email),
+                "commit_date": commit.committer.time,
+                "message": commit.message}
+
     def list_versions(self, head="HEAD", restrict_to_commits=[]):
         """
         List all the versions accessible from $head, limited to versions found
@@ -692,6 +717,19 @@ class NoRepo:
 
         return version
 
+    def commit_infos(self, version):
+        """
+        Return the information about a version, as found in its commit.
+
+        Args:
+            version: a valid version name
+
+        Returns:
+            None, as there is no repository to look into
+        """
+
+        return None
+
     def walk(self, heads, ignores):
         """
         Return a DAG containing all the versions accessible from all versions
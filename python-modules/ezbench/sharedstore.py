@@ -0,0 +1,397 @@
+"""
+Copyright (c) 2017, Intel Corporation
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+    * Redistributions of source code must retain the above copyright notice,
+      this list of conditions and the following disclaimer.
+    * Redistributions in binary form must reproduce the above copyright
+      notice, this list of conditions and the following disclaimer in the
+      documentation and/or other materials provided with the distribution.
+    * Neither the name of Intel Corporation nor the names of its contributors
+      may be used to endorse or promote products derived from this software
+      without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE
+FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+
+import hashlib
+import shutil
+import fcntl
+import glob
+import json
+import time
+import re
+import sys
+import os
+
+ezbench_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+sys.path.append(os.path.join(ezbench_dir, 'utils', 'env_dump'))
+
+from ezbench.report import Test
+from env_dump_parser import EnvDumpReport
+
+class SharedStore:
+    # The entries of the environment dumps that differ from one run to another
+    # even though nothing changed
+    volatile_env_keys = ['^DATE', '^THROTTLING', '^EXIT',
+                         r'^ENV\.ENV_DUMP_FILE', r'^ENV\.ENV_DUMP_METRIC_FILE',
+                         r'^ENV\.EZBENCH_CONF_.*\.key$', r'^ENV\.(OLD)?PWD$',
+                         '_PID', 'SHA1$', r'\.pid$', 'X\'s pid$',
+                         'extension count$', 'window id$']
+
+    # The files derived from a run by the reports, which are not part of it
+    derived_suffixes = [".records"]
+
+    # Image validation runs reference images that are not part of their files
+    test_types = ["bench", "unit", "unified"]
+
+    # Runs are stored under their sha1, next to the info.json and patch files
+    run_digest_re = re.compile(r'^[0-9a-f]{40}$')
+
+    def __init__(self, path):
+        """
+        Construct a store of the runs made by all the reports, allowing a
+        report to import the runs another report already made instead of
+        executing them again.
+
+        Runs are grouped by profile, version, test and environment fingerprint
+        then stored under the sha1 of their content, so publishing the same run
+        twice does not duplicate it. Reports keep track of the runs they
+        published or imported in their 'shared_store' file.
+
+        Args:
+            path: The folder containing the store
+        """
+        self.path = path
+
+    @classmethod
+    def env_fingerprint(cls, env_file):
+        """
+        Compute the fingerprint of the environment a run got executed in,
+        ignoring the volatile information.
+
+        Args:
+            env_file: The path to the .env_dump file of the run
+
+        Returns:
+            The fingerprint, as a string
+        """
+        if not os.path.isfile(env_file):
+            return "no_env_dump"
+
+        env = EnvDumpReport(env_file, False)
+        entries = sorted([repr(e) for e in env.to_set(cls.volatile_env_keys)])
+        return hashlib.sha1("\n".join(entries).encode()).hexdigest()
+
+    def __entry_path__(self, profile, version, test, fingerprint):
+        key = "\n".join([profile, version, test, fingerprint])
+        key = hashlib.sha1(key.encode()).hexdigest()
+        return os.path.join(self.path, key[:2], key)
+
+    def __latest_path__(self, profile, test):
+        key = hashlib.sha1("\n".join([profile, test]).encode()).hexdigest()
+        return os.path.join(self.path, "latest", key)
+
+    def __read_latest__(self, profile, test):
+        try:
+            with open(self.__latest_path__(profile, test), "r") as f:
+                timestamp, fingerprint = f.read().split()
+                return float(timestamp), fingerprint
+        except (IOError, ValueError):
+            return None
+
+    @classmethod
+    def __write__(cls, path, data):
+        tmp = "{}.{}.tmp".format(path, os.getpid())
+        with open(tmp, "w") as f:
+            f.write(data)
+        os.rename(tmp, path)
+
+    @classmethod
+    def __copy__(cls, src, dst):
+        tmp = "{}.{}.tmp".format(dst, os.getpid())
+        shutil.copyfile(src, tmp)
+        os.rename(tmp, dst)
+
+    @classmethod
+    def __tracked_runs__(cls, report):
+        tracked = dict()
+        try:
+            with open(os.path.join(report.log_folder_path, "shared_store"), "r") as f:
+                for line in f:
+                    try:
+                        run_file, digest, test, fingerprint, timestamp = json.loads(line)
+                    except ValueError:
+                        continue
+                    tracked[run_file] = (digest, test, fingerprint, timestamp)
+        except IOError:
+            pass
+        return tracked
+
+    @classmethod
+    def __track_run__(cls, report, run_file, digest, test, fingerprint, timestamp):
+        with open(os.path.join(report.log_folder_path, "shared_store"), "a") as f:
+            f.write(json.dumps([run_file, digest, test, fingerprint, timestamp]) + "\n")
+
+    @classmethod
+    def __run_files__(cls, run_path):
+        # The metrics, environment and outputs of a run share its name
+        files = []
+        for f in sorted(glob.glob(glob.escape(run_path) + ".*")):
+            suffix = f[len(run_path):]
+            if suffix not in cls.derived_suffixes and not suffix.endswith(".tmp"):
+                files.append((suffix, f))
+        return files
+
+    @classmethod
+    def __run_digest__(cls, run_path, run_files):
+        h = hashlib.sha1()
+        for suffix, path in [("", run_path)] + run_files:
+            h.update(suffix.encode())
+            with open(path, "rb") as f:
+                h.update(f.read())
+        return h.hexdigest()
+
+    def publish(self, report, profile, scm):
+        """
+        Add the completed runs of a report that are not in the store yet.
+
+        Args:
+            report: The Report to publish the runs of
+            profile: The profile used by the report
+            scm: The GitRepo or NoRepo of the report
+
+        Returns:
+            The number of runs added to the store
+        """
+        tracked = self.__tracked_runs__(report)
+        completed = report.journal.completed_runs()
+
+        published = 0
+        latest = dict()
+        for commit in report.commits:
+            version = scm.full_version_name(commit.sha1)
+            for result in commit.results.values():
+                if result.test_type not in self.test_types:
+                    continue
+                test = result.test.full_name
+
+                for run in result.runs:
+                    name = os.path.basename(run.run_file)
+                    if name in tracked or name not in completed:
+                        continue
+
+                    run_path = os.path.join(report.log_folder_path, run.run_file)
+                    run_files = self.__run_files__(run_path)
+                    fingerprint = self.env_fingerprint(run_path + ".env_dump")
+                    digest = self.__run_digest__(run_path, run_files)
+
+                    entry = self.__entry_path__(profile, version, test, fingerprint)
+                    if not os.path.exists(os.path.join(entry, digest)):
+                        self.__add_run__(entry, report, commit, result, run, digest,
+                                         run_files, {"profile": profile,
+                                                     "version": version,
+                                                     "test": test,
+                                                     "test_type": result.test_type,
+                                                     "fingerprint": fingerprint})
+                        published += 1
+
+                    self.__track_run__(report, name, digest, test, fingerprint,
+                                       completed[name])
+                    if latest.get(test, (0, None))[0] < completed[name]:
+                        latest[test] = (completed[name], fingerprint)
+
+        # Remember the latest environment every test got run in
+        for test, (timestamp, fingerprint) in latest.items():
+            stored = self.__read_latest__(profile, test)
+            if stored is None or stored[0] < timestamp:
+                path = self.__latest_path__(profile, test)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                self.__write__(path, "{} {}".format(timestamp, fingerprint))
+
+        return published
+
+    def __add_run__(self, entry, report, commit, result, run, digest, run_files, info):
+        os.makedirs(entry, exist_ok=True)
+
+        info_path = os.path.join(entry, "info.json")
+        if not os.path.exists(info_path):
+            info["title"] = commit.full_name[len(commit.sha1):].strip()
+            info["header"] = None
+            if result.test_type != "unified":
+                with open(os.path.join(report.log_folder_path, result.test_file), "r") as f:
+                    info["header"] = f.readline().rstrip("\n")
+            self.__write__(info_path, json.dumps(info))
+
+        patch_path = os.path.join(entry, "patch")
+        if commit.patch is not None and not os.path.exists(patch_path):
+            self.__copy__(os.path.join(report.log_folder_path, commit.patch), patch_path)
+
+        for suffix, path in run_files:
+            self.__copy__(path, os.path.join(entry, digest + suffix))
+
+        # The value the runner adds to the test file at the end of every run
+        if result.test_type == "bench":
+            self.__write__(os.path.join(entry, digest + ".value"), str(run.main_value))
+        elif result.test_type == "unit":
+            with open(os.path.join(report.log_folder_path, run.run_file), "r") as f:
+                self.__write__(os.path.join(entry, digest + ".value"), f.readline().strip())
+
+        # The run file gets written last, as it marks the run as complete
+        self.__copy__(os.path.join(report.log_folder_path, run.run_file),
+                      os.path.join(entry, digest))
+
+    def import_runs(self, report, profile, scm, task_trees):
+        """
+        Import the runs of the store matching the tasks of a report. Runs
+        match when they got made using the same profile, version and test,
+        in the environment the report last ran the test in (or any report, if
+        the report never ran it).
+
+        The runs of the report should be published first, for the report to
+        know about the environment it last ran every test in.
+
+        Args:
+            report: The Report to import the runs in
+            profile: The profile used by the report
+            scm: The GitRepo or NoRepo of the report
+            task_trees: The list of task trees of the report, from which the
+                        runs already found in the report got removed
+
+        Nothing gets imported if the report is locked by the runner, as the
+        runs get added to its journal and files.
+
+        Returns:
+            The number of runs imported
+        """
+        try:
+            lock = open(os.path.join(report.log_folder_path, "lock"), "a")
+        except IOError:
+            return 0
+
+        with lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except (IOError, OSError):
+                return 0
+
+            return self.__import_runs__(report, profile, scm, task_trees)
+
+    def __import_runs__(self, report, profile, scm, task_trees):
+        tracked = self.__tracked_runs__(report)
+        digests = set([t[0] for t in tracked.values()])
+
+        fingerprints = dict()
+        for digest, test, fingerprint, timestamp in sorted(tracked.values(),
+                                                           key=lambda t: t[3]):
+            fingerprints[test] = fingerprint
+
+        # Find how many runs are wanted for every test of every version
+        rounds = dict()
+        for task_tree in task_trees:
+            for version in task_tree:
+                for full_name, task in task_tree[version]["tests"].items():
+                    key = (version, full_name)
+                    rounds[key] = rounds.get(key, 0) + task["rounds"]
+        wanted = dict()
+        for (version, full_name), count in rounds.items():
+            basename, subtests, metric = Test.parse_name(full_name)
+            wanted[(version, basename)] = max(wanted.get((version, basename), 0), count)
+
+        try:
+            with open(os.path.join(report.log_folder_path, "commit_list"), "r") as f:
+                versions = set([l.split()[0] for l in f.readlines() if len(l.split()) > 0])
+        except IOError:
+            versions = set()
+
+        imported = 0
+        for (version, test), count in sorted(wanted.items()):
+            fingerprint = fingerprints.get(test, None)
+            if fingerprint is None:
+                latest = self.__read_latest__(profile, test)
+                if latest is None:
+                    continue
+                fingerprint = latest[1]
+
+            entry = self.__entry_path__(profile, scm.full_version_name(version),
+                                        test, fingerprint)
+            try:
+                with open(os.path.join(entry, "info.json"), "r") as f:
+                    info = json.load(f)
+            except (IOError, ValueError):
+                continue
+
+            # Name the files like the runner would
+            commit = report.find_commit_by_id(version)
+            sha1 = commit.sha1 if commit is not None else info["version"]
+            if sha1 not in versions:
+                with open(os.path.join(report.log_folder_path, "commit_list"), "a") as f:
+                    f.write("{} {}\n".format(sha1, info["title"]))
+                versions.add(sha1)
+
+            runs = sorted([f for f in os.listdir(entry)
+                           if self.run_digest_re.match(f) is not None and f not in digests])
+            for digest in runs[:count]:
+                self.__import_run__(report, sha1, entry, info, digest)
+                digests.add(digest)
+                imported += 1
+
+        return imported
+
+    def __import_run__(self, report, sha1, entry, info, digest):
+        folder = report.log_folder_path
+        try:
+            with open(os.path.join(folder, "layout"), "r") as f:
+                if f.read().strip() == "per_commit":
+                    folder = os.path.join(folder, sha1)
+                    os.makedirs(folder, exist_ok=True)
+        except IOError:
+            pass
+
+        patch_path = os.path.join(entry, "patch")
+        if (os.path.exists(patch_path) and not
+            os.path.exists(os.path.join(report.log_folder_path,
+                                        report.commit_file(sha1, sha1 + ".patch")))):
+            self.__copy__(patch_path, os.path.join(folder, sha1 + ".patch"))
+
+        test_file = "{}_{}_{}".format(sha1, info["test_type"], info["test"])
+        run = 0
+        while os.path.exists(os.path.join(folder, "{}#{}".format(test_file, run))):
+            run += 1
+        run_file = "{}#{}".format(test_file, run)
+
+        journal = os.path.join(report.log_folder_path, "journal")
+        with open(journal, "a") as f:
+            f.write("{:.6f},test,{},{},{}\n".format(time.time(), sha1, info["test"], run_file))
+
+        for f in os.listdir(entry):
+            if f.startswith(digest + ".") and not f.endswith(".value") and not f.endswith(".tmp"):
+                self.__copy__(os.path.join(entry, f),
+                              os.path.join(folder, run_file + f[len(digest):]))
+        self.__copy__(os.path.join(entry, digest), os.path.join(folder, run_file))
+
+        with open(journal, "a") as f:
+            f.write("{:.6f},tested,{},{},{}\n".format(time.time(), sha1, info["test"], run_file))
+
+        if info["test_type"] != "unified":
+            test_path = os.path.join(folder, test_file)
+            with open(test_path, "a") as f:
+                if f.tell() == 0:
+                    f.write(info["header"] + "\n")
+                with open(os.path.join(entry, digest + ".value"), "r") as v:
+                    f.write(v.read().strip() + "\n")
+
+        self.__track_run__(report, run_file, digest, info["test"], info["fingerprint"],
+                           time.time())
@@ -52,6 +52,7 @@ sys.path.append(os.path.join(ezbench_dir, 'timing_DB'))
 
 from ezbench.testset import *
 from ezbench.report import *
+from ezbench.sharedstore import *
 from ezbench.runner import *
 from timing import *
 
@@ -181,18 +182,24 @@ class TaskEntry:
 
 class SmartEzbenchAttributes(Enum):
     event_min_confidence = 1
+    event_fdr = 2
 
     schedule_max_commits = 100
 
     perf_min_change = 200
+    perf_changepoints = 201
 
     variance_max = 300
     variance_max_run_count = 301
     variance_min_run_count = 302
+    variance_sequential = 303
 
     report_priority = 400
     report_deadline_soft = 401
     report_deadline_hard = 402
+    report_jobs = 403
+
+    shared_store = 500
 
 class StateLock:
     def __init__(self, lock_path):
@@ -425,7 +432,13 @@ class SmartEzbench:
             self.state['user_data'] = dict()
             upgraded = True
 
-        latest_version = 4
+        if self.state.get("version", 0) == 4:
+            self.__log(Criticality.II, "state: v4 -> v5: create a new 'characterize' section for tasks")
+            self.state['version'] = 5
+            self.state['tasks']['characterize'] = dict()
+            upgraded = True
+
+        latest_version = 5
         if self.state.get("version", 0) > latest_version:
             msg = "The state's version is higher than the latest supported version: {} vs {}"
             raise ValueError(msg.format(self.state.get("version", 0), latest_version))
@@ -704,6 +717,10 @@ class SmartEzbench:
         return rounds_new
 
     def add_test(self, commit, test, rounds = None, user_requested=True):
+        # Size the rounds using the variance characterization of the test
+        if rounds is None:
+            rounds = self.predicted_rounds(test, 3)
+
         self.__reload_state(keep_lock=True)
         total_rounds = 0
         try:
@@ -715,7 +732,18 @@ class SmartEzbench:
             self.__release_lock()
         return total_rounds
 
-    def add_testset(self, commit, testset, rounds = 1, ensure=False, user_requested=True):
+    def add_testset(self, commit, testset, rounds = None, ensure=False, user_requested=True):
+        # Without an explicit number of rounds, use the variance
+        # characterization of the tests, or the testset's rounds otherwise
+        test_rounds = dict()
+        if rounds is None:
+            predictor = self.__rounds_predictor__()
+        for test in testset.keys():
+            if rounds is None:
+                test_rounds[test] = predictor(test, testset[test])
+            else:
+                test_rounds[test] = testset[test] * rounds
+
         self.__reload_state(keep_lock=True)
 
         try:
@@ -724,11 +752,11 @@ class SmartEzbench:
 
             for test in sorted(testset.keys()):
                 if not ensure:
-                    self.__add_test_unlocked__(commit, test, testset[test] * rounds,
+                    self.__add_test_unlocked__(commit, test, test_rounds[test],
                                                user_requested)
                 else:
                     self.__force_test_rounds_unlocked__(commit, test,
-                                                        testset[test] * rounds,
+                                                        test_rounds[test],
                                                         user_requested)
 
             self.__save_state()
@@ -778,12 +806,85 @@ class SmartEzbench:
 
         return ret
 
+    def characterize_test(self, commit, test, runs = 100):
+        """
+        Run a test many times on the same version to characterize its
+        variance. Once all the runs are done, its coefficient of variation
+        and how many runs it needs to warm up get stored in the timings
+        database, for the current profile. They are then used to predict the
+        rounds of this test when adding it without specifying any.
+
+        Args:
+            commit: The version to run the test on
+            test: The name of the test
+            runs: The number of runs to make
+        """
+        self.__reload_state(keep_lock=True)
+        try:
+            self.__log(Criticality.II, "Characterize the variance of the test {} ({} runs)".format(test, runs))
+
+            scm = self.repo()
+            if scm is not None:
+                commit = scm.full_version_name(commit)
+
+            added = self.__force_test_rounds_unlocked__(commit, test, runs)
+            characterize = self.state['tasks']['characterize']
+            characterize.setdefault(commit, dict())[test] = runs
+
+            if (added > 0 and
+                self.__running_mode_unlocked__(check_running=False) == RunningMode.DONE):
+                self.__set_running_mode_unlocked__(RunningMode.RUN)
+
+            self.__save_state()
+        finally:
+            self.__release_lock()
+
+    def predicted_rounds(self, test, default = None):
+        """
+        Predict how many rounds of a test are needed to get a margin of error
+        under variance_max, based on its variance characterization.
+
+        Args:
+            test: The name of the test
+            default: The value to return if the test has not been
+                     characterized on the current profile
+
+        Returns:
+            The number of rounds, within the variance_min_run_count and
+            variance_max_run_count limits
+        """
+        return self.__rounds_predictor__()(test, default)
+
+    def __rounds_predictor__(self):
+        # Read the timings database and the attributes once, for the returned
+        # function to predict the rounds of many tests cheaply
+        db = TimingsDB(self.ezbench_dir + "/timing_DB")
+        profile = self.profile()
+        max_variance = self.attribute("variance_max")
+        min_run_count = int(self.attribute("variance_min_run_count"))
+        max_run_count = int(self.attribute("variance_max_run_count"))
+
+        def predictor(test, default = None):
+            basename, subtests, metric = Test.parse_name(test)
+            variance = db.variance(profile, basename)
+            if variance is None:
+                return default
+
+            rounds = variance["warmup_runs"]
+            if variance["cv"] > 0:
+                rounds += samples_needed(variance["cv"], max_variance)
+            rounds = max(rounds, min_run_count)
+            return min(rounds, max_run_count)
+
+        return predictor
+
     def reset_work(self):
         self.__reload_state(keep_lock=True)
         try:
             self.__log(Criticality.II, "Reset the queued work")
             self.state['tasks']['user']['commits'] = dict()
             self.state['tasks']['auto']['commits'] = dict()
+            self.state['tasks']['characterize'] = dict()
             self.__save_state()
         finally:
             self.__release_lock()
@@ -939,18 +1040,32 @@ class SmartEzbench:
     @classmethod
     def __remove_existing_tasks_from_tree(cls, report, task_tree_user, task_tree_auto):
         for commit in report.commits:
-            for result in commit.results.values():
-                for key in result.results():
-                    full_name = Test.partial_name(result.test.full_name, [key])
+            # Only look at the results of the tasks, to avoid loading all the
+            # runs of a lazy report
+            full_names = set()
+            for task_tree in [task_tree_user, task_tree_auto]:
+                if commit.full_sha1 in task_tree:
+                    full_names |= set(task_tree[commit.full_sha1]["tests"].keys())
+
+            for full_name in full_names:
+                basename, subtests, metric = Test.parse_name(full_name)
+                result = commit.results.get(basename, None)
+                if result is None or metric is not None:
+                    continue
 
-                    rounds_found = len(result.result(key))
-                    user_rounds = SmartEzbench.__remove_task_from_tasktree__(task_tree_user, commit.full_sha1, full_name, rounds_found)
+                key = "|".join(subtests)
+                if ((key != "" or result.test_type != "bench") and
+                    key not in result.results()):
+                    continue
 
-                    SmartEzbench.__remove_task_from_tasktree__(task_tree_auto, commit.full_sha1, full_name, rounds_found - user_rounds)
+                rounds_found = result.run_count(key)
+                user_rounds = SmartEzbench.__remove_task_from_tasktree__(task_tree_user, commit.full_sha1, full_name, rounds_found)
+
+                SmartEzbench.__remove_task_from_tasktree__(task_tree_auto, commit.full_sha1, full_name, rounds_found - user_rounds)
 
 
     @classmethod
-    def __generate_task_and_events_list__(cls, q, state, log_folder, scm):
+    def __generate_task_and_events_list__(cls, q, state, log_folder, scm, shared_store_path = None):
         exit_code = 1
         task_tree_user = list()
         task_tree_auto = list()
@@ -962,7 +1077,7 @@ class SmartEzbench:
         try:
             # Generate the report, order commits based on the git history
             try:
-                report = Report(log_folder, silentMode = True)
+                report = Report(log_folder, silentMode = True, lazy = True)
             except Exception as e:
                 traceback.print_exc(file=sys.stderr)
                 sys.stderr.write("\n")
@@ -978,6 +1093,22 @@ class SmartEzbench:
             task_tree_auto = copy.deepcopy(state['tasks']['auto']['commits'])
             cls.__remove_existing_tasks_from_tree(report, task_tree_user, task_tree_auto)
 
+            # Share our runs with the other reports, then import the runs they
+            # made that match our tasks instead of executing them again
+            if shared_store_path is not None and 'profile' in state:
+                try:
+                    store = SharedStore(shared_store_path)
+                    store.publish(report, state['profile'], scm)
+                    if store.import_runs(report, state['profile'], scm,
+                                         [task_tree_user, task_tree_auto]) > 0:
+                        report.refresh()
+                        task_tree_user = copy.deepcopy(state['tasks']['user']['commits'])
+                        task_tree_auto = copy.deepcopy(state['tasks']['auto']['commits'])
+                        cls.__remove_existing_tasks_from_tree(report, task_tree_user, task_tree_auto)
+                except Exception as e:
+                    traceback.print_exc(file=sys.stderr)
+                    sys.stderr.write("\n")
+
             resumable_tasks = report.journal.incomplete_tests()
 
             # Delete the tests on commits that do not compile
@@ -1031,9 +1162,14 @@ class SmartEzbench:
 
         # Generate a report to compare the goal with the current state. Run it
         # in a separate process because python is really bad at freeing memory
+        shared_store_path = None
+        if self.attribute("shared_store") != 0:
+            shared_store_path = self.ezbench_dir + "/shared_store"
+
         q = multiprocessing.Queue()
         p = multiprocessing.Process(target=SmartEzbench.__generate_task_and_events_list__,
-                                    args=(q, self.state, self.log_folder, self.repo()))
+                                    args=(q, self.state, self.log_folder, self.repo(),
+                                          shared_store_path))
         p.start()
         exit_code, task_tree_user, task_tree_auto, self._events_str, resumable_tasks = q.get()
         p.join()
@@ -1052,10 +1188,18 @@ class SmartEzbench:
         self.__reload_state(keep_lock=True)
         try:
             self.__write_attribute_unlocked__('beenRunBefore', True)
+            characterize = copy.deepcopy(self.state['tasks']['characterize'])
             self.__save_state()
         finally:
             self.__release_lock()
 
+        # In sequential mode, stop running a test as soon as its margin of
+        # error is low enough, or keep running it until it is
+        sequential = self.attribute("variance_sequential") != 0
+        max_variance = self.attribute("variance_max")
+        max_run_count = self.attribute("variance_max_run_count")
+        min_run_count = self.attribute("variance_min_run_count")
+
         # Prioritize --> return a list of commits to do in order
         self._task_lock.acquire()
         self._task_list = self.__prioritize_runs(task_tree_user, task_tree_auto, deployed_commit, resumable_tasks)
@@ -1101,9 +1245,16 @@ class SmartEzbench:
                 total_time = 0
             e.set_timing_information(db, total_time, versions)
 
+            basename, subtests, metric = Test.parse_name(e.test)
+            characterizing = basename in [Test.parse_name(t)[0] for t in characterize.get(e.commit, [])]
+            sequential_task = sequential and e.resumeResultFile is None and not characterizing
+
             # Start the task
             self._task_current.started()
-            for r in range(0, e.rounds):
+            r = 0
+            while r < e.rounds:
+                r += 1
+
                 # Early exit if the report has been deleted
                 if self._deleted:
                     break
@@ -1159,6 +1310,33 @@ class SmartEzbench:
                 self.__call_hook__('done_running_test', { "task": self._task_current })
                 self._task_current.round_done()
 
+                # Keep the long-lived report up to date, this is cheap as only
+                # the new runs get parsed
+                if self._report_cached is not None or sequential_task:
+                    self.__cached_report()
+
+                if sequential_task:
+                    values = self.__result_values__(e.commit, e.test)
+                    if len(values) == 0:
+                        continue
+                    # The margin is computed with Student's t at the current
+                    # number of runs, as margin() considers sets of 2 runs to
+                    # be exact
+                    runs = min([len(v) for v in values])
+                    margin = max([ListStats(v).confidence_margin()[0] for v in values])
+
+                    if runs >= max(2, min_run_count) and margin <= max_variance:
+                        if r < e.rounds:
+                            self.__log(Criticality.DD,
+                                       "the margin of {} reached {:.2f}% after {} runs, skip the {} remaining runs".format(short_name, margin * 100, runs, e.rounds - r))
+                            self.__cap_test_rounds__(e.commit, e.test, runs)
+                        break
+                    elif r == e.rounds and runs < max_run_count:
+                        e.rounds += 1
+
+            if characterizing:
+                self.__store_characterization__(e.commit, e.test)
+
         # Now that we have run everything, we can delete the "auto" tests
         self.__reload_state(keep_lock=True)
         try:
@@ -1172,6 +1350,88 @@ class SmartEzbench:
 
         return True
 
+    def __result_values__(self, commit, test):
+        # Returns the values of every numerical result of the test at the
+        # commit, in the execution order of the runs
+        report = self.__cached_report()
+        c = report.find_commit_by_id(commit)
+        if c is None:
+            return []
+
+        basename, subtests, metric = Test.parse_name(test)
+        result = report.find_result_by_name(c, basename)
+        if result is None or metric is not None:
+            return []
+
+        if result.test_type == "bench":
+            keys = [None]
+        else:
+            keys = result.results(BenchSubTestType.SUBTEST_FLOAT)
+            if len(subtests) > 0:
+                keys &= set(subtests)
+
+        def run_index(run_value):
+            try:
+                return int(run_value[0].run_file.rsplit('#', 1)[1])
+            except (IndexError, ValueError):
+                return 0
+
+        values = []
+        for key in keys:
+            results = sorted(result.result(key).results, key=run_index)
+            values.append([value for run, value in results])
+        return values
+
+    def __cap_test_rounds__(self, commit, test, rounds):
+        # Lower the rounds requested for the test at the commit to what has
+        # already been run, so as they do not get scheduled again
+        basename, subtests, metric = Test.parse_name(test)
+
+        self.__reload_state(keep_lock=True)
+        try:
+            for tree in [self.state['tasks']['user']['commits'],
+                         self.state['tasks']['auto']['commits']]:
+                tests = tree.get(commit, dict()).get('tests', dict())
+                for full_name in tests:
+                    if Test.parse_name(full_name)[0] == basename:
+                        tests[full_name]['rounds'] = min(tests[full_name]['rounds'], rounds)
+            self.__save_state()
+        finally:
+            self.__release_lock()
+
+    def __store_characterization__(self, commit, test):
+        basename, subtests, metric = Test.parse_name(test)
+
+        cv = 0
+        warmup_runs = 0
+        samples = None
+        for values in self.__result_values__(commit, test):
+            warmup = warmup_run_count(values)
+            steady = ListStats(values[warmup:])
+            if len(steady.data) > 1 and steady.mean() != 0:
+                cv = max(cv, steady.data.std(ddof=1) / abs(steady.mean()))
+            warmup_runs = max(warmup_runs, warmup)
+            samples = min(samples or len(values), len(values))
+
+        if samples is not None:
+            db = TimingsDB(self.ezbench_dir + "/timing_DB")
+            db.set_variance(self.profile(), basename, cv, warmup_runs, samples)
+            self.__log(Criticality.II,
+                       "Test {}: coefficient of variation = {:.2f}%, {} warm-up runs ({} samples)".format(basename, cv * 100, warmup_runs, samples))
+
+        self.__reload_state(keep_lock=True)
+        try:
+            characterize = self.state['tasks']['characterize']
+            tests = characterize.get(commit, dict())
+            for full_name in list(tests.keys()):
+                if Test.parse_name(full_name)[0] == basename:
+                    del tests[full_name]
+            if commit in characterize and len(tests) == 0:
+                del characterize[commit]
+            self.__save_state()
+        finally:
+            self.__release_lock()
+
     def repo(self):
         if not hasattr(self, "_cache_repo_"):
             # Get the repo directory
@@ -1191,11 +1451,13 @@ class SmartEzbench:
         return self._cache_repo_
 
     def report(self, reorder_commits = True,
-               restrict_to_commits = [], silentMode = True):
+               restrict_to_commits = [], silentMode = True, jobs = 1):
         # Generate the report, order commits based on the git history
+        repo = self.repo()
         r = Report(self.log_folder, silentMode,
-                                 restrict_to_commits = restrict_to_commits)
-        r.enhance_report(self.repo())
+                                 restrict_to_commits = restrict_to_commits,
+                                 jobs = jobs, scm = repo)
+        r.enhance_report(repo)
 
         # Update the list of events with the most up to date report we have
         events_str = []
@@ -1205,6 +1467,26 @@ class SmartEzbench:
 
         return r
 
+    def compact_journal(self, keep_lines = 1000):
+        """
+        Fold the old entries of the journal of the report, for it to be
+        faster to read. This rewrites the journal, so it is only done on
+        request and is skipped while the runner is using the report.
+
+        Args:
+            keep_lines: The number of latest entries to keep in the journal
+
+        Returns:
+            True if the journal got compacted, False otherwise
+        """
+        journal = Journal(os.path.join(self.log_folder, "journal"))
+        if journal.compact(keep_lines):
+            self.__log(Criticality.II, "Compacted the journal")
+            return True
+        else:
+            self.__log(Criticality.II, "The journal did not need to be compacted, or is in use")
+            return False
+
     # WARNING: test may be None!
     def __score_event__(self, event_commit_range, commit_sha1, test, severity):
         commit_weight = 1 - event_commit_range.average_oldness_factor()
@@ -1234,8 +1516,12 @@ class SmartEzbench:
         p = SmartEzbenchAttributes[param]
         if p == SmartEzbenchAttributes.perf_min_change:
             return self.__attribute__(param, 0.005)
+        elif p == SmartEzbenchAttributes.perf_changepoints:
+            return self.__attribute__(param, 0)
         elif p == SmartEzbenchAttributes.event_min_confidence:
             return self.__attribute__(param, 0.99)
+        elif p == SmartEzbenchAttributes.event_fdr:
+            return self.__attribute__(param, 0)
         elif p == SmartEzbenchAttributes.schedule_max_commits:
             return self.__attribute__(param, 1)
         elif p == SmartEzbenchAttributes.variance_max:
@@ -1244,12 +1530,18 @@ class SmartEzbench:
             return self.__attribute__(param, 20)
         elif p == SmartEzbenchAttributes.variance_min_run_count:
             return self.__attribute__(param, 2)
+        elif p == SmartEzbenchAttributes.variance_sequential:
+            return self.__attribute__(param, 0)
         elif p == SmartEzbenchAttributes.report_priority:
             return self.__attribute__(param, 0)
         elif p == SmartEzbenchAttributes.report_deadline_soft:
             return self.__attribute__(param, -1)
         elif p == SmartEzbenchAttributes.report_deadline_hard:
             return self.__attribute__(param, -1)
+        elif p == SmartEzbenchAttributes.report_jobs:
+            return self.__attribute__(param, 1)
+        elif p == SmartEzbenchAttributes.shared_store:
+            return self.__attribute__(param, 0)
 
     def set_attribute(self, param, value):
         # verify that the attribute exists
@@ -1283,6 +1575,14 @@ class SmartEzbench:
         finally:
             self.__release_lock()
 
+    def __cached_report(self):
+        if self._report_cached is None:
+            self._report_cached = Report(self.log_folder, silentMode = True,
+                                         scm = self.repo())
+        else:
+            self._report_cached.refresh()
+        return self._report_cached
+
     def schedule_enhancements(self):
         # Read all the attributes
         max_variance = self.attribute("variance_max")
@@ -1291,13 +1591,19 @@ class SmartEzbench:
         perf_diff_confidence = self.attribute("event_min_confidence")
         smallest_perf_change = self.attribute("perf_min_change")
         commit_schedule_max = self.attribute("schedule_max_commits")
+        if self.attribute("perf_changepoints") != 0:
+            detector = "changepoints"
+        else:
+            detector = "pairwise"
 
         self.__log(Criticality.II, "Start enhancing the report")
 
         # Generate the report, order commits based on the git history
-        r = Report(self.log_folder, silentMode = True)
+        r = self.__cached_report()
+        r.jobs = max(1, int(self.attribute("report_jobs")))
         overlay = r.enhance_report(self.repo(), max_variance, perf_diff_confidence,
-                                   smallest_perf_change)
+                                   smallest_perf_change, detector=detector,
+                                   fdr=self.attribute("event_fdr"))
 
         # Generate the list of commits to ignore when bisecting
         ignore_commits = set()
@@ -107,6 +107,12 @@ function use_report {
     exec > >(tee -a $folder/runner.log)
     exec 2>&1
 
+    # New reports store the files of every version in a folder named after
+    # the version. Older reports keep their flat layout until they get
+    # converted by utils/migrate_log_folder.py
+    [ -f "$folder/commit_list" ] || echo "per_commit" > "$folder/layout"
+    logsLayout=$(cat "$folder/layout" 2> /dev/null)
+
     reportName=$name
     logsFolder=$folder
 
@@ -241,16 +247,29 @@ function start_testing {
 
     # Write in the journal what current version is deployed
     write_to_journal deployed $(profile_repo_deployed_version)
+    warmedUpTests=()
 
     return 0
 }
 
+function version_folder {
+    # Returns the folder containing the files of the version $1
+    if [ "$logsLayout" == "per_commit" ]; then
+        echo "$logsFolder/$1"
+    else
+        echo "$logsFolder"
+    fi
+}
+
 function compile_and_deploy {
     # Accessible variables
     # $version      [RO]: SHA1 id of the current version
     # $versionName  [RO]: Name of the version
 
-    profile_repo_get_patch $version > "$logsFolder/$1.patch"
+    local versionFolder=$(version_folder $version)
+    mkdir -p "$versionFolder"
+
+    profile_repo_get_patch $version > "$versionFolder/$1.patch"
 
     # Select the version of interest
     local versionListLog="$logsFolder/commit_list"
@@ -264,7 +283,7 @@ function compile_and_deploy {
     deployed_version=$(profile_repo_deployed_version)
     are_same_versions "$version" "$deployed_version" && return 0
 
-    local compile_logs=$logsFolder/${version}_compile_log
+    local compile_logs=$versionFolder/${version}_compile_log
 
     # Compile the version and check for failure. If it failed, go to the next version.
     export REPO_COMPILE_AND_DEPLOY_VERSION=$version
@@ -298,10 +317,36 @@ function compile_and_deploy {
 
     # Write in the journal that the version is deployed
     write_to_journal deployed $version
+    warmedUpTests=()
 
     return 0
 }
 
+function warm_up_test {
+    # Accessible variables
+    # $version         [RO]: SHA1 id of the current version
+    # $testName        [RO]: Name of the test
+    # $execFuncName    [RO]: Name of the function executing the test
+
+    # Run the test once after every deployment, without recording its
+    # results, so as the measured runs do not start with cold caches
+    [ "${WARMUP_RUN_AFTER_DEPLOY:-0}" -eq 1 ] || return 0
+    [ -z "${warmedUpTests[$testName]}" ] || return 0
+    warmedUpTests[$testName]=1
+
+    local run_log_file=$(mktemp)
+    {
+        callIfDefined ${testName}_run_pre_hook
+        callIfDefined benchmark_run_pre_hook
+        "$execFuncName"
+        callIfDefined benchmark_run_post_hook
+        callIfDefined ${testName}_run_post_hook
+    } > /dev/null 2>&1
+    rm -f "$run_log_file"*
+
+    write_to_journal warmup "$version" "${testName}"
+}
+
 function find_test {
     # Accessible variables
     # $availTestNames    [RO]: Array containing the names of available tests
@@ -349,9 +394,6 @@ function execute_test {
     [ -n "$reportName" ] || return 15
     [ "$testing_ready" -eq 1 ] || return 16
 
-    # Verify that, if specified, the run_log_file_name exits
-    [[ -n "$run_log_file_name" && ! -f "$logsFolder/$run_log_file_name" ]] && return 18
-
     # Find the test
     parse_tests_profiles
     find_test "$testName" || return 100
@@ -363,6 +405,10 @@ function execute_test {
 	return 50
     fi
 
+    # Verify that, if specified, the run_log_file_name exits
+    local versionFolder=$(version_folder $version)
+    [[ -n "$run_log_file_name" && ! -f "$versionFolder/$run_log_file_name" ]] && return 18
+
     # verify that the type of execution is available
     local execFuncName=${testName}_${testExecutionType}
     if ! function_available "$execFuncName"; then
@@ -382,7 +428,7 @@ function execute_test {
 
     # Generate the logs file names
     local reportFileName="${version}_${testType}_${testName}"
-    local reportFile="$logsFolder/$reportFileName"
+    local reportFile="$versionFolder/$reportFileName"
 
     # Only generate the run_log_file_name if it is unspecified
     if [ -z "$run_log_file_name" ]; then
@@ -410,8 +456,10 @@ function execute_test {
     local preHookFuncName=${testName}_run_pre_hook
     local postHookFuncName=${testName}_run_post_hook
 
-    local run_log_file="$logsFolder/$run_log_file_name"
     IFS='|' read -a run_sub_tests <<< "$testSubTests"
+    [ "$testExecutionType" == "run" ] && warm_up_test
+
+    local run_log_file="$versionFolder/$run_log_file_name"
 
     echo "$run_log_file_name"
 
@@ -670,6 +718,7 @@ typeset -A availTestIsInvert
 typeset -A availTestExecTime
 typeset -A availTestHasExitCode
 typeset -A confs
+typeset -A warmedUpTests
 protocol_version=1
 reportName=""
 profile=""
@@ -30,6 +30,7 @@ OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 from mako.lookup import TemplateLookup
 from mako.template import Template
 from mako import exceptions
+from multiprocessing.pool import ThreadPool
 import collections
 import sys
 import os
@@ -47,6 +48,16 @@ from ezbench.report import *
 # constants
 html_name="index.html"
 
+class ResultView:
+	""" The presentation data of a TestResult, which does not have a __dict__.
+	All the other attributes are the ones of the result.
+	"""
+	def __init__(self, result):
+		self._result = result
+
+	def __getattr__(self, name):
+		return getattr(self._result, name)
+
 def __env_add_result__(db, human_envs, report, commit, result):
 	if result.test.full_name not in human_envs:
 		for run in result.runs:
@@ -92,6 +103,31 @@ def __env_add_result__(db, human_envs, report, commit, result):
 			new_entry['users'] = [tup]
 			db['env_sets'][result.test.full_name].append(new_entry)
 
+def metric_trace_svg(result, width = 120, height = 24):
+	# Draw the coarse trace of the first run having the metric
+	for run in result.runs:
+		metric = run.result(result.key)
+		if metric is None:
+			continue
+		trace = metric.trace()
+		if trace is None or len(trace[0]) < 2:
+			continue
+
+		t, vmin, vmax, vmean = trace
+		t_span = max(t[-1] - t[0], 1e-9)
+		v_low = vmin.min()
+		v_span = max(vmax.max() - v_low, 1e-9)
+		x = lambda v: (v - t[0]) * width / t_span
+		y = lambda v: height - (v - v_low) * height / v_span
+
+		band = ["{:.1f},{:.1f}".format(x(t[i]), y(vmax[i])) for i in range(len(t))]
+		band += ["{:.1f},{:.1f}".format(x(t[i]), y(vmin[i])) for i in reversed(range(len(t)))]
+		mean = ["{:.1f},{:.1f}".format(x(t[i]), y(vmean[i])) for i in range(len(t))]
+		svg = "<svg width='{w}' height='{h}'><polygon points='{band}' fill='#ccc'/>"
+		svg += "<polyline points='{mean}' fill='none' stroke='#36c'/></svg>"
+		return svg.format(w=width, h=height, band=" ".join(band), mean=" ".join(mean))
+	return ""
+
 def reports_to_html(reports, output, output_unit = None, title = None,
 			   commit_url = None, verbose = False, reference_report = None,
 			   reference_commit = None, embed = True):
@@ -152,12 +188,13 @@ def reports_to_html(reports, output, output_unit = None, title = None,
 		for test in report.tests:
 			db["envs"][test.full_name] = dict()
 
+		annotations = dict()
 		for event in report.events:
 			if type(event) is EventPerfChange:
 				for result in event.commit_range.new.results.values():
 					if result.test.full_name != event.test.full_name:
 						continue
-					result.annotation = str(event)
+					annotations[result] = str(event)
 
 		# add all the commits
 		for commit in report.commits:
@@ -179,6 +216,9 @@ def reports_to_html(reports, output, output_unit = None, title = None,
 			score_sum = 0
 			count = 0
 			for result in commit.results.values():
+				result = ResultView(result)
+				if result._result in annotations:
+					result.annotation = annotations[result._result]
 				if not result.test.full_name in db["tests"]:
 					db["tests"].append(result.test.full_name)
 					db["metrics"][result.test.full_name] = []
@@ -208,11 +248,13 @@ def reports_to_html(reports, output, output_unit = None, title = None,
 
 				# Get the metrics
 				result.metrics = dict()
+				result.metrics_trace = dict()
 				for metric in result.results(BenchSubTestType.METRIC):
 					if metric not in db["metrics"][result.test.full_name]:
 						db["metrics"][result.test.full_name].append(metric)
 
 					result.metrics[metric] = result.result(metric)
+					result.metrics_trace[metric] = metric_trace_svg(result.metrics[metric])
 
 
 				# Environment
@@ -861,7 +903,7 @@ dataTable.addRows([['${test}', '${report1.name}', ${perf_diff}, "${r1.average_ra
 											diff = compute_perf_difference(unit, ref_metric.mean(), m.mean())
 										%>${" ({:.2f}%)".format(diff)}\\
 										% endif
-</td>
+${db["commits"][commit]['reports'][report.name][test].metrics_trace[metric]}</td>
 									% else:
 										<td>N/A</td>
 									% endif
@@ -875,6 +917,8 @@ dataTable.addRows([['${test}', '${report1.name}', ${perf_diff}, "${r1.average_ra
 					<h3>Results</h3>
 					<%
 						unit_results = []
+						names = dict()
+						statuses_of = dict()
 						stats_status = dict()
 						statuses = set()
 
@@ -888,8 +932,8 @@ dataTable.addRows([['${test}', '${report1.name}', ${perf_diff}, "${r1.average_ra
 							subtests = db['target_result'][test].results(BenchSubTestType.SUBTEST_STRING)
 							if len(subtests) > 0:
 								target_result = db['target_result'][test]
-								target_result.name = "Target"
-								stats_status[target_result.name] = dict()
+								names[target_result] = "Target"
+								stats_status[names[target_result]] = dict()
 								unit_results.append(target_result)
 
 						for report in db['reports']:
@@ -899,15 +943,15 @@ dataTable.addRows([['${test}', '${report1.name}', ${perf_diff}, "${r1.average_ra
 										continue
 									if result.test_type != "unit":
 										continue
-									result.name = "{}.{}".format(report.name, commit.label)
-									stats_status[result.name] = dict()
-									target_changes[result.name] = dict()
+									names[result] = "{}.{}".format(report.name, commit.label)
+									stats_status[names[result]] = dict()
+									target_changes[names[result]] = dict()
 									unit_results.append(result)
 
 						all_tests = set()
 						for result in unit_results:
 							all_tests |= set(result.results(BenchSubTestType.SUBTEST_STRING))
-							result.unit_results = dict()
+							statuses_of[result] = dict()
 
 						unit_tests = set()
 						for test in all_tests:
@@ -923,13 +967,13 @@ dataTable.addRows([['${test}', '${report1.name}', ${perf_diff}, "${r1.average_ra
 										status = subtest[0]
 									else:
 										status = "unstable"
-								result.unit_results[test] = status
+								statuses_of[result][test] = status
 
 								# Collect stats on all the status
-								if status not in stats_status[result.name]:
-									stats_status[result.name][status] = 0
+								if status not in stats_status[names[result]]:
+									stats_status[names[result]][status] = 0
 									statuses |= set([status])
-								stats_status[result.name][status] += 1
+								stats_status[names[result]][status] += 1
 
 								if value == None and status != "missing":
 									value = status
@@ -938,15 +982,15 @@ dataTable.addRows([['${test}', '${report1.name}', ${perf_diff}, "${r1.average_ra
 									unit_tests |= set([test])
 
 								if (target_result is None or result == target_result or
-									target_result.unit_results[test] == status):
+									statuses_of[target_result][test] == status):
 									continue
 
-								change = "{} -> {}".format(target_result.unit_results[test],
+								change = "{} -> {}".format(statuses_of[target_result][test],
 								                           status)
-								if change not in target_changes[result.name]:
-									target_changes[result.name][change] = 0
+								if change not in target_changes[names[result]]:
+									target_changes[names[result]][change] = 0
 									changes |= set([change])
-								target_changes[result.name][change] += 1
+								target_changes[names[result]][change] += 1
 
 						all_tests = []
 					%>
@@ -1002,14 +1046,14 @@ dataTable.addRows([['${test}', '${report1.name}', ${perf_diff}, "${r1.average_ra
 						<table>
 							<tr><th>test name (${len(unit_tests)})</th>
 							% for result in unit_results:
-							<th>${result.name}</th>
+							<th>${names[result]}</th>
 							% endfor
 							</tr>
 
 							% for test in sorted(unit_tests):
 	<tr><td>${html.escape(test)}</td>\\
 								% for result in unit_results:
-	<td>${result.unit_results[test]}</td>\\
+	<td>${statuses_of[result][test]}</td>\\
 								% endfor
 	</tr>
 							% endfor
@@ -1050,14 +1094,15 @@ dataTable.addRows([['${test}', '${report1.name}', ${perf_diff}, "${r1.average_ra
 			if verbose:
 				print("Output HTML generated at: {}".format(output))
 
-def gen_report(log_folder, restrict_commits):
+def gen_report(log_folder, restrict_commits, jobs=1):
 	report_name = os.path.basename(os.path.abspath(log_folder))
 
 	try:
 		sbench = SmartEzbench(ezbench_dir, report_name, readonly=True)
-		report = sbench.report(restrict_to_commits = restrict_commits, silentMode=False)
+		report = sbench.report(restrict_to_commits = restrict_commits, silentMode=False,
+				       jobs = jobs)
 	except RuntimeError:
-		report = Report(log_folder, restrict_to_commits = restrict_commits)
+		report = Report(log_folder, restrict_to_commits = restrict_commits, jobs = jobs)
 		report.enhance_report(NoRepo(log_folder))
 
 	return report
@@ -1075,6 +1120,8 @@ if __name__ == "__main__":
 	parser.add_argument("--reference", help="Compare the test results to this reference report")
 	parser.add_argument("--reference_commit", help="Compare the test results to the specified commit of the reference report")
 	parser.add_argument("--restrict_commits", help="Restrict commits to this list (space separated)")
+	parser.add_argument("-j", "--jobs", type=int, default=1,
+			    help="Number of processes used to parse the reports (0: one per CPU)")
 	parser.add_argument("log_folder", nargs='+')
 	args = parser.parse_args()
 
@@ -1091,14 +1138,23 @@ if __name__ == "__main__":
 	if args.restrict_commits is not None:
 		restrict_commits = args.restrict_commits.split(' ')
 
-	reports = []
-	for log_folder in set(args.log_folder):
-		reports.append(gen_report(log_folder, restrict_commits))
+	jobs = args.jobs if args.jobs > 0 else None
+
+	# Parse all the reports concurrently, including the reference report,
+	# unless they use worker processes which should not get forked from a
+	# multi-threaded process
+	tasks = [(log_folder, restrict_commits, jobs) for log_folder in set(args.log_folder)]
+	if args.reference is not None:
+		tasks.append((args.reference, [], jobs))
+	if jobs == 1:
+		with ThreadPool(len(tasks)) as pool:
+			reports = pool.starmap(gen_report, tasks)
+	else:
+		reports = [gen_report(*task) for task in tasks]
 
-	# Reference report
 	reference = None
 	if args.reference is not None:
-		reference = gen_report(args.reference, [])
+		reference = reports.pop()
 
 	reports_to_html(reports, args.output, args.unit, args.title,
 			   args.commit_url, not args.quiet, reference, args.reference_commit)
@@ -60,6 +60,9 @@ class TimingsDB:
         value_list.append(float(value))
         value_list = value_list[-10:]
 
+        self.__save__()
+
+    def __save__(self):
         with open(self.db_file_name, mode='w') as data_file:
             fcntl.flock(data_file, fcntl.LOCK_EX)
             json.dump(self.db, data_file, sort_keys=True, indent=4, separators=(',', ': '))
@@ -75,6 +78,35 @@ class TimingsDB:
 
         return list(map(float, self.db["timings"][namespace][key]))
 
+    def set_variance(self, profile, test, cv, warmup_runs, samples):
+        """
+        Store the variance characterization of a test on a profile.
+
+        Args:
+            profile: The profile the test got characterized on
+            test: The name of the test
+            cv: The coefficient of variation of the test's results
+            warmup_runs: How many of the first runs are not representative
+            samples: The number of runs used for the characterization
+        """
+        if "variance" not in self.db:
+            self.db["variance"] = dict()
+        if profile not in self.db["variance"]:
+            self.db["variance"][profile] = dict()
+
+        self.db["variance"][profile][test] = {"cv": float(cv),
+                                              "warmup_runs": int(warmup_runs),
+                                              "samples": int(samples)}
+        self.__save__()
+
+    def variance(self, profile, test):
+        """
+        Returns the variance characterization of a test on a profile as a
+        dictionary with the cv, warmup_runs and samples keys, or None if the
+        test never got characterized.
+        """
+        return self.db.get("variance", dict()).get(profile, dict()).get(test, None)
+
 
 if __name__ == "__main__":
     # parse the options
@@ -0,0 +1,381 @@
+#!/usr/bin/env python3
+
+"""
+Copyright (c) 2017, Intel Corporation
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+    * Redistributions of source code must retain the above copyright notice,
+      this list of conditions and the following disclaimer.
+    * Redistributions in binary form must reproduce the above copyright
+      notice, this list of conditions and the following disclaimer in the
+      documentation and/or other materials provided with the distribution.
+    * Neither the name of Intel Corporation nor the names of its contributors
+      may be used to endorse or promote products derived from this software
+      without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE
+FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+
+# Micro-benchmarks for the report parsing, run with:
+#   ./benchmarks.py <benchmark> [options]
+
+import tracemalloc
+import argparse
+import random
+import shutil
+import time
+import sys
+import os
+import ast
+import re
+
+from scipy import stats
+
+from utils import tmp_folder
+from ezbench.report import Report, TestRun, ListStats, EventPerfChange
+from ezbench.scm import NoRepo
+
+def timeit(name, func, *args, **kwargs):
+    start = time.monotonic()
+    ret = func(*args, **kwargs)
+    print("{}: {:.3f} s".format(name, time.monotonic() - start))
+    return ret
+
+def gen_synthetic_report(path, commits, tests, runs):
+    shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(path)
+
+    def write(filename, data):
+        with open(os.path.join(path, filename), "w") as f:
+            f.write(data)
+
+    write("commit_list", "".join(["c{} Commit {}\n".format(c, c) for c in range(commits)]))
+    write("journal", "".join(["1500000000,deployed,c{}\n".format(c) for c in range(commits)]))
+
+    files = 2
+    for c in range(commits):
+        for t in range(tests):
+            test_file = "c{}_bench_test{}".format(c, t)
+            write(test_file, "# FPS (more is better) of 'test{}' using version c{}\n".format(t, c) +
+                             "60\n" * runs)
+            for r in range(runs):
+                write("{}#{}".format(test_file, r), "60\n")
+                write("{}#{}.metrics_pwr".format(test_file, r), "time (ms),power (W)\n0,10\n")
+            files += 1 + 2 * runs
+
+    return files
+
+def gen_synthetic_unified_report(path, commits, subtests, runs):
+    shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(path)
+
+    def write(filename, data):
+        with open(os.path.join(path, filename), "w") as f:
+            f.write(data)
+
+    write("commit_list", "".join(["c{} Commit {}\n".format(c, c) for c in range(commits)]))
+    write("journal", "".join(["1500000000,deployed,c{}\n".format(c) for c in range(commits)]))
+
+    for c in range(commits):
+        for r in range(runs):
+            write("c{}_unified_test#{}".format(c, r),
+                  "".join(["subtest{}: float({}.5) ms\n".format(s, 10 + (s + r) % 7)
+                           for s in range(subtests)]))
+
+def gen_synthetic_history(path, commits, runs, noise, drift):
+    # Follow the state machine of auto-bisect.py: 2% of the commits change the
+    # performance, on top of an optional gradual drift
+    shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(path)
+
+    def write(filename, data):
+        with open(os.path.join(path, filename), "w") as f:
+            f.write(data)
+
+    write("commit_list", "".join(["c{} Commit {}\n".format(c, c) for c in range(commits)]))
+    write("journal", "".join(["1500000000,deployed,c{}\n".format(c) for c in range(commits)]))
+
+    perf = 100.0
+    changes = dict()
+    for c in range(commits):
+        if c > 0 and random.random() > 0.98:
+            new_perf = perf * (1.0075 + random.gauss(0, 1) / 10)
+            changes["c{}".format(c)] = new_perf / perf - 1
+            perf = new_perf
+        perf *= 1 + drift
+
+        values = [perf * (1 + random.gauss(0, noise)) for r in range(runs)]
+        test_file = "c{}_bench_perf_bisect".format(c)
+        write(test_file, "# FPS (more is better) of 'perf_bisect' using version c{}\n".format(c) +
+                         "".join(["{}\n".format(v) for v in values]))
+        for r, v in enumerate(values):
+            write("{}#{}".format(test_file, r), "{}\n".format(v))
+
+    return changes
+
+def legacy_list_runs(testFiles, testFile):
+    # The per-result regex scan __parse_report__ used to do
+    run_re = re.compile(r'^{testFile}#[0-9]+$'.format(testFile=testFile))
+    runsFiles = [f for f in testFiles if run_re.search(f)]
+    metricsFiles = dict()
+    for runFile in runsFiles:
+        metrics_re = re.compile(r'^{}.metrics_.+$'.format(runFile))
+        metricsFiles[runFile] = [f for f in testFiles if metrics_re.search(f)]
+    return runsFiles, metricsFiles
+
+def legacy_parse_unified_run(runFile):
+    # The regex + literal_eval parsing parse_unified_run used to do
+    records = []
+    l_re = re.compile(r'^(.*): (.*)\((.*)\)( .*)?$')
+    with open(runFile, 'rt') as f:
+        for i, line in enumerate(f):
+            m = l_re.match(line)
+            if m is None:
+                continue
+            key, key_type, value, unit = m.groups()
+            if unit is not None:
+                unit = unit.strip()
+            if key_type == "float":
+                value = ast.literal_eval(value)
+                if type(value) is float:
+                    value = [value]
+                records.append(("float", key, unit, value, runFile))
+            elif key_type == "str":
+                records.append(("str", key, value, runFile))
+    return records
+
+def bench_listing(args):
+    path = os.path.join(tmp_folder, "bench_listing")
+    files = gen_synthetic_report(path, args.commits, args.tests, args.runs)
+    print("Generated {} files in {}".format(files, path))
+
+    files_list = os.listdir(path)
+    def legacy():
+        for c in range(args.commits):
+            prefix = "c{}_".format(c)
+            commit_files = [f for f in files_list if f.startswith(prefix)]
+            for t in range(args.tests):
+                legacy_list_runs(commit_files, "c{}_bench_test{}".format(c, t))
+    if args.tests <= 2000:
+        timeit("Legacy run/metrics matching", legacy)
+    timeit("Report parsing (no cache)", Report, path, silentMode=True, use_cache=False)
+
+    shutil.rmtree(path, ignore_errors=True)
+
+def bench_memory(args):
+    path = os.path.join(tmp_folder, "bench_memory")
+    gen_synthetic_unified_report(path, args.commits, args.subtests, args.runs)
+    print("Generated {} runs of {} subtests".format(args.commits * args.runs, args.subtests))
+
+    tracemalloc.start()
+    report = timeit("Report parsing (no cache)", Report, path, silentMode=True,
+                    use_cache=False)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print("Memory used by the report: {:.1f} MB (peak: {:.1f} MB)".format(current / 1e6,
+                                                                         peak / 1e6))
+
+    shutil.rmtree(path, ignore_errors=True)
+
+def bench_objects(args):
+    path = os.path.join(tmp_folder, "bench_objects")
+    gen_synthetic_report(path, args.commits, args.tests, args.runs)
+    results = args.commits * args.tests
+    print("Generated {} commit-results of {} runs".format(results, args.runs))
+
+    tracemalloc.start()
+    report = timeit("Report parsing (no cache)", Report, path, silentMode=True,
+                    use_cache=False)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print("Memory used by the report: {:.1f} MB ({:.2f} kB per commit-result)".format(
+          current / 1e6, current / 1e3 / results))
+
+    shutil.rmtree(path, ignore_errors=True)
+
+def bench_stats(args):
+    random.seed(0)
+    sets = [[random.gauss(60, 2) for r in range(random.randint(2, args.max_runs))]
+            for i in range(args.results)]
+    print("Generated {} results of 2 to {} runs".format(args.results, args.max_runs))
+
+    def legacy(count):
+        for s in sets[:count]:
+            stats.bayes_mvs(s, alpha=0.95)
+    count = min(args.results, 2000)
+    start = time.monotonic()
+    legacy(count)
+    duration = time.monotonic() - start
+    print("bayes_mvs() per result: {:.3f} s for {} results, ~{:.1f} s for all".format(
+          duration, count, duration * args.results / count))
+
+    def closed_form():
+        for s in sets:
+            ListStats(s).margin()
+    timeit("Closed form per result", closed_form)
+
+    def sample_size(confidence):
+        for s in sets:
+            ListStats(s).confidence_margin(0.01, confidence)
+    timeit("Sample size estimation (95%)", sample_size, 0.95)
+    timeit("Sample size estimation (99.5%)", sample_size, 0.995)
+
+    liststats = [ListStats(s) for s in sets]
+    timeit("Batch", ListStats.compute_stats_batch, liststats)
+
+def bench_changepoints(args):
+    path = os.path.join(tmp_folder, "bench_changepoints")
+    random.seed(args.seed)
+    changes = gen_synthetic_history(path, args.commits, args.runs, args.noise, args.drift)
+    significant = set([c for c, diff in changes.items() if abs(diff) >= 2 * args.noise])
+    print("Generated {} commits with {} performance changes ({} of them >= {:.1f}%)".format(
+          args.commits, len(changes), len(significant), 200 * args.noise))
+
+    configurations = [("pairwise", 0), ("changepoints", 0)]
+    if args.fdr > 0:
+        configurations.append(("pairwise", args.fdr))
+    for detector, fdr in configurations:
+        name = "{} detector".format(detector)
+        if fdr > 0:
+            name += " (FDR {})".format(fdr)
+        report = Report(path, silentMode=True, use_cache=False)
+        timeit(name, report.enhance_report, NoRepo(path), detector=detector, fdr=fdr)
+
+        found = set()
+        false_positives = 0
+        for e in report.events:
+            if type(e) is not EventPerfChange:
+                continue
+            if e.commit_range.new.sha1 in changes:
+                found.add(e.commit_range.new.sha1)
+            else:
+                false_positives += 1
+        # With a drift, the events on the other commits may be legitimate
+        other = "false positives" if args.drift == 0 else "events along the drift"
+        print("\tfound {} changes, {} {}, {} false negatives".format(
+              len(found), false_positives, other, len(significant - found)))
+
+    shutil.rmtree(path, ignore_errors=True)
+
+def bench_enhance(args):
+    path = os.path.join(tmp_folder, "bench_enhance")
+    gen_synthetic_unified_report(path, args.commits, args.subtests, args.runs)
+    print("Generated {} commits with {} subtests".format(args.commits, args.subtests))
+
+    events = dict()
+    for jobs in sorted(set([1, args.jobs])):
+        report = Report(path, silentMode=True, use_cache=False)
+        report.jobs = jobs
+        timeit("enhance_report() with {} processes".format(jobs),
+               report.enhance_report, NoRepo(path))
+        events[jobs] = [str(e) for e in report.events]
+    print("Found {} events, identical: {}".format(len(events[1]),
+                                                 events[1] == events[args.jobs]))
+
+    # Add one run to the last commit, only its comparisons need to be redone
+    report = Report(path, silentMode=True)
+    timeit("enhance_report() with an empty comparisons cache",
+           report.enhance_report, NoRepo(path))
+    timeit("enhance_report() with a full comparisons cache",
+           report.enhance_report, NoRepo(path))
+
+    sha1 = "c{}".format(args.commits - 1)
+    run_file = "{}_unified_test#{}".format(sha1, args.runs)
+    with open(os.path.join(path, run_file), "w") as f:
+        f.write("".join(["subtest{}: float({}.5) ms\n".format(s, 10 + s % 5)
+                         for s in range(args.subtests)]))
+    with open(os.path.join(path, "journal"), "a") as f:
+        f.write("1500000001,test,{},test,{}\n".format(sha1, run_file))
+        f.write("1500000002,tested,{},test,{}\n".format(sha1, run_file))
+    report.refresh()
+    timeit("enhance_report() after one new run", report.enhance_report, NoRepo(path))
+
+    shutil.rmtree(path, ignore_errors=True)
+
+def bench_unified(args):
+    path = os.path.join(tmp_folder, "bench_unified")
+    shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(path)
+
+    run_file = "c0_unified_test#0"
+    with open(os.path.join(path, run_file), "w") as f:
+        for s in range(args.subtests):
+            if s % 3 == 0:
+                f.write("piglit@subtest{}: str(pass)\n".format(s))
+            elif s % 3 == 1:
+                f.write("perf@subtest{}: float({}.25) ms\n".format(s, s))
+            else:
+                values = ", ".join(["{}.5".format(s + i) for i in range(args.samples)])
+                f.write("perf@subtest{}: float([{}]) FPS\n".format(s, values))
+    print("Generated a run file with {} subtests".format(args.subtests))
+
+    for i in range(args.iterations):
+        timeit("Legacy parser", legacy_parse_unified_run, os.path.join(path, run_file))
+        timeit("Tokenizer", TestRun.parse_unified_run, run_file, path)
+        timeit("Tokenizer (sidecar)", TestRun.parse_unified_run, run_file, path, True)
+
+    shutil.rmtree(path, ignore_errors=True)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest="benchmark")
+    subparsers.required = True
+
+    p = subparsers.add_parser("listing", help="Index the files of a synthetic report")
+    p.add_argument("--commits", type=int, default=10)
+    p.add_argument("--tests", type=int, default=2000)
+    p.add_argument("--runs", type=int, default=2)
+    p.set_defaults(func=bench_listing)
+
+    p = subparsers.add_parser("memory", help="Memory usage of a synthetic unified report")
+    p.add_argument("--commits", type=int, default=50)
+    p.add_argument("--subtests", type=int, default=1000)
+    p.add_argument("--runs", type=int, default=5)
+    p.set_defaults(func=bench_memory)
+
+    p = subparsers.add_parser("objects", help="Memory usage of the report's objects")
+    p.add_argument("--commits", type=int, default=1000)
+    p.add_argument("--tests", type=int, default=5)
+    p.add_argument("--runs", type=int, default=2)
+    p.set_defaults(func=bench_objects)
+
+    p = subparsers.add_parser("stats", help="Compute the statistics of many results")
+    p.add_argument("--results", type=int, default=50000)
+    p.add_argument("--max-runs", type=int, default=10)
+    p.set_defaults(func=bench_stats)
+
+    p = subparsers.add_parser("changepoints", help="Compare the change detectors on a synthetic history")
+    p.add_argument("--commits", type=int, default=1000)
+    p.add_argument("--runs", type=int, default=3)
+    p.add_argument("--noise", type=float, default=0.01)
+    p.add_argument("--drift", type=float, default=0)
+    p.add_argument("--seed", type=int, default=42)
+    p.add_argument("--fdr", type=float, default=0.01)
+    p.set_defaults(func=bench_changepoints)
+
+    p = subparsers.add_parser("enhance", help="Look for the changes of many results")
+    p.add_argument("--commits", type=int, default=20)
+    p.add_argument("--subtests", type=int, default=2000)
+    p.add_argument("--runs", type=int, default=3)
+    p.add_argument("--jobs", type=int, default=os.cpu_count())
+    p.set_defaults(func=bench_enhance)
+
+    p = subparsers.add_parser("unified", help="Parse a unified run file with many subtests")
+    p.add_argument("--subtests", type=int, default=10000)
+    p.add_argument("--samples", type=int, default=10)
+    p.add_argument("--iterations", type=int, default=2)
+    p.set_defaults(func=bench_unified)
+
+    args = parser.parse_args()
+    args.func(args)
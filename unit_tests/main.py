@@ -33,6 +33,8 @@ import os
 # import all the unit tests
 from test_controllerd import Controllerd
 from test_dutd import Dutd
+from test_report import ReportParsing
+from test_smartezbench import SmartEzbenchScheduling
 
 if __name__ == "__main__":
     if os.environ.get("LOOP_TESTING", None) is None:
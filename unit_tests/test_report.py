@@ -0,0 +1,893 @@
+"""
+Copyright (c) 2017, Intel Corporation
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+    * Redistributions of source code must retain the above copyright notice,
+      this list of conditions and the following disclaimer.
+    * Redistributions in binary form must reproduce the above copyright
+      notice, this list of conditions and the following disclaimer in the
+      documentation and/or other materials provided with the distribution.
+    * Neither the name of Intel Corporation nor the names of its contributors
+      may be used to endorse or promote products derived from this software
+      without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE
+FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+
+from scipy import stats
+import numpy as np
+from multiprocessing.pool import ThreadPool
+import unittest
+from datetime import timedelta
+import shutil
+import fcntl
+import time
+import math
+import os
+
+from utils import tmp_folder
+from ezbench.report import Report, EventPerfChange
+from ezbench.sharedstore import SharedStore
+from ezbench.scm import NoRepo
+import ezbench.report
+
+class ReportFactory:
+    def __init__(self, path):
+        # Create an empty report folder
+        self.log_folder = path
+        shutil.rmtree(self.log_folder, ignore_errors=True)
+        os.makedirs(self.log_folder)
+
+        self.commits = []
+        self.journal_time = 1500000000
+
+    def __write__(self, filename, data, mode="a"):
+        with open(os.path.join(self.log_folder, filename), mode) as f:
+            f.write(data)
+
+    def path(self, sha1, filename):
+        # Follow the per-commit layout, if the commit's folder exists
+        if os.path.isdir(os.path.join(self.log_folder, sha1)):
+            return os.path.join(sha1, filename)
+        return filename
+
+    def journal(self, op, *fields):
+        self.journal_time += 1
+        line = ",".join([str(self.journal_time), op] + list(fields))
+        self.__write__("journal", line + "\n")
+
+    def add_commit(self, sha1, title="Commit title"):
+        if sha1 not in self.commits:
+            self.commits.append(sha1)
+            self.__write__("commit_list", "{} {}\n".format(sha1, title))
+            self.journal("deploy", sha1)
+            self.journal("deployed", sha1)
+
+    def add_bench_run(self, sha1, test, values, unit="FPS", metrics=None):
+        self.add_commit(sha1)
+
+        test_file = "{}_bench_{}".format(sha1, test)
+        if not os.path.exists(os.path.join(self.log_folder, self.path(sha1, test_file))):
+            header = "# {} (more is better) of '{}' using version {}\n"
+            self.__write__(self.path(sha1, test_file), header.format(unit, test, sha1))
+
+        run = 0
+        while os.path.exists(os.path.join(self.log_folder,
+                                          self.path(sha1, "{}#{}".format(test_file, run)))):
+            run += 1
+        run_file = "{}#{}".format(test_file, run)
+
+        self.journal("test", sha1, test, run_file)
+        self.__write__(self.path(sha1, run_file), "".join(["{}\n".format(v) for v in values]))
+        if metrics is not None:
+            self.__write__(self.path(sha1, run_file + ".metrics_pwr"), metrics)
+        self.journal("tested", sha1, test, run_file)
+        self.__write__(self.path(sha1, test_file), "{}\n".format(sum(values) / len(values)))
+
+        return run_file
+
+    def add_unified_run(self, sha1, test, subtests):
+        self.add_commit(sha1)
+
+        run = 0
+        while os.path.exists(os.path.join(self.log_folder,
+                                          "{}_unified_{}#{}".format(sha1, test, run))):
+            run += 1
+        run_file = "{}_unified_{}#{}".format(sha1, test, run)
+
+        self.journal("test", sha1, test, run_file)
+        for name, value in subtests.items():
+            if type(value) is str:
+                self.__write__(run_file, "{}: str({})\n".format(name, value))
+            else:
+                self.__write__(run_file, "{}: float({}) ms\n".format(name, value))
+        self.journal("tested", sha1, test, run_file)
+
+        return run_file
+
+class ReportParsing(unittest.TestCase):
+    def setUp(self):
+        self.factory = ReportFactory(os.path.join(tmp_folder, "report"))
+        self.log_folder = self.factory.log_folder
+
+        metrics = "time (ms),power (W)\n0,10\n100,12\n200,11\n"
+        for sha1, fps in [("c0", 60), ("c1", 30)]:
+            for r in range(0, 3):
+                self.factory.add_bench_run(sha1, "glxgears", [fps + r, fps - r],
+                                           metrics=metrics)
+                self.factory.add_unified_run(sha1, "piglit",
+                                             {"test1": "pass", "perf": float(fps + r)})
+
+        # Count the number of run files parsed
+        self.parsed_runs = []
+        self.parse_run_files = ezbench.report.TestRun.parse_run_files
+        def parse_run_files(cls, testType, runFile, metricsFiles, log_folder, sidecar=False):
+            self.parsed_runs.append(runFile)
+            return self.parse_run_files(testType, runFile, metricsFiles, log_folder, sidecar)
+        ezbench.report.TestRun.parse_run_files = classmethod(parse_run_files)
+
+    def tearDown(self):
+        ezbench.report.TestRun.parse_run_files = self.parse_run_files
+        shutil.rmtree(self.log_folder, ignore_errors=True)
+
+    def check_report(self, report):
+        self.assertEqual([c.sha1 for c in report.commits], ["c0", "c1"])
+
+        c0 = report.commits[0]
+        self.assertEqual(set(c0.results.keys()), {"glxgears", "piglit", "ezbench_runner"})
+        self.assertEqual(len(c0.results["glxgears"].runs), 3)
+        self.assertAlmostEqual(c0.results["glxgears"].result().mean(), 60)
+        self.assertAlmostEqual(c0.results["glxgears"].result("metric_power").mean(), 11)
+        self.assertAlmostEqual(c0.results["glxgears"].result("metric_power:energy").mean(), 2.2)
+        self.assertEqual(c0.results["piglit"].result("test1").to_set(), {"pass"})
+        self.assertAlmostEqual(c0.results["piglit"].result("perf").mean(), 61)
+
+    def test_cache(self):
+        report = Report(self.log_folder, silentMode=True)
+        self.check_report(report)
+        self.assertEqual(len(self.parsed_runs), 12)
+        self.assertTrue(os.path.exists(os.path.join(self.log_folder, ".report_cache")))
+
+        # A warm load should not parse any run
+        self.parsed_runs = []
+        report = Report(self.log_folder, silentMode=True)
+        self.check_report(report)
+        self.assertEqual(self.parsed_runs, [])
+
+        # Only the modified and new runs should be parsed again
+        time.sleep(0.01)
+        with open(os.path.join(self.log_folder, "c1_unified_piglit#0"), "a") as f:
+            f.write("test2: str(fail)\n")
+        run_file = self.factory.add_bench_run("c1", "glxgears", [31, 29])
+        report = Report(self.log_folder, silentMode=True)
+        self.assertEqual(sorted(self.parsed_runs), sorted(["c1_unified_piglit#0", run_file]))
+        self.assertEqual(len(report.commits[1].results["glxgears"].runs), 4)
+        self.assertEqual(report.commits[1].results["piglit"].result("test2").to_list(),
+                         ["fail"])
+
+    def test_no_cache(self):
+        report = Report(self.log_folder, silentMode=True, use_cache=False)
+        self.check_report(report)
+        self.assertFalse(os.path.exists(os.path.join(self.log_folder, ".report_cache")))
+
+    def test_refresh(self):
+        report = Report(self.log_folder, silentMode=True)
+        self.assertFalse(report.refresh())
+
+        # Only the runs added to the journal should be parsed
+        self.parsed_runs = []
+        run_c1 = self.factory.add_bench_run("c1", "glxgears", [31, 29])
+        run_c2 = self.factory.add_bench_run("c2", "glxgears", [90, 90])
+        self.assertTrue(report.refresh())
+        self.assertEqual(self.parsed_runs, [run_c1, run_c2])
+
+        self.assertEqual([c.sha1 for c in report.commits], ["c0", "c1", "c2"])
+        self.assertEqual(len(report.commits[1].results["glxgears"].runs), 4)
+        self.assertAlmostEqual(report.commits[1].results["glxgears"].result().mean(), 30)
+        self.assertAlmostEqual(report.commits[2].results["glxgears"].result().mean(), 90)
+        self.assertIn("ezbench_runner", report.commits[2].results)
+
+        # A truncated journal triggers a full parsing
+        self.parsed_runs = []
+        os.truncate(os.path.join(self.log_folder, "journal"), 0)
+        self.factory.journal("deployed", "c0")
+        self.assertTrue(report.refresh())
+        self.assertEqual(self.parsed_runs, [])
+        self.assertEqual([c.sha1 for c in report.commits], ["c0", "c1", "c2"])
+
+    def test_parallel_parsing(self):
+        # The runs are parsed by the workers, which hand them over to the report
+        report = Report(self.log_folder, silentMode=True, use_cache=False, jobs=4)
+        self.check_report(report)
+        self.assertEqual(self.parsed_runs, [])
+        self.assertFalse(os.path.exists(os.path.join(self.log_folder, ".report_cache")))
+
+        # Only the files missing from the cache are handed to the workers
+        Report(self.log_folder, silentMode=True)
+        self.parsed_runs = []
+        self.factory.add_bench_run("c1", "glxgears", [31, 29])
+        report = Report(self.log_folder, silentMode=True, jobs=2)
+        self.assertEqual(self.parsed_runs, [])
+        self.assertEqual(len(report.commits[1].results["glxgears"].runs), 4)
+
+    def test_find_commit(self):
+        with open(os.path.join(self.log_folder, "commit_labels"), "w") as f:
+            f.write("c1 v1.0\n")
+
+        report = Report(self.log_folder, silentMode=True)
+        self.assertIs(report.find_commit_by_id("c0"), report.commits[0])
+        self.assertIs(report.find_commit_by_id("c1"), report.commits[1])
+        self.assertIs(report.find_commit_by_id("v1.0"), report.commits[1])
+        self.assertIsNone(report.find_commit_by_id("c2"))
+
+        # Commits added by refreshing the report are indexed too
+        self.factory.add_bench_run("c2", "glxgears", [90, 90])
+        report.refresh()
+        self.assertIs(report.find_commit_by_id("c2"), report.commits[2])
+
+    def test_enhance_report(self):
+        report = Report(self.log_folder, silentMode=True)
+        report.enhance_report(NoRepo(self.log_folder))
+
+        changes = [e for e in report.events if type(e) is EventPerfChange]
+        self.assertEqual(sorted([e.test.full_name for e in changes]), ["glxgears", "piglit"])
+        for e in changes:
+            self.assertIs(e.commit_range.old, report.commits[0])
+            self.assertIs(e.commit_range.new, report.commits[1])
+            self.assertLess(e.diff(), -0.45)
+
+        # Sharding the analysis across processes finds the same events, in
+        # the same order, pointing to the objects of the parent's report
+        parallel = Report(self.log_folder, silentMode=True, jobs=2)
+        parallel.enhance_report(NoRepo(self.log_folder))
+        self.assertEqual([str(e) for e in parallel.events], [str(e) for e in report.events])
+        for e in parallel.events:
+            self.assertIn(e.commit_range.new, parallel.commits)
+            if type(e) is EventPerfChange:
+                self.assertIs(e.commit_range.new, parallel.commits[1])
+                self.assertIs(e.test, parallel._tests_index[e.test.full_name])
+
+        # The workers get their report from their pool, nothing is left in
+        # the parent for another analysis to overwrite
+        self.assertIsNone(ezbench.report._enhanced_report)
+
+    def test_comparisons_cache(self):
+        # Count the statistical comparisons made by enhance_report
+        compared = []
+        compare = ezbench.report.SubTestResult.compare
+        def counting_compare(result, old_result):
+            if result.value_type == ezbench.report.BenchSubTestType.SUBTEST_FLOAT:
+                compared.append((old_result.commit.sha1, result.commit.sha1,
+                                 result.test.full_name, result.key))
+            return compare(result, old_result)
+        ezbench.report.SubTestResult.compare = counting_compare
+
+        try:
+            report = Report(self.log_folder, silentMode=True)
+            report.enhance_report(NoRepo(self.log_folder))
+            events = [str(e) for e in report.events]
+            self.assertEqual(sorted(compared), [("c0", "c1", "glxgears", None),
+                                                ("c0", "c1", "piglit", "perf")])
+            self.assertTrue(os.path.exists(os.path.join(self.log_folder, ".comparisons_cache")))
+
+            # The following analyses re-use the comparisons
+            compared.clear()
+            report = Report(self.log_folder, silentMode=True)
+            report.enhance_report(NoRepo(self.log_folder))
+            self.assertEqual([str(e) for e in report.events], events)
+            self.assertEqual(compared, [])
+
+            # Only the results getting new runs are compared again
+            self.factory.add_bench_run("c1", "glxgears", [31, 29])
+            report.refresh()
+            report.enhance_report(NoRepo(self.log_folder))
+            self.assertEqual(compared, [("c0", "c1", "glxgears", None)])
+
+            # The comparisons of the results handled by the changepoint
+            # detector are kept for the next pairwise analyses
+            compared.clear()
+            report.enhance_report(NoRepo(self.log_folder), detector="changepoints")
+            self.assertLess(len(compared), 2)
+            compared.clear()
+            report = Report(self.log_folder, silentMode=True)
+            report.enhance_report(NoRepo(self.log_folder))
+            self.assertEqual(compared, [])
+
+            # The comparisons of the results which disappeared get dropped
+            cache = ezbench.report.ComparisonsCache(os.path.join(self.log_folder,
+                                                                 ".comparisons_cache"))
+            self.assertEqual(len(cache.keys()), 2)
+            os.unlink(os.path.join(self.log_folder, "c1_bench_glxgears"))
+            for i in range(4):
+                os.unlink(os.path.join(self.log_folder, "c1_bench_glxgears#{}".format(i)))
+            report = Report(self.log_folder, silentMode=True)
+            report.enhance_report(NoRepo(self.log_folder))
+            cache = ezbench.report.ComparisonsCache(os.path.join(self.log_folder,
+                                                                 ".comparisons_cache"))
+            self.assertEqual([key[0] for key in cache.keys()], ["piglit[perf]"])
+        finally:
+            ezbench.report.SubTestResult.compare = compare
+
+    def test_changepoints(self):
+        # A single change of the mean, and no change
+        sets = [[60, 60.5, 59.5]] * 5 + [[50, 50.5, 49.5]] * 5
+        changes = ezbench.report.find_changepoints(sets)
+        self.assertEqual([i for i, confidence in changes], [5])
+        self.assertGreater(changes[0][1], 0.99)
+        self.assertEqual(ezbench.report.find_changepoints(sets[:5]), [])
+        self.assertEqual(ezbench.report.find_changepoints([[60]]), [])
+
+        factory = ReportFactory(os.path.join(tmp_folder, "report_changepoints"))
+        try:
+            for c, fps in enumerate([60, 60, 60, 45, 45, 45]):
+                for r in [-0.5, 0, 0.5]:
+                    factory.add_bench_run("c{}".format(c), "glxgears", [fps + r])
+
+            for detector in ["pairwise", "changepoints"]:
+                report = Report(factory.log_folder, silentMode=True)
+                report.enhance_report(NoRepo(factory.log_folder), detector=detector)
+
+                changes = [e for e in report.events if type(e) is EventPerfChange]
+                self.assertEqual(len(changes), 1)
+                self.assertIs(changes[0].commit_range.old, report.commits[2])
+                self.assertIs(changes[0].commit_range.new, report.commits[3])
+                self.assertAlmostEqual(changes[0].diff(), -0.25)
+        finally:
+            shutil.rmtree(factory.log_folder, ignore_errors=True)
+
+    def test_fdr(self):
+        # Benjamini-Hochberg keeps all the tests up to the largest rank k for
+        # which p(k) <= k / m * fdr, even if smaller ranks are above their own
+        # threshold
+        p_values = [0.04, 0.001, 0.5, 0.025, 0.028]
+        selected = ezbench.report.benjamini_hochberg(p_values, 0.05)
+        self.assertEqual(list(selected), [True, True, False, True, True])
+        self.assertEqual(list(ezbench.report.benjamini_hochberg(p_values, 0.001)),
+                         [False, False, False, False, False])
+        self.assertEqual(len(ezbench.report.benjamini_hochberg([], 0.05)), 0)
+
+        # A change which is significant alone does not survive the correction
+        # for the other comparisons, unlike a much bigger one
+        for fps in [64.5, 80]:
+            factory = ReportFactory(os.path.join(tmp_folder, "report_fdr"))
+            try:
+                for c in range(10):
+                    for r in [-1, 0, 1]:
+                        value = (fps if c >= 5 else 60) + r
+                        factory.add_bench_run("c{}".format(c), "glxgears", [value])
+
+                for fdr, count in [(0, 1), (0.01, 1 if fps == 80 else 0)]:
+                    report = Report(factory.log_folder, silentMode=True)
+                    report.enhance_report(NoRepo(factory.log_folder), fdr=fdr)
+                    changes = [e for e in report.events if type(e) is EventPerfChange]
+                    self.assertEqual(len(changes), count)
+            finally:
+                shutil.rmtree(factory.log_folder, ignore_errors=True)
+
+    def test_sample_store(self):
+        report = Report(self.log_folder, silentMode=True)
+
+        # The float and string subtests of the runs are kept in columns
+        run = report.commits[0].results["piglit"].runs[1]
+        self.assertEqual(run.results(), {"test1", "perf"})
+        self.assertEqual(run.results(ezbench.report.BenchSubTestType.SUBTEST_FLOAT), {"perf"})
+        self.assertEqual(run.result("test1").value, "pass")
+        self.assertEqual(list(run.result("perf").samples.data), [61.0])
+        self.assertEqual(run.result("perf").unit(), "ms")
+
+        # The samples of the runs and metrics all end up in the report's store
+        run = report.commits[1].results["glxgears"].runs[2]
+        self.assertEqual(list(run.result("").samples.data), [32, 28])
+        self.assertEqual(list(run.result("metric_power").timestamps), [0, 0.1, 0.2])
+        self.assertAlmostEqual(run.result("metric_power").exec_time(), 0.2)
+        self.assertEqual(len(report.samples), 6 * 12 + 6)
+
+    def test_lazy(self):
+        report = Report(self.log_folder, silentMode=True, use_cache=False, lazy=True)
+        self.assertEqual(self.parsed_runs, [])
+
+        # Counting the runs of benchmarks does not require loading them
+        c0 = report.commits[0]
+        self.assertEqual(c0.results["glxgears"].run_count(), 3)
+        self.assertEqual(self.parsed_runs, [])
+
+        # The runs get loaded when accessing their results
+        self.assertEqual(c0.results["piglit"].run_count("test1"), 3)
+        self.assertEqual(sorted(self.parsed_runs), ["c0_unified_piglit#{}".format(i) for i in range(3)])
+        self.check_report(report)
+
+    def test_metrics_parsing(self):
+        metric_file = os.path.join(self.log_folder, "metrics")
+
+        # Big files are parsed, the incomplete last line is ignored
+        with open(metric_file, "w") as f:
+            f.write("time (ms),power (W),fan (rpm),gpu freq (MHz)\n")
+            for i in range(100000):
+                f.write("{},{},1000,{}\n".format(i * 10, 10 + i % 3, 300 + i % 2))
+            f.write("1000000,1")
+        self.assertGreater(os.path.getsize(metric_file), 1e6)
+
+        records = ezbench.report.TestRun.parse_metrics_file(metric_file)
+        self.assertEqual([(r[1], r[2]) for r in records], [("power", "W"), ("gpu freq", "MHz")])
+        power = records[0]
+        self.assertEqual(len(power[3]), 100000)
+        self.assertAlmostEqual(power[3].mean(), 11, places=2)
+        self.assertAlmostEqual(power[4][-1], 999.99)
+
+        # Invalid lines stop the parsing
+        with open(metric_file, "w") as f:
+            f.write("time (s),power (W)\n0,10\n1,12\n2,invalid\n3,11\n")
+        records = ezbench.report.TestRun.parse_metrics_file(metric_file)
+        self.assertEqual(list(records[0][3]), [10, 12])
+        self.assertEqual(list(records[0][4]), [0, 1])
+
+        # A short line followed by a long one is invalid as well
+        with open(metric_file, "w") as f:
+            f.write("time (s),power (W)\n0,10\n1\n2,11,12\n3,11\n")
+        records = ezbench.report.TestRun.parse_metrics_file(metric_file)
+        self.assertEqual(list(records[0][3]), [10])
+
+    def test_metric_trace(self):
+        store = ezbench.report.SampleStore()
+        values = [float(i % 100) for i in range(100000)]
+        timestamps = [i / 1000 for i in range(100000)]
+        metric = ezbench.report.Metric("power", "W", values, timestamps, None, store)
+
+        # Short traces are returned as is
+        t, vmin, vmax, vmean = metric.trace(max_points=200000)
+        self.assertEqual(len(t), 100000)
+
+        # Longer ones use the downsampled resolutions
+        t, vmin, vmax, vmean = metric.trace()
+        self.assertEqual(len(t), 25)
+        self.assertEqual(t[1], 4.096)
+        self.assertEqual((vmin[0], vmax[0]), (0, 99))
+        self.assertAlmostEqual(vmean[0], (sum(values[:4096]) / 4096))
+        t, vmin, vmax, vmean = metric.trace(max_points=1000)
+        self.assertEqual(len(t), 391)
+        self.assertEqual(list(vmax[:2]), [99, 99])
+
+        # Metrics with few samples are not downsampled
+        metric = ezbench.report.Metric("power", "W", [1, 2], [0, 1], None, store)
+        self.assertEqual(list(metric.trace()[3]), [1, 2])
+
+    def test_per_commit_layout(self):
+        with open(os.path.join(self.log_folder, "c0.patch"), "w") as f:
+            f.write("commit c0_full_sha1\n")
+        Report(self.log_folder, silentMode=True)
+        moved = ezbench.report.migrate_to_per_commit_layout(self.log_folder)
+        self.assertEqual(moved, 2 * (1 + 3 * 3) + 1)
+        self.assertEqual(sorted([e.name for e in os.scandir(self.log_folder) if e.is_dir()]),
+                         ["c0", "c1"])
+        with open(os.path.join(self.log_folder, "layout")) as f:
+            self.assertEqual(f.read(), "per_commit\n")
+
+        self.parsed_runs = []
+        report = Report(self.log_folder, silentMode=True)
+        self.check_report(report)
+        self.assertEqual(len(self.parsed_runs), 12)
+        self.assertEqual(report.commits[0].patch, "c0/c0.patch")
+        self.assertEqual(report.commits[0].full_sha1, "c0_full_sha1")
+
+        # Only the folder of the wanted commit gets listed and parsed
+        self.parsed_runs = []
+        shutil.rmtree(os.path.join(self.log_folder, "c0"))
+        report = Report(self.log_folder, silentMode=True, restrict_to_commits=["c1"])
+        self.assertEqual([c.sha1 for c in report.commits], ["c1"])
+        self.assertEqual(self.parsed_runs, [])
+
+        # The journal only contains the name of the run files
+        run_file = self.factory.add_bench_run("c1", "glxgears", [31, 29])
+        self.assertTrue(report.refresh())
+        self.assertEqual(self.parsed_runs, ["c1/" + run_file])
+        self.assertEqual(len(report.commits[0].results["glxgears"].runs), 4)
+
+        # Versions are not cut at their first '_' or '.'
+        factory = ReportFactory(os.path.join(tmp_folder, "report_versions"))
+        try:
+            for version in ["mesa", "mesa_17.0", "mesa_17.0.1"]:
+                factory.add_bench_run(version, "glxgears", [60, 61])
+            factory.add_unified_run("mesa_17.0", "piglit", {"test1": "pass"})
+            TestRun = ezbench.report.TestRun
+            TestRun.parse_unified_run("mesa_17.0_unified_piglit#0", factory.log_folder,
+                                      sidecar=True)
+            self.assertEqual(ezbench.report.migrate_to_per_commit_layout(factory.log_folder),
+                             3 * 2 + 2)
+            self.assertEqual(sorted(os.listdir(os.path.join(factory.log_folder, "mesa_17.0"))),
+                             [".mesa_17.0_unified_piglit#0.records",
+                              "mesa_17.0_bench_glxgears", "mesa_17.0_bench_glxgears#0",
+                              "mesa_17.0_unified_piglit#0"])
+
+            report = Report(factory.log_folder, silentMode=True)
+            self.assertEqual(sorted([c.sha1 for c in report.commits]),
+                             ["mesa", "mesa_17.0", "mesa_17.0.1"])
+            for commit in report.commits:
+                self.assertEqual(len(commit.results["glxgears"].runs), 1)
+        finally:
+            shutil.rmtree(factory.log_folder, ignore_errors=True)
+
+    def test_shared_store(self):
+        store = SharedStore(os.path.join(tmp_folder, "shared_store"))
+        shutil.rmtree(store.path, ignore_errors=True)
+        with open(os.path.join(self.log_folder, "c0_bench_glxgears#0.env_dump"), "w") as f:
+            f.write("DATE,2017-01-01,10:00,UTC\nKERNEL,Linux,dut,4.10,#1,x86_64,(none)\n")
+        with open(os.path.join(self.log_folder, "c0.patch"), "w") as f:
+            f.write("commit c0_full_sha1\n")
+        for suffix in [".records", ".records.tmp"]:
+            with open(os.path.join(self.log_folder, "c0_bench_glxgears#0" + suffix), "w") as f:
+                f.write("derived from the run\n")
+
+        report = Report(self.log_folder, silentMode=True)
+        self.assertEqual(store.publish(report, "default", NoRepo(self.log_folder)), 12)
+        self.assertEqual(store.publish(report, "default", NoRepo(self.log_folder)), 0)
+
+        # The files derived from the runs by the report are not published
+        stored = [f for root, dirs, files in os.walk(store.path) for f in files]
+        self.assertEqual([f for f in stored if ".records" in f], [])
+
+        # Import the runs in a new report, the environment of the run with an
+        # env dump does not match the latest environment of the test
+        factory = ReportFactory(os.path.join(tmp_folder, "report_import"))
+        try:
+            factory.add_commit("c1")
+            new = Report(factory.log_folder, silentMode=True)
+            tasks = {"c0": {"tests": {"glxgears": {"rounds": 3}, "piglit[perf]": {"rounds": 1}}},
+                     "c1": {"tests": {"glxgears": {"rounds": 5}}}}
+
+            # Nothing gets imported while the runner holds the report lock
+            with open(os.path.join(factory.log_folder, "lock"), "w") as lock:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                self.assertEqual(store.import_runs(new, "default", NoRepo(factory.log_folder), [tasks]), 0)
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+            imported = store.import_runs(new, "default", NoRepo(factory.log_folder), [tasks])
+            self.assertEqual(imported, 2 + 1 + 3)
+
+            # Runs are only imported once
+            tasks_c1 = {"c1": {"tests": {"glxgears": {"rounds": 2}}}}
+            self.assertEqual(store.import_runs(new, "default", NoRepo(factory.log_folder), [tasks_c1]), 0)
+
+            new = Report(factory.log_folder, silentMode=True)
+            self.assertEqual([c.sha1 for c in new.commits], ["c1", "c0"])
+            self.assertEqual(len(new.commits[1].results["glxgears"].runs), 2)
+            self.assertEqual(new.commits[1].patch, "c0.patch")
+            self.assertAlmostEqual(new.commits[1].results["glxgears"].result().mean(), 60)
+            self.assertEqual(len(new.commits[1].results["piglit"].runs), 1)
+            self.assertEqual(len(new.commits[0].results["glxgears"].runs), 3)
+            self.assertAlmostEqual(new.commits[0].results["glxgears"].result("metric_power").mean(), 11)
+
+            # Other profiles do not share the results
+            shutil.rmtree(factory.log_folder)
+            factory = ReportFactory(os.path.join(tmp_folder, "report_import"))
+            factory.add_commit("c1")
+            new = Report(factory.log_folder, silentMode=True)
+            self.assertEqual(store.import_runs(new, "other", NoRepo(factory.log_folder), [tasks]), 0)
+        finally:
+            shutil.rmtree(factory.log_folder, ignore_errors=True)
+            shutil.rmtree(store.path, ignore_errors=True)
+
+    def test_journal(self):
+        journal_path = os.path.join(self.log_folder, "journal")
+        journal = ezbench.report.Journal(journal_path)
+        self.assertEqual(journal.tested_count("c0", "glxgears"), 3)
+        self.assertEqual(journal.deployed_count("c1"), 1)
+        self.assertEqual(journal.incomplete_tests(), [])
+
+        # A run that did not complete
+        self.factory.journal("test", "c1", "glxgears", "c1_bench_glxgears#3")
+        self.assertEqual(len(journal.update()), 1)
+        self.assertEqual([t["result_file"] for t in journal.incomplete_tests()],
+                         ["c1_bench_glxgears#3"])
+
+        # Only the entries added after the checkpoint get read
+        ezbench.report.Journal.checkpoint_interval = 0
+        try:
+            ezbench.report.Journal(journal_path)
+        finally:
+            ezbench.report.Journal.checkpoint_interval = 1000
+        self.factory.journal("deployed", "c1")
+        journal = ezbench.report.Journal(journal_path)
+        self.assertEqual(journal._offset, os.path.getsize(journal_path))
+        self.assertEqual(journal.deployed_count("c1"), 2)
+        self.assertEqual(len(journal.incomplete_tests()), 1)
+
+        # Fold all but the last 3 entries. The start of the last piglit run
+        # is kept as its completion did not get folded
+        completed = journal.completed_runs()
+        self.assertEqual(len(completed), 12)
+        self.assertTrue(journal.compact(keep_lines=3))
+        with open(journal_path) as f:
+            lines = f.readlines()
+        self.assertEqual(len(lines), 1 + 1 + 3)
+        self.assertIn(",compacted,", lines[0])
+        self.assertIn(",test,c1,piglit,c1_unified_piglit#2", lines[1])
+        self.assertIn(",test,c1,glxgears,c1_bench_glxgears#3", lines[3])
+
+        for j in [journal, ezbench.report.Journal(journal_path)]:
+            self.assertEqual(j.tested_count("c0", "glxgears"), 3)
+            self.assertEqual(j.deployed_count("c1"), 2)
+            self.assertEqual(j.completed_runs(), completed)
+            self.assertEqual(len(j.incomplete_tests()), 1)
+        self.assertFalse(journal.compact(keep_lines=3))
+
+        # The run completing after the compaction
+        self.factory.journal("tested", "c1", "glxgears", "c1_bench_glxgears#3")
+        self.assertEqual(len(journal.update()), 1)
+        self.assertEqual(journal.incomplete_tests(), [])
+        self.assertEqual(journal.tested_count("c1", "glxgears"), 4)
+
+        report = Report(self.log_folder, silentMode=True)
+        self.check_report(report)
+
+    def test_working_directory(self):
+        # Copies of the report, parsed without changing the working directory
+        folders = []
+        for i in range(2):
+            folders.append(os.path.join(tmp_folder, "report_copy{}".format(i)))
+            shutil.rmtree(folders[-1], ignore_errors=True)
+            shutil.copytree(self.log_folder, folders[-1])
+
+        cwd = os.getcwd()
+        try:
+            for folder in folders:
+                report = Report(folder, silentMode=True, use_cache=False)
+                self.assertEqual(os.getcwd(), cwd)
+                self.check_report(report)
+        finally:
+            for folder in folders:
+                shutil.rmtree(folder, ignore_errors=True)
+
+    def test_commits_metadata(self):
+        with open(os.path.join(self.log_folder, "c0.patch"), "w") as f:
+            f.write("commit c0_full_sha1\n"
+                    "Author:     John Doe <john@example.com>\n"
+                    "AuthorDate: Mon, 17 Jul 2017 10:00:00 +0000\n"
+                    "Commit:     Jane Doe <jane@example.com>\n"
+                    "CommitDate: Tue, 18 Jul 2017 10:00:00 +0000\n"
+                    "\n"
+                    "    driver: fix the performance\n"
+                    "\n"
+                    "    Bugzilla: https://bugs.freedesktop.org/show_bug.cgi?id=42\n"
+                    "    Reviewed-by: Jane Doe <jane@example.com>\n"
+                    "\n"
+                    "diff --git a/file b/file\n")
+
+        # A commit which failed to compile, with a long compilation log
+        self.factory.__write__("commit_list", "c2 Broken commit\n")
+        self.factory.__write__("c2_compile_log", "make: some output\n" * 1000 +
+                                                 "Exiting with error code 50\n")
+
+        report = Report(self.log_folder, silentMode=True)
+        commit = report.find_commit_by_id("c0")
+        self.assertEqual(commit.full_sha1, "c0_full_sha1")
+        self.assertEqual(commit.author, "John Doe <john@example.com>")
+        self.assertEqual(commit.commiter, "Jane Doe <jane@example.com>")
+        self.assertEqual(commit.commit_date - commit.author_date, timedelta(days=1))
+        self.assertEqual(commit.title, "driver: fix the performance")
+        self.assertEqual(commit.reviewed_by, {"Jane Doe <jane@example.com>"})
+        self.assertEqual(commit.bugs, {"https://bugs.freedesktop.org/show_bug.cgi?id=42"})
+        self.assertEqual(commit.patch, "c0.patch")
+        self.assertEqual(report.find_commit_by_id("c2").compil_exit_code,
+                         ezbench.report.RunnerErrorCode(50))
+
+        # The metadata now comes from the index, not from the patch
+        os.remove(os.path.join(self.log_folder, "c0.patch"))
+        report = Report(self.log_folder, silentMode=True)
+        commit = report.find_commit_by_id("c0")
+        self.assertEqual(commit.full_sha1, "c0_full_sha1")
+        self.assertEqual(commit.bugs, {"https://bugs.freedesktop.org/show_bug.cgi?id=42"})
+        self.assertEqual(commit.patch, None)
+        self.assertEqual(report.find_commit_by_id("c1").full_sha1, "c1")
+
+    def test_unified_parsing(self):
+        run_file = self.factory.add_unified_run("c0", "unified", {"perf": 1.5,
+                                                                 "status": "pass"})
+        self.factory.__write__(run_file, "list: float([1.0, 2, 3.5]) ms\n"
+                                         "weird (name): str(fail (crash))\n"
+                                         "invalid line\n"
+                                         "nounit: float(1.0)\n")
+
+        records = ezbench.report.TestRun.parse_unified_run(run_file, self.log_folder)
+        self.assertEqual([r[1] for r in records], ["perf", "status", "list"])
+        self.assertEqual(list(records[0][3]), [1.5])
+        self.assertEqual(records[1][2], "pass")
+        self.assertEqual((records[2][2], list(records[2][3])), ("ms", [1.0, 2.0, 3.5]))
+
+        # The sidecar is created hidden, then used instead of the run file
+        sidecar = os.path.join(self.log_folder, "." + run_file + ".records")
+        records = ezbench.report.TestRun.parse_unified_run(run_file, self.log_folder,
+                                                           sidecar=True)
+        self.assertTrue(os.path.exists(sidecar))
+        self.assertEqual([f for f in os.listdir(self.log_folder)
+                          if f.startswith(run_file) and f != run_file], [])
+        path = os.path.join(self.log_folder, run_file)
+        mtime = os.stat(path).st_mtime_ns
+        with open(path, "r+") as f:
+            content = f.read()
+            f.seek(0)
+            f.write(content.replace("1.5", "2.5"))
+        os.utime(path, ns=(0, mtime))
+        cached = ezbench.report.TestRun.parse_unified_run(run_file, self.log_folder,
+                                                          sidecar=True)
+        self.assertEqual(list(cached[0][3]), [1.5])
+
+        # Changing the run file invalidates the sidecar
+        os.utime(path, ns=(0, 1))
+        records = ezbench.report.TestRun.parse_unified_run(run_file, self.log_folder,
+                                                           sidecar=True)
+        self.assertEqual(list(records[0][3]), [2.5])
+
+        report = Report(self.log_folder, silentMode=True, use_cache=False, sidecars=True)
+        result = report.find_commit_by_id("c0").results["unified"]
+        self.assertEqual(list(result.runs[0].result("list").samples.data), [1.0, 2.0, 3.5])
+
+    def test_subresults_registry(self):
+        # The subresults of a report do not leak into the other reports
+        factory = ReportFactory(os.path.join(tmp_folder, "report_other"))
+        try:
+            factory.add_unified_run("c0", "piglit", {"other": "pass"})
+            report = Report(self.log_folder, silentMode=True, use_cache=False)
+            other = Report(factory.log_folder, silentMode=True, use_cache=False)
+
+            run = other.find_commit_by_id("c0").results["piglit"].runs[0]
+            self.assertEqual(run.results(), {"other"})
+            self.assertEqual(other.subresults["piglit"][0], {"other"})
+            self.assertEqual(report.subresults["piglit"][0], {"test1", "perf"})
+        finally:
+            shutil.rmtree(factory.log_folder, ignore_errors=True)
+
+    def test_concurrent_parsing(self):
+        # Reports with different subresults, parsed in threads
+        factories = []
+        for i in range(4):
+            factory = ReportFactory(os.path.join(tmp_folder, "report_thread{}".format(i)))
+            for run in range(3):
+                factory.add_unified_run("c0", "piglit", {"test{}".format(i): "pass"})
+            factories.append(factory)
+
+        cwd = os.getcwd()
+        try:
+            folders = [self.log_folder] + [f.log_folder for f in factories]
+            with ThreadPool(len(folders)) as pool:
+                reports = pool.map(lambda f: Report(f, silentMode=True, use_cache=False),
+                                   folders)
+            self.assertEqual(os.getcwd(), cwd)
+            self.check_report(reports[0])
+            for i, report in enumerate(reports[1:]):
+                self.assertEqual(report.subresults["piglit"][0], {"test{}".format(i)})
+        finally:
+            for factory in factories:
+                shutil.rmtree(factory.log_folder, ignore_errors=True)
+
+    def test_stats_quantiles(self):
+        sets = [[59.0, 61.0, 60.5], [10.0, 12.0, 9.5, 11.0, 10.5, 13.0, 8.0],
+                [float(i % 17) for i in range(40)], [float(i % 13) for i in range(1500)]]
+        for s in sets:
+            liststat = ezbench.report.ListStats(s)
+            liststat.margin()
+            mean, var, std = stats.bayes_mvs(s, alpha=0.95)
+            self.assertAlmostEqual(liststat._cache_mean[0], mean[0])
+            for a, b in zip(liststat._cache_mean[1], mean[1]):
+                self.assertAlmostEqual(a, b)
+            self.assertAlmostEqual(liststat._cache_std[0], std[0])
+            for a, b in zip(liststat._cache_std[1], std[1]):
+                self.assertAlmostEqual(a, b)
+
+            # The margin can be computed for any confidence level
+            for confidence in [0.8, 0.95, 0.999]:
+                mean, var, std = stats.bayes_mvs(s, alpha=confidence)
+                margin, n = liststat.confidence_margin(None, confidence)
+                self.assertAlmostEqual(margin, (mean[1][1] - mean[1][0]) / 2 / mean[0],
+                                       places=3)
+
+        # The estimated number of samples is the smallest that reaches the margin
+        liststat = ezbench.report.ListStats(sets[1])
+        margin, n = liststat.confidence_margin(0.02, 0.99)
+        sigma = np.std(sets[1], ddof=1)
+        target = np.mean(sets[1]) * 0.02
+        self.assertLessEqual(stats.t.ppf(0.995, n - 1) * sigma / math.sqrt(n), target)
+        self.assertGreater(stats.t.ppf(0.995, n - 2) * sigma / math.sqrt(n - 1), target)
+
+        # Small numbers of samples, where Student's t quantile varies the most
+        for sigma, margin, expected in [(0.0125, 0.025, 4), (0.02, 0.025, 5),
+                                        (0.03, 0.025, 9)]:
+            self.assertEqual(ezbench.report.samples_needed(sigma, margin), expected)
+        for ratio in np.arange(0.5, 1.55, 0.05):
+            n = ezbench.report.samples_needed(ratio * 0.025, 0.025)
+            self.assertLessEqual(stats.t.ppf(0.975, n - 1) * ratio / math.sqrt(n), 1)
+            if n > 2:
+                self.assertGreater(stats.t.ppf(0.975, n - 2) * ratio / math.sqrt(n - 1), 1)
+
+        # The estimate never stops before reaching the margin
+        margin, n = ezbench.report.ListStats([60, 61]).confidence_margin(0.025)
+        self.assertGreater(margin, 0.025)
+        self.assertGreater(n, 2)
+        sigma = np.std([60, 61], ddof=1)
+        self.assertLessEqual(stats.t.ppf(0.975, n - 1) * sigma / math.sqrt(n), 60.5 * 0.025)
+
+        # Results with a negative or null mean are not considered converged
+        margin, n = ezbench.report.ListStats([-60, -61]).confidence_margin(0.025)
+        self.assertAlmostEqual(margin, ezbench.report.ListStats([60, 61]).confidence_margin()[0])
+        self.assertEqual(ezbench.report.ListStats([-1, 1]).confidence_margin()[0], math.inf)
+
+    def test_variance_characterization(self):
+        # Cold first runs are detected as warm-up runs
+        values = [80.0, 70.0] + [60.0 + (i % 3) * 0.5 for i in range(20)]
+        self.assertEqual(ezbench.report.warmup_run_count(values), 2)
+        self.assertEqual(ezbench.report.warmup_run_count(values[2:]), 0)
+        self.assertEqual(ezbench.report.warmup_run_count([80.0, 60.0]), 0)
+
+        # The warm-up is decided as for the cold runs of the reports
+        for first in [60.5, 62.0, 64.0, 70.0]:
+            runs = [first] + values[2:]
+            self.assertEqual(ezbench.report.warmup_run_count(runs),
+                             int(ezbench.report.is_warmup_outlier(first, values[2:])))
+
+        # The number of samples is the smallest reaching the margin
+        n = ezbench.report.samples_needed(0.05, 0.01)
+        self.assertLessEqual(stats.t.ppf(0.975, n - 1) * 0.05 / math.sqrt(n), 0.01)
+        self.assertGreater(stats.t.ppf(0.975, n - 2) * 0.05 / math.sqrt(n - 1), 0.01)
+        self.assertEqual(ezbench.report.samples_needed(0.001, 0.01), 2)
+
+    def test_warmup_runs(self):
+        # The first run after the deployment is slower than the others
+        for fps in [40, 60, 61, 59, 60.5]:
+            self.factory.add_bench_run("c2", "glxgears", [fps])
+
+        # An unmeasured warm-up round was made before the first run
+        self.factory.add_commit("c3")
+        self.factory.journal("warmup", "c3", "glxgears")
+        for fps in [40, 60, 61, 59, 60.5]:
+            self.factory.add_bench_run("c3", "glxgears", [fps])
+
+        # The runs made after a new deployment of the same version are cold
+        for fps in [60, 61, 59, 60.5]:
+            self.factory.add_bench_run("c4", "glxgears", [fps])
+        self.factory.journal("deployed", "c4")
+        self.factory.add_bench_run("c4", "glxgears", [45])
+
+        report = Report(self.log_folder, silentMode=True, use_cache=False)
+        result = report.find_commit_by_id("c2").results["glxgears"].result()
+        self.assertEqual(result.to_list(), [60, 61, 59, 60.5])
+        self.assertEqual([value for run, value in result.warmup_results], [40])
+        self.assertEqual(len(result.test_result.runs), 5)
+
+        result = report.find_commit_by_id("c3").results["glxgears"].result()
+        self.assertEqual(result.to_list(), [40, 60, 61, 59, 60.5])
+        self.assertEqual(result.warmup_results, [])
+
+        result = report.find_commit_by_id("c4").results["glxgears"].result()
+        self.assertEqual(result.to_list(), [60, 61, 59, 60.5])
+        self.assertEqual([value for run, value in result.warmup_results], [45])
+
+        # Warm runs are never discarded, even when they are outliers
+        result = report.find_commit_by_id("c0").results["glxgears"].result()
+        self.assertEqual(len(result), 3)
+
+        # Tiny differences with very stable runs do not make warm-up runs
+        self.assertFalse(ezbench.report.is_warmup_outlier(60.1, [60.0, 60.0, 60.0]))
+        self.assertTrue(ezbench.report.is_warmup_outlier(50.0, [60.0, 60.0, 60.0]))
+        self.assertEqual(ezbench.report.warmup_run_count([60.1] + [60.0] * 7), 0)
+
+    def test_stats_batch(self):
+        sets = [[], [5.0], [3.0, 4.0], [2.0, 2.0, 2.0], [59.0, 61.0, 60.5],
+                [10.0, 12.0, 9.5, 11.0, 10.5, 13.0, 8.0],
+                [float(i % 13) for i in range(1500)]]
+        batch = [ezbench.report.ListStats(s) for s in sets]
+        ezbench.report.ListStats.compute_stats_batch(batch)
+        for s, stats in zip(sets, batch):
+            reference = ezbench.report.ListStats(s)
+            self.assertAlmostEqual(stats.mean(), reference.mean())
+            self.assertAlmostEqual(stats.margin(), reference.margin())
+            self.assertEqual(stats.confidence_margin(0.01), reference.confidence_margin(0.01))
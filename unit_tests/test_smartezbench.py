@@ -0,0 +1,209 @@
+"""
+Copyright (c) 2017, Intel Corporation
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+    * Redistributions of source code must retain the above copyright notice,
+      this list of conditions and the following disclaimer.
+    * Redistributions in binary form must reproduce the above copyright
+      notice, this list of conditions and the following disclaimer in the
+      documentation and/or other materials provided with the distribution.
+    * Neither the name of Intel Corporation nor the names of its contributors
+      may be used to endorse or promote products derived from this software
+      without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE
+FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+
+import statistics
+import unittest
+import shutil
+import json
+import os
+
+from utils import tmp_folder
+from ezbench.smartezbench import SmartEzbench
+from ezbench.report import samples_needed
+import ezbench.smartezbench
+import ezbench.testset
+import ezbench.report
+
+class MockupRunner:
+    # Writes the runs in the report instead of executing the tests. The values
+    # of the runs of every test are taken in order from $values
+    def __init__(self, log_folder, values):
+        self.log_folder = log_folder
+        self.values = values
+        self.runs = dict()
+        self.journal_time = 1500000000
+
+    def __write__(self, filename, data):
+        with open(os.path.join(self.log_folder, filename), "a") as f:
+            f.write(data)
+
+    def journal(self, op, *fields):
+        self.journal_time += 1
+        line = ",".join([str(self.journal_time), op] + list(fields))
+        self.__write__("journal", line + "\n")
+
+    def repo_info(self):
+        return {"deployed_version": None, "path": "", "type": ""}
+
+    def list_cached_versions(self):
+        return []
+
+    def start_testing(self):
+        pass
+
+    def done(self):
+        pass
+
+    def run(self, commit, test, dry_run):
+        if len(self.runs) == 0:
+            self.__write__("commit_list", "{} Commit title\n".format(commit))
+            self.journal("deploy", commit)
+            self.journal("deployed", commit)
+
+        run = self.runs.get(test, 0)
+        self.runs[test] = run + 1
+        value = self.values[test][run % len(self.values[test])]
+
+        test_file = "{}_bench_{}".format(commit, test)
+        if run == 0:
+            header = "# FPS (more is better) of '{}' using version {}\n"
+            self.__write__(test_file, header.format(test, commit))
+        run_file = "{}#{}".format(test_file, run)
+
+        self.journal("test", commit, test, run_file)
+        self.__write__(run_file, "{}\n".format(value))
+        self.journal("tested", commit, test, run_file)
+        self.__write__(test_file, "{}\n".format(value))
+
+        return 1, ""
+
+class MockupSmartEzbench(SmartEzbench):
+    def __init__(self, ezbench_dir, report_name, runner):
+        self.runner = runner
+        super().__init__(ezbench_dir, report_name)
+
+    def _SmartEzbench__create_ezbench(self, ezbench_path = None, profile = None):
+        return self.runner
+
+class SmartEzbenchScheduling(unittest.TestCase):
+    def setUp(self):
+        self.ezbench_dir = os.path.join(tmp_folder, "smartezbench")
+        shutil.rmtree(self.ezbench_dir, ignore_errors=True)
+        os.makedirs(os.path.join(self.ezbench_dir, "timing_DB"))
+
+        self.log_folder = os.path.join(self.ezbench_dir, "logs", "report")
+        self.runner = MockupRunner(self.log_folder, {"stable": [60, 60.1, 59.9],
+                                                     "noisy": [60, 40, 70, 50]})
+        self.sbench = MockupSmartEzbench(self.ezbench_dir, "report", self.runner)
+        self.sbench.set_profile("profile")
+        self.assertEqual(self.sbench.attribute("shared_store"), 0)
+
+    def tearDown(self):
+        shutil.rmtree(self.ezbench_dir, ignore_errors=True)
+
+    def test_sequential(self):
+        self.sbench.set_attribute("variance_sequential", 1)
+        self.sbench.set_attribute("variance_max_run_count", 8)
+        self.sbench.add_test("c0", "stable", 3)
+        self.sbench.add_test("c0", "noisy", 3)
+        self.sbench.run()
+
+        # The stable test stops as soon as its margin is low enough, while the
+        # noisy one keeps running until the maximum number of runs
+        self.assertEqual(self.runner.runs, {"stable": 2, "noisy": 8})
+        tests = self.sbench.state['tasks']['user']['commits']["c0"]["tests"]
+        self.assertEqual(tests["stable"]["rounds"], 2)
+
+    def test_compact_journal(self):
+        self.sbench.add_test("c0", "stable", 3)
+        self.sbench.run()
+
+        # Scheduling only reads the journal
+        journal = os.path.join(self.log_folder, "journal")
+        with open(journal) as f:
+            lines = f.readlines()
+        self.assertFalse(self.sbench.run())
+        with open(journal) as f:
+            self.assertEqual(f.readlines(), lines)
+
+        # Compaction happens on request
+        self.assertTrue(self.sbench.compact_journal(keep_lines=3))
+        with open(journal) as f:
+            self.assertLess(len(f.readlines()), len(lines))
+        self.assertEqual(len(ezbench.report.Journal(journal).completed_runs()), 3)
+
+    def test_characterization(self):
+        self.sbench.characterize_test("c0", "noisy", 12)
+        self.assertEqual(self.sbench.state['tasks']['characterize'], {"c0": {"noisy": 12}})
+        self.sbench.run()
+
+        # All the runs are made, and the characterization gets stored
+        self.assertEqual(self.runner.runs, {"noisy": 12})
+        self.assertEqual(self.sbench.state['tasks']['characterize'], dict())
+        db = ezbench.smartezbench.TimingsDB(os.path.join(self.ezbench_dir, "timing_DB"))
+        variance = db.variance("profile", "noisy")
+        self.assertEqual(variance["samples"], 12)
+        values = [60, 40, 70, 50] * 3
+        self.assertAlmostEqual(variance["cv"], statistics.stdev(values) / statistics.mean(values))
+
+    def test_predicted_rounds(self):
+        db = ezbench.smartezbench.TimingsDB(os.path.join(self.ezbench_dir, "timing_DB"))
+        db.set_variance("profile", "noisy", 0.05, 1, 100)
+        db.set_variance("profile", "stable", 0.001, 0, 100)
+
+        # The warm-up runs come on top of the samples needed, within the
+        # limits on the number of runs
+        self.assertEqual(self.sbench.predicted_rounds("noisy"), 1 + samples_needed(0.05, 0.025))
+        self.assertEqual(self.sbench.predicted_rounds("stable"), 2)
+        self.assertEqual(self.sbench.predicted_rounds("other", 5), 5)
+        self.sbench.set_attribute("variance_max_run_count", 10)
+        self.assertEqual(self.sbench.predicted_rounds("noisy"), 10)
+
+        # Testsets read the timings database once for all their tests
+        loads = []
+        TimingsDB = ezbench.smartezbench.TimingsDB
+        def counting_timings_db(base_folder):
+            loads.append(base_folder)
+            return TimingsDB(base_folder)
+        ezbench.smartezbench.TimingsDB = counting_timings_db
+        try:
+            testset = ezbench.testset.Testset(None, "testset")
+            testset.update({"noisy": 1, "stable": 1, "other": 4})
+            self.sbench.add_testset("c0", testset)
+        finally:
+            ezbench.smartezbench.TimingsDB = TimingsDB
+        self.assertEqual(len(loads), 1)
+
+        tests = self.sbench.state['tasks']['user']['commits']["c0"]["tests"]
+        self.assertEqual({t: tests[t]["rounds"] for t in tests},
+                         {"noisy": 10, "stable": 2, "other": 4})
+
+    def test_state_upgrade(self):
+        # Reports created before the characterization of tests get upgraded
+        state_file = os.path.join(self.log_folder, "smartezbench.state")
+        with open(state_file) as f:
+            state = json.load(f)
+        state["version"] = 4
+        del state["tasks"]["characterize"]
+        with open(state_file, "w") as f:
+            json.dump(state, f)
+
+        sbench = MockupSmartEzbench(self.ezbench_dir, "report", self.runner)
+        self.assertEqual(sbench.state["version"], 5)
+        self.assertEqual(sbench.state["tasks"]["characterize"], dict())
+        with open(state_file) as f:
+            self.assertEqual(json.load(f)["version"], 5)
@@ -66,11 +66,12 @@ f = open(commits_path, 'w')
 # Move to the repo's list
 os.chdir(args.path)
 
+dates = dict()
 for commit in report.commits:
     gitCommandLine = ["/usr/bin/git", "show", "--format=%ct", "--date=local", "-s", commit.sha1]
-    commit.date = subprocess.check_output(gitCommandLine).decode().split(' ')[0]
+    dates[commit.sha1] = subprocess.check_output(gitCommandLine).decode().split(' ')[0]
 
-commits = sorted(report.commits, key=lambda commit: commit.date)
+commits = sorted(report.commits, key=lambda commit: dates[commit.sha1])
 
 for commit in commits:
     val = "{full_name}\n".format(full_name=commit.full_name)